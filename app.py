@@ -1,15 +1,46 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import os
 import re
+import threading
+import uuid
 import mysql.connector
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
+from pymongo.errors import BulkWriteError, ExecutionTimeout, PyMongoError
+from bson import Decimal128, ObjectId
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 import json
 import random
+import time
 from flask_cors import CORS
 
+try:
+    import orjson
+except ImportError:  # Optional; responses fall back to the json module
+    orjson = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional; needed only for Arrow/Parquet export and Parquet uploads
+    pa = pq = None
+try:
+    import zstandard
+except ImportError:  # Optional; needed only for .zst uploads
+    zstandard = None
+
 
 app = Flask(__name__)
 CORS(app) 
@@ -17,316 +48,4627 @@ CORS(app)
 # Configure file upload settings
 DB_TYPE=0
 UPLOAD_FOLDER = 'uploads/'
-ALLOWED_EXTENSIONS = {'csv', 'json'}
+ALLOWED_EXTENSIONS = {'csv', 'json', 'ndjson', 'parquet'}
+# Compression suffixes accepted after csv/json/ndjson, e.g. students.csv.gz
+COMPRESSED_EXTENSIONS = {'gz': 'gzip', 'zst': 'zstd'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Function to check allowed file extensions
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Bulk CSV loading settings
+# Rows sent per executemany() call; each batch is committed on its own
+CSV_BATCH_SIZE = 5000
+# Use LOAD DATA LOCAL INFILE by default (the server must have local_infile enabled)
+CSV_USE_LOAD_DATA = False
+# Rows parsed per pandas chunk when streaming a CSV upload (0 reads the whole file at once)
+CSV_CHUNK_SIZE = 50000
+app.config['CSV_BATCH_SIZE'] = CSV_BATCH_SIZE
+app.config['CSV_CHUNK_SIZE'] = CSV_CHUNK_SIZE
+app.config['CSV_USE_LOAD_DATA'] = CSV_USE_LOAD_DATA
+# Add a primary key and indexes on ID-like columns once a table is loaded
+CSV_AUTO_INDEX = True
+app.config['CSV_AUTO_INDEX'] = CSV_AUTO_INDEX
+
+# Streaming JSON/NDJSON loading settings
+# Documents sent per unordered insert_many() call
+MONGO_BATCH_SIZE = 1000
+# Characters read from the file per parser refill
+JSON_READ_SIZE = 1 << 16
+# Largest document the parser buffers, in characters (twice MongoDB's 16 MB
+# document limit, for JSON's longer spelling); malformed input fails here
+# instead of being buffered to the end of the file
+JSON_MAX_DOCUMENT_SIZE = 32 << 20
+app.config['MONGO_BATCH_SIZE'] = MONGO_BATCH_SIZE
+app.config['JSON_READ_SIZE'] = JSON_READ_SIZE
+app.config['JSON_MAX_DOCUMENT_SIZE'] = JSON_MAX_DOCUMENT_SIZE
+
+# Load stats of running and finished uploads, keyed by (db_type, table/collection name)
+UPLOAD_PROGRESS = {}
+
+# Background upload job settings
+# Loads run concurrently on this many worker threads; each holds one pooled connection
+UPLOAD_WORKERS = 4
+# Finished jobs kept for status polling before the oldest are dropped
+UPLOAD_JOB_HISTORY = 200
+# Run uploads as background jobs by default (send async=false to load inline)
+UPLOAD_ASYNC = True
+app.config['UPLOAD_WORKERS'] = UPLOAD_WORKERS
+app.config['UPLOAD_JOB_HISTORY'] = UPLOAD_JOB_HISTORY
+app.config['UPLOAD_ASYNC'] = UPLOAD_ASYNC
+
+MYSQL_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 3306,
+    "user": "root",
+    "password": "Dsci-551",
+    "database": "chatdb",
+    "auth_plugin": "mysql_native_password"
+}
+MONGO_URI = "mongodb://localhost:27017/"
+MONGO_DB_NAME = "chatdb"
+
+# Connection pool settings (read when the pools are first used)
+# Maximum number of open MySQL connections per process
+MYSQL_POOL_SIZE = 10
+# Seconds a request waits for a free MySQL connection before failing
+MYSQL_POOL_TIMEOUT = 5.0
+# Idle MySQL connections older than this many seconds are pinged before reuse
+MYSQL_POOL_HEALTH_CHECK_INTERVAL = 30.0
+# Maximum number of connections in the shared MongoClient pool
+MONGO_MAX_POOL_SIZE = 50
+# Milliseconds a request waits for a free MongoDB connection before failing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = 5000
+app.config['MYSQL_POOL_SIZE'] = MYSQL_POOL_SIZE
+app.config['MYSQL_POOL_TIMEOUT'] = MYSQL_POOL_TIMEOUT
+app.config['MYSQL_POOL_HEALTH_CHECK_INTERVAL'] = MYSQL_POOL_HEALTH_CHECK_INTERVAL
+app.config['MONGO_MAX_POOL_SIZE'] = MONGO_MAX_POOL_SIZE
+app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+
+# Schema cache settings for /api/explore
+# Seconds a cached schema stays valid; uploads invalidate their table right away
+SCHEMA_CACHE_TTL = 300
+# Threads used to fetch sample rows of different tables concurrently
+EXPLORE_SAMPLE_WORKERS = 8
+# Sample rows/documents returned per table or collection
+EXPLORE_SAMPLE_SIZE = 5
+app.config['SCHEMA_CACHE_TTL'] = SCHEMA_CACHE_TTL
+app.config['EXPLORE_SAMPLE_SIZE'] = EXPLORE_SAMPLE_SIZE
+
+# MongoDB schema inference settings
+# Documents pulled with $sample when a collection has no stored profile
+MONGO_SCHEMA_SAMPLE_SIZE = 1000
+# Hashes kept per field by the distinct-value sketch (larger is more accurate)
+MONGO_SCHEMA_SKETCH_SIZE = 256
+app.config['MONGO_SCHEMA_SAMPLE_SIZE'] = MONGO_SCHEMA_SAMPLE_SIZE
+
+# Chat catalog settings
+# Seconds before the chat catalog is refreshed in the background
+CATALOG_REFRESH_INTERVAL = 300
+# Rows per table sampled to measure column cardinality
+CATALOG_SAMPLE_ROWS = 1000
+app.config['CATALOG_REFRESH_INTERVAL'] = CATALOG_REFRESH_INTERVAL
+app.config['CATALOG_SAMPLE_ROWS'] = CATALOG_SAMPLE_ROWS
+
+# Streaming/paged query result settings for /api/execute_query
+# Rows fetched from the server per round trip while streaming or paging
+RESULT_FETCH_SIZE = 1000
+# Hard caps for one streamed result or one pagination cursor
+RESULT_MAX_ROWS = 1000000
+RESULT_MAX_BYTES = 256 * 1024 * 1024
+# Seconds an unused pagination cursor is kept open
+CURSOR_IDLE_TIMEOUT = 60
+# Open pagination cursors per process (each MySQL cursor holds a pooled connection)
+MAX_OPEN_CURSORS = 4
+app.config['RESULT_FETCH_SIZE'] = RESULT_FETCH_SIZE
+app.config['RESULT_MAX_ROWS'] = RESULT_MAX_ROWS
+app.config['RESULT_MAX_BYTES'] = RESULT_MAX_BYTES
+app.config['CURSOR_IDLE_TIMEOUT'] = CURSOR_IDLE_TIMEOUT
+app.config['MAX_OPEN_CURSORS'] = MAX_OPEN_CURSORS
+
+# Execution budget and admission control for /api/execute_query
+# Milliseconds a query may run (requests can ask for less with timeout_ms; 0 = no limit)
+QUERY_TIMEOUT_MS = 30000
+# Queries run at once per engine; more wait in a queue
+QUERY_CONCURRENCY = {'mysql': 8, 'mongodb': 16}
+# Queries that may wait per engine; past that requests get 429 at once
+QUERY_QUEUE_SIZE = 32
+# Seconds a query may wait in the queue before it gets 429
+QUERY_QUEUE_TIMEOUT = 2.0
+app.config['QUERY_TIMEOUT_MS'] = QUERY_TIMEOUT_MS
+app.config['QUERY_CONCURRENCY'] = QUERY_CONCURRENCY
+app.config['QUERY_QUEUE_SIZE'] = QUERY_QUEUE_SIZE
+app.config['QUERY_QUEUE_TIMEOUT'] = QUERY_QUEUE_TIMEOUT
+
+# Fan-out settings for query batches and /api/explore across both engines
+# Threads running batch items (or engine explores) at once
+FANOUT_WORKERS = 8
+# Queries accepted in one batch
+FANOUT_MAX_ITEMS = 50
+app.config['FANOUT_MAX_ITEMS'] = FANOUT_MAX_ITEMS
+
+# JSON encoder for API responses: 'orjson' (the json module when orjson is not installed) or 'json'
+RESULT_SERIALIZER = 'orjson'
+app.config['RESULT_SERIALIZER'] = RESULT_SERIALIZER
+# Rows per Arrow record batch / Parquet row group when exporting results
+EXPORT_BATCH_ROWS = 65536
+app.config['EXPORT_BATCH_ROWS'] = EXPORT_BATCH_ROWS
+# Rewrite structured MongoDB queries into a cheaper stage order before running them
+MONGO_PIPELINE_OPTIMIZER = True
+app.config['MONGO_PIPELINE_OPTIMIZER'] = MONGO_PIPELINE_OPTIMIZER
+
+# Slow query log for SQL sent to /api/execute_query (off unless enabled)
+SLOW_QUERY_LOG_ENABLED = False
+# Queries taking at least this long are recorded and explained
+SLOW_QUERY_THRESHOLD_MS = 500
+# Distinct query shapes kept, least recently seen evicted first
+SLOW_QUERY_LOG_SIZE = 200
+# Seconds before a recorded query shape is explained again
+SLOW_QUERY_EXPLAIN_INTERVAL = 300
+app.config['SLOW_QUERY_LOG_ENABLED'] = SLOW_QUERY_LOG_ENABLED
+app.config['SLOW_QUERY_THRESHOLD_MS'] = SLOW_QUERY_THRESHOLD_MS
+app.config['SLOW_QUERY_LOG_SIZE'] = SLOW_QUERY_LOG_SIZE
+app.config['SLOW_QUERY_EXPLAIN_INTERVAL'] = SLOW_QUERY_EXPLAIN_INTERVAL
+
+# Chat translation cache settings
+# Translated messages kept, least recently used evicted first
+TRANSLATION_CACHE_SIZE = 4096
+app.config['TRANSLATION_CACHE_SIZE'] = TRANSLATION_CACHE_SIZE
+
+# Query result cache settings for /api/execute_query
+# Memory budget for cached responses (LRU entries are evicted past it)
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Larger responses are not cached at all
+QUERY_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+# Seconds a cached response stays valid
+QUERY_CACHE_TTL = 60
+app.config['QUERY_CACHE_MAX_BYTES'] = QUERY_CACHE_MAX_BYTES
+app.config['QUERY_CACHE_MAX_ENTRY_BYTES'] = QUERY_CACHE_MAX_ENTRY_BYTES
+app.config['QUERY_CACHE_TTL'] = QUERY_CACHE_TTL
+
+# Request metrics settings
+# Record per-request and per-stage timings for /api/metrics
+METRICS_ENABLED = True
+# Upper bounds (seconds) of the latency histogram buckets
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+app.config['METRICS_ENABLED'] = METRICS_ENABLED
+
+# Split an upload name into (dataset name, format, compression),
+# e.g. orders.ndjson.gz -> ('orders', 'ndjson', 'gzip')
+def parse_upload_name(filename):
+    parts = filename.rsplit('.', 2)
+    compression = None
+    if len(parts) == 3 and parts[2].lower() in COMPRESSED_EXTENSIONS:
+        compression = COMPRESSED_EXTENSIONS[parts[2].lower()]
+        filename = f"{parts[0]}.{parts[1]}"
+    if '.' not in filename:
+        return filename, None, compression
+    name, extension = filename.rsplit('.', 1)
+    return name, extension.lower(), compression
+
+
+# Function to check allowed file extensions
+def allowed_file(filename):
+    _, extension, compression = parse_upload_name(filename)
+    # Parquet compresses its own column chunks
+    return extension in ALLOWED_EXTENSIONS and not (extension == 'parquet' and compression)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+# Connection handed out by MySQLConnectionPool; close() returns it to the pool
+class PooledConnection:
+    def __init__(self, pool, conn, wait_seconds):
+        self._pool = pool
+        self._conn = conn
+        self.wait_seconds = wait_seconds
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    # Drop the connection instead of returning it, e.g. when an unbuffered
+    # result was abandoned and the remaining rows should not be read
+    def discard(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn, discard=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget to close the connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+# Process-wide MySQL connection pool with a checkout timeout,
+# health checks for idle connections and usage counters
+class MySQLConnectionPool:
+    def __init__(self, size, timeout, health_check_interval, connect_options):
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.connect_options = connect_options
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.counters = {
+            'created': 0,
+            'checkouts': 0,
+            'in_use': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'discarded': 0
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get_connection(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            self._count('waits')
+            if not self._slots.acquire(timeout=self.timeout):
+                self._count('timeouts')
+                raise PoolTimeoutError(f"No MySQL connection available within {self.timeout}s "
+                                       f"(pool size {self.size})")
+        wait_seconds = time.perf_counter() - started
+        try:
+            conn = self._checkout_idle() or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.counters['checkouts'] += 1
+            self.counters['in_use'] += 1
+            self.counters['wait_seconds_total'] += wait_seconds
+        return PooledConnection(self, conn, wait_seconds)
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.connect_options)
+        self._count('created')
+        return conn
+
+    def _checkout_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.health_check_interval:
+                return conn
+            if self._is_healthy(conn):
+                return conn
+            self._count('health_check_failures')
+            self._discard(conn)
+
+    def _is_healthy(self, conn):
+        self._count('health_checks')
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _discard(self, conn):
+        self._count('discarded')
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def release(self, conn, discard=False):
+        try:
+            if discard:
+                raise mysql.connector.InterfaceError("connection discarded")
+            # End any open transaction so the next user starts with a fresh snapshot
+            if conn.in_transaction:
+                conn.rollback()
+        except mysql.connector.Error:
+            self._discard(conn)
+        else:
+            with self._lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self.counters['in_use'] -= 1
+            self._slots.release()
+
+    def check_health(self):
+        conn = self.get_connection()
+        try:
+            return self._is_healthy(conn._conn)
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['idle'] = len(self._idle)
+        stats['size'] = self.size
+        stats['wait_seconds_total'] = round(stats['wait_seconds_total'], 6)
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), collections.deque()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+# Counts events of the shared MongoClient's connection pool
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'checkout_failures': 0,
+            'in_use': 0,
+            'wait_seconds_total': 0.0,
+            'pool_clears': 0
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count('pool_clears')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count('created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count('closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count('checkout_failures')
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.counters['checkouts'] += 1
+            self.counters['in_use'] += 1
+            self.counters['wait_seconds_total'] += getattr(event, 'duration', None) or 0.0
+
+    def connection_checked_in(self, event):
+        self._count('in_use', -1)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['wait_seconds_total'] = round(stats['wait_seconds_total'], 6)
+        return stats
+
+
+mysql_pool = None
+mongo_client = None
+mongo_pool_listener = MongoPoolListener()
+_pool_lock = threading.Lock()
+
+
+def get_mysql_pool():
+    global mysql_pool
+    if mysql_pool is None:
+        with _pool_lock:
+            if mysql_pool is None:
+                mysql_pool = MySQLConnectionPool(
+                    app.config['MYSQL_POOL_SIZE'],
+                    app.config['MYSQL_POOL_TIMEOUT'],
+                    app.config['MYSQL_POOL_HEALTH_CHECK_INTERVAL'],
+                    MYSQL_CONFIG
+                )
+    return mysql_pool
+
+
+def get_mongo_client():
+    global mongo_client
+    if mongo_client is None:
+        with _pool_lock:
+            if mongo_client is None:
+                mongo_client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=app.config['MONGO_MAX_POOL_SIZE'],
+                    waitQueueTimeoutMS=app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+                    event_listeners=[mongo_pool_listener]
+                )
+    return mongo_client
+
+
+# MySQL connection function
+# Returns a pooled connection; close() hands it back to the pool.
+# Extra keyword arguments override MYSQL_CONFIG (e.g. allow_local_infile=True)
+# and open a dedicated connection outside the pool.
+def get_db_connection(**options):
+    if options:
+        with stage_timer('mysql_connect'):
+            return mysql.connector.connect(**{**MYSQL_CONFIG, **options})
+    conn = get_mysql_pool().get_connection()
+    metrics.observe('chatdb_stage_duration_seconds', conn.wait_seconds, stage='mysql_pool_wait')
+    return conn
+
+
+# MongoDB connection function
+# All callers share one MongoClient and its connection pool
+def get_mongo_connection():
+    db = get_mongo_client()[MONGO_DB_NAME]
+    return db
+
+
+def pool_stats():
+    return {
+        'mysql': get_mysql_pool().stats(),
+        'mongodb': mongo_pool_listener.stats()
+    }
+
+
+@atexit.register
+def close_connection_pools():
+    if mysql_pool is not None:
+        mysql_pool.close()
+    if mongo_client is not None:
+        mongo_client.close()
+
+
+# Requests that could not get a pooled connection in time
+@app.errorhandler(PoolTimeoutError)
+def handle_pool_timeout(e):
+    return jsonify({'error': str(e)}), 503
+
+
+def service_stats():
+    return {
+        'pools': pool_stats(),
+        'schema_cache': schema_cache.stats(),
+        'catalog': catalog.stats(),
+        'cursors': cursor_registry.stats(),
+        'query_cache': query_cache.stats(),
+        'translation_cache': translation_cache.stats(),
+        'upload_jobs': upload_jobs.stats(),
+        'slow_queries': slow_query_log.stats(),
+        'query_admission': query_admission.stats(),
+        'running_queries': running_queries.stats()
+    }
+
+
+# Route to report connection pool metrics
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify(service_stats()), 200
+
+
+# Counters and latency histograms kept in memory and rendered in the
+# Prometheus text format. Updates are a dict lookup and a few additions under
+# one lock, cheap enough to leave on in production.
+class MetricsRegistry:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self.descriptions = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name, kind, description):
+        self.descriptions[name] = (kind, description)
+
+    def inc(self, name, value=1, **labels):
+        if not app.config['METRICS_ENABLED']:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not app.config['METRICS_ENABLED']:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, then +Inf, sum and count
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            histogram[bucket] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def render(self, gauges=()):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(values) for key, values in self.histograms.items()}
+        lines = []
+        described = set()
+
+        def header(name, default_kind):
+            if name not in described:
+                kind, description = self.descriptions.get(name, (default_kind, f"{name} as reported by /api/stats"))
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{prometheus_labels(labels)} {value}")
+        for (name, labels), values in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{name}_bucket{prometheus_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{prometheus_labels(labels)} {round(values[-2], 6)}")
+            lines.append(f"{name}_count{prometheus_labels(labels)} {values[-1]}")
+        for name, labels, value in sorted(gauges, key=lambda gauge: (gauge[0], gauge[1])):
+            header(name, 'gauge')
+            lines.append(f"{name}{prometheus_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def prometheus_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{prometheus_label_value(value)}"' for key, value in labels) + '}'
+
+
+def prometheus_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Numeric values of a stats dict as (name, labels, value) gauges; nested
+# dicts become a 'key' label
+def stats_gauges(prefix, stats):
+    for key, value in stats.items():
+        name = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)}"
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                if isinstance(sub_value, (int, float)) and not isinstance(sub_value, bool):
+                    yield name, (('key', sub_key),), sub_value
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, (), value
+
+
+metrics = MetricsRegistry(METRICS_BUCKETS)
+metrics.describe('chatdb_http_requests_total', 'counter', 'HTTP requests by endpoint, method and status')
+metrics.describe('chatdb_http_request_duration_seconds', 'histogram', 'Time spent handling a request, by endpoint')
+metrics.describe('chatdb_http_response_bytes_total', 'counter', 'Response bytes serialized, by endpoint')
+metrics.describe('chatdb_stage_duration_seconds', 'histogram', 'Time spent in each hot-path stage')
+metrics.describe('chatdb_rows_returned_total', 'counter', 'Result rows returned to clients, by engine')
+metrics.describe('chatdb_rows_loaded_total', 'counter', 'Rows and documents loaded by uploads, by load method')
+
+
+# Times a block into the stage histogram: with stage_timer('mysql_execute'): ...
+class stage_timer:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics.observe('chatdb_stage_duration_seconds', time.perf_counter() - self.started, stage=self.stage)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe('chatdb_http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+    metrics.inc('chatdb_http_requests_total', endpoint=endpoint, method=request.method, status=str(response.status_code))
+    # Streamed bodies are counted by their generators once they finish
+    if not response.is_streamed and response.content_length:
+        metrics.inc('chatdb_http_response_bytes_total', response.content_length, endpoint=endpoint)
+    return response
+
+
+# Route to expose request metrics and service stats in Prometheus text format
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    gauges = []
+    for component, stats in service_stats().items():
+        if component == 'pools':
+            for db_type, pool in stats.items():
+                gauges.extend(stats_gauges(f"chatdb_{db_type}_pool", pool))
+        else:
+            gauges.extend(stats_gauges(f"chatdb_{component}", stats))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+# Route to check that both databases answer through their pools
+@app.route('/api/health', methods=['GET'])
+def health():
+    status = {}
+    try:
+        status['mysql'] = 'ok' if get_mysql_pool().check_health() else 'unhealthy'
+    except Exception as e:
+        status['mysql'] = f"error: {e}"
+    try:
+        get_mongo_client().admin.command('ping')
+        status['mongodb'] = 'ok'
+    except PyMongoError as e:
+        status['mongodb'] = f"error: {e}"
+    healthy = all(value == 'ok' for value in status.values())
+    return jsonify(status), 200 if healthy else 503
+
+
+# Route to serve the main page
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+# Move a saved upload to its final path, then load it. Runs with the target's
+# upload lock held, so the file cannot change under an earlier load.
+def install_upload(partial_path, filepath, load):
+    os.replace(partial_path, filepath)
+    return load()
+
+
+# Route to handle file upload
+# Global variable to store the name of the last uploaded table
+last_uploaded_table = None
+
+@app.route('/api/upload', methods=['POST'])
+def upload_file():
+    if 'file' not in request.files:
+        return jsonify({'message': 'No file part'}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'message': 'No selected file'}), 400
+
+    if file and allowed_file(file.filename):
+        filename = secure_filename(file.filename)
+        collection_name, extension, compression = parse_upload_name(filename)
+        if compression == 'zstd' and zstandard is None:
+            return jsonify({'message': '.zst uploads need the zstandard package'}), 400
+        if extension == 'parquet' and pq is None:
+            return jsonify({'message': 'Parquet uploads need the pyarrow package'}), 400
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # Save under a temporary name; the load swaps it in while holding the
+        # target's lock, so a queued or running load of the same file keeps reading
+        # one version of it across its passes
+        partial_path = f"{filepath}.{uuid.uuid4().hex}.part"
+        file.save(partial_path)
+
+        if extension == 'parquet':
+            db_type = 'mysql'
+            batch_size = request.form.get('batch_size', type=int) or app.config['CSV_BATCH_SIZE']
+            load = functools.partial(process_parquet_file_and_load_to_db, filepath, collection_name, batch_size=batch_size)
+        elif extension == 'csv':
+            db_type = 'mysql'
+            batch_size = request.form.get('batch_size', type=int) or app.config['CSV_BATCH_SIZE']
+            use_load_data = request.form.get('load_data', str(app.config['CSV_USE_LOAD_DATA'])).lower() in ('1', 'true', 'yes')
+            # The server cannot decompress the file for LOAD DATA; pandas decompresses it while reading instead
+            use_load_data = use_load_data and compression is None
+            chunk_size = request.form.get('chunk_size', type=int)
+            load = functools.partial(process_csv_file_and_load_to_db, filepath, collection_name, batch_size=batch_size,
+                                     use_load_data=use_load_data, chunk_size=chunk_size)
+        else:
+            db_type = 'mongodb'
+            batch_size = request.form.get('batch_size', type=int) or app.config['MONGO_BATCH_SIZE']
+            load = functools.partial(process_json_file_and_load_to_mongo, filepath, collection_name, batch_size=batch_size,
+                                     compression=compression)
+
+        load = functools.partial(install_upload, partial_path, filepath, load)
+        run_async = request.form.get('async', str(app.config['UPLOAD_ASYNC'])).lower() in ('1', 'true', 'yes')
+        if not run_async:
+            try:
+                with upload_jobs.target_lock(db_type, collection_name):
+                    load_stats = load()
+            except ValueError as e:
+                # The file could not be parsed (invalid JSON, an oversized document, ...)
+                return jsonify({'message': f"Upload failed: {e}", 'filename': filename}), 400
+            return jsonify({'message': 'File successfully uploaded', 'filename': filename, 'load_stats': load_stats}), 200
+
+        job = upload_jobs.submit(filename, db_type, collection_name, load)
+        return jsonify({'message': 'File upload queued', 'filename': filename, 'job_id': job['job_id'],
+                        'status_url': f"/api/upload/jobs/{job['job_id']}"}), 202
+    else:
+        return jsonify({'message': 'Invalid file type'}), 400
+
+
+# Text that is an ISO 8601 date or datetime, e.g. 2023-01-15 or 2023-01-15T10:30:00Z
+ISO_DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?(?:Z|[+-]\d{2}:?\d{2})?$'
+# Time zone suffix of an ISO 8601 value, matched after its date part
+ISO_OFFSET_PATTERN = r'(?:Z|[+-]\d{2}:?\d{2})$'
+# Value kinds in widening order; a column mixing kinds from different chains is a string
+NUMERIC_KINDS = ('bool', 'int', 'decimal', 'float')
+TEMPORAL_KINDS = ('date', 'datetime')
+INTEGER_SQL_TYPES = (('TINYINT', 1 << 7), ('SMALLINT', 1 << 15), ('MEDIUMINT', 1 << 23), ('INT', 1 << 31), ('BIGINT', 1 << 63))
+# Floats with more significant digits than this are stored as DOUBLE rather than DECIMAL
+DECIMAL_MAX_PRECISION = 15
+VARCHAR_SIZES = (16, 32, 64, 128, 255, 1024)
+
+
+def widen_kind(current, new):
+    if current is None or current == new:
+        return new
+    for chain in (NUMERIC_KINDS, TEMPORAL_KINDS):
+        if current in chain and new in chain:
+            return max(current, new, key=chain.index)
+    return 'string'
+
+
+# Statistics of one CSV column, merged chunk by chunk, from which the tightest
+# MySQL type that holds every value is chosen
+class ColumnStats:
+    def __init__(self):
+        self.kind = None
+        self.rows = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.integer_digits = 0
+        self.scale = 0
+        self.max_length = 0
+        self.fractional_seconds = False
+        # Dates or datetimes written with Z or an offset, loaded as UTC
+        self.time_zone = False
+
+    def add(self, series):
+        values = series.dropna()
+        self.rows += len(series)
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+        if pd.api.types.is_bool_dtype(values):
+            kind, length = 'bool', 5
+        elif pd.api.types.is_integer_dtype(values) or (pd.api.types.is_float_dtype(values) and (values % 1 == 0).all()):
+            kind = 'int'
+            low, high = int(values.min()), int(values.max())
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            length = max(len(str(low)), len(str(high)))
+            # Kept for DECIMAL precision in case a later chunk has fractions
+            self.integer_digits = max(self.integer_digits, len(str(abs(low))), len(str(abs(high))))
+        elif pd.api.types.is_float_dtype(values):
+            text = values.astype(str)
+            length = text.str.len().max()
+            if text.str.contains('e|inf|nan', regex=True).any():
+                kind = 'float'
+            else:
+                kind = 'decimal'
+                whole, _, fraction = text.str.lstrip('-').str.partition('.').T.values
+                self.integer_digits = max(self.integer_digits, max(map(len, whole)))
+                self.scale = max(self.scale, max(map(len, fraction)))
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            kind, length = 'datetime', 26
+            self.fractional_seconds = self.fractional_seconds or bool((values.dt.microsecond != 0).any())
+        else:
+            text = values.astype(str)
+            length = text.str.len().max()
+            kind = 'string'
+            if text.str.match(ISO_DATE_PATTERN).all() and \
+                    pd.to_datetime(text, format='ISO8601', errors='coerce', utc=True).notna().all():
+                kind = 'datetime' if (text.str.len() > 10).any() else 'date'
+                self.fractional_seconds = self.fractional_seconds or bool(text.str.contains(r'\.\d', regex=True).any())
+                self.time_zone = self.time_zone or bool(text.str.slice(10).str.contains(ISO_OFFSET_PATTERN).any())
+        self.kind = widen_kind(self.kind, kind)
+        self.max_length = max(self.max_length, int(length))
+
+    def sql_type(self):
+        if self.kind == 'bool':
+            return 'BOOLEAN'
+        if self.kind == 'int':
+            bound = max(-self.min, self.max + 1)
+            sql_type = next((sql_type for sql_type, limit in INTEGER_SQL_TYPES if bound <= limit), None)
+            if sql_type is None:
+                # Whole numbers past BIGINT (e.g. 1e20 read as a float)
+                return f"DECIMAL({self.integer_digits}, 0)" if self.integer_digits <= 65 else 'DOUBLE'
+            return sql_type
+        if self.kind == 'decimal':
+            precision = max(self.integer_digits, 1) + self.scale
+            return f"DECIMAL({precision}, {self.scale})" if precision <= DECIMAL_MAX_PRECISION else 'DOUBLE'
+        if self.kind == 'float':
+            return 'DOUBLE'
+        if self.kind == 'date':
+            return 'DATE'
+        if self.kind == 'datetime':
+            return 'DATETIME(6)' if self.fractional_seconds else 'DATETIME'
+        if self.kind is None:
+            # Only NULLs: nothing to size the column by
+            return 'VARCHAR(255)'
+        size = next((size for size in VARCHAR_SIZES if self.max_length <= size), None)
+        return f"VARCHAR({size})" if size else 'TEXT'
+
+
+def column_stats(series):
+    stats = ColumnStats()
+    stats.add(series)
+    return stats
+
+
+def infer_column_types(df):
+    return {col: column_stats(df[col]).sql_type() for col in df.columns}
+
+
+# Scan a CSV chunk by chunk and collect statistics for every column, so the
+# types fit the whole file before the table is created
+def profile_csv_columns(filepath, chunk_size):
+    profiles = None
+    for chunk in iter_csv_chunks(filepath, chunk_size):
+        if profiles is None:
+            profiles = {col: ColumnStats() for col in chunk.columns}
+        for col in chunk.columns:
+            profiles[col].add(chunk[col])
+    return profiles
+
+
+def iter_csv_chunks(filepath, chunk_size):
+    if not chunk_size:
+        yield pd.read_csv(filepath)
+        return
+    empty = True
+    for chunk in pd.read_csv(filepath, chunksize=chunk_size):
+        empty = False
+        yield chunk
+    if empty:
+        yield pd.read_csv(filepath, nrows=0)
+
+
+def create_table_from_csv(conn, df, table_name, column_types=None):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+    conn.commit()
+
+    column_types = column_types or infer_column_types(df)
+    column_definitions = [f"{col} {sql_type}" for col, sql_type in column_types.items()]
+
+    columns = ", ".join(column_definitions)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns});")
+    conn.commit()
+    return column_types
+
+
+# Key column for a loaded table: an ID named after the table (StudentID in
+# students, id, _id) or else an ID-like first column, if it has no NULLs
+def choose_primary_key(table_name, columns, candidates, profiles=None):
+    singular = re.sub(r'e?s$', '', table_name.lower()).replace('_', '')
+    candidates = [col for col in candidates if profiles is None or profiles[col].nulls == 0]
+    for col in candidates:
+        stem = re.sub(r'_?id$', '', col, flags=re.IGNORECASE).lower().replace('_', '')
+        if stem in ('', singular):
+            return col
+    return columns[0] if columns and columns[0] in candidates else None
+
+
+# Primary key and secondary indexes on the ID-like columns of a loaded table.
+# They are added in one ALTER TABLE after the bulk load, so the server builds
+# each index in one pass instead of updating it row by row. If the key column
+# turns out to hold duplicates it is given a plain index instead.
+def index_loaded_table(conn, table_name, column_types, stats, profiles=None):
+    if not app.config['CSV_AUTO_INDEX']:
+        return
+    columns = list(column_types)
+    candidates = [col for col in columns if is_id_column(col) and
+                  column_types[col].split('(')[0] not in ('TEXT', 'LONGBLOB', 'JSON')]
+    if not candidates:
+        return
+    primary_key = choose_primary_key(table_name, columns, candidates, profiles)
+    attempts = [primary_key, None] if primary_key else [None]
+    cursor = conn.cursor()
+    try:
+        for key in attempts:
+            indexed = [col for col in candidates if col != key]
+            clauses = ([f"ADD PRIMARY KEY ({key})"] if key else []) + [f"ADD INDEX idx_{col} ({col})" for col in indexed]
+            try:
+                cursor.execute(f"ALTER TABLE {table_name} {', '.join(clauses)};")
+                conn.commit()
+            except mysql.connector.Error as err:
+                conn.rollback()
+                stats['errors'].append({'batch': None, 'error': f"Adding indexes failed: {err}"})
+                continue
+            stats['indexes'] = {'primary_key': key, 'indexes': indexed}
+            return
+    finally:
+        cursor.close()
+
+# Convert a DataFrame slice into parameter tuples for executemany.
+# NaN -> NULL conversion is done once per column instead of once per cell.
+def dataframe_to_rows(df):
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # list(): newer pandas returns a Series with its own index here
+            values = pd.Series(list(series.dt.to_pydatetime()), index=series.index, dtype=object)
+        else:
+            values = series.astype(object)
+        columns.append(values.where(series.notna(), None).tolist())
+    return list(zip(*columns))
+
+
+def new_load_stats(method):
+    return {
+        'method': method,
+        'rows_loaded': 0,
+        'rows_failed': 0,
+        'batches': 0,
+        'errors': [],
+        'elapsed_seconds': 0.0,
+        'rows_per_sec': 0.0,
+        '_started': time.perf_counter()
+    }
+
+
+def finish_load_stats(stats):
+    elapsed = time.perf_counter() - stats.pop('_started')
+    metrics.inc('chatdb_rows_loaded_total', stats['rows_loaded'], method=stats['method'])
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['rows_per_sec'] = round(stats['rows_loaded'] / elapsed, 1) if elapsed > 0 else 0.0
+    print(f"Loaded {stats['rows_loaded']} rows in {stats['elapsed_seconds']}s "
+          f"({stats['rows_per_sec']} rows/sec, method={stats['method']}, failed={stats['rows_failed']})")
+    return stats
+
+
+# Insert one batch with executemany and commit it separately, so that a bad
+# batch is rolled back and reported without discarding the batches before it
+def insert_row_batch(conn, cursor, insert_query, rows, stats, first_row):
+    try:
+        cursor.executemany(insert_query, rows)
+        conn.commit()
+        stats['rows_loaded'] += len(rows)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        stats['rows_failed'] += len(rows)
+        stats['errors'].append({
+            'batch': stats['batches'],
+            'first_row': first_row,
+            'last_row': first_row + len(rows) - 1,
+            'error': str(err)
+        })
+    stats['batches'] += 1
+
+
+def insert_rows_in_batches(conn, insert_query, df, stats, batch_size=CSV_BATCH_SIZE, first_row=0):
+    cursor = conn.cursor()
+    for start in range(0, len(df), batch_size):
+        rows = dataframe_to_rows(df.iloc[start:start + batch_size])
+        insert_row_batch(conn, cursor, insert_query, rows, stats, first_row + start)
+    cursor.close()
+
+
+def detect_line_terminator(filepath):
+    with open(filepath, 'rb') as f:
+        first_line = f.readline()
+    return '\\r\\n' if first_line.endswith(b'\r\n') else '\\n'
+
+
+class LoadDataWarning(Exception):
+    pass
+
+
+# Fast path: let the server parse the file with LOAD DATA LOCAL INFILE.
+# Empty fields are mapped to NULL to match the executemany loader. Under
+# LOCAL, values the server cannot convert only raise warnings and load as zero
+# dates, NULLs or truncated text, so any warning raises LoadDataWarning
+# before the rows are committed.
+def load_csv_with_load_data(conn, filepath, table_name, columns, stats):
+    variables = [f"@v{i}" for i in range(len(columns))]
+    assignments = ", ".join(f"{col} = NULLIF({var}, '')" for col, var in zip(columns, variables))
+    load_query = (
+        f"LOAD DATA LOCAL INFILE %s INTO TABLE {table_name} "
+        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        f"LINES TERMINATED BY '{detect_line_terminator(filepath)}' IGNORE 1 LINES "
+        f"({', '.join(variables)}) SET {assignments}"
+    )
+    cursor = conn.cursor()
+    try:
+        cursor.execute(load_query, (os.path.abspath(filepath),))
+        rows_loaded = max(cursor.rowcount, 0)
+        cursor.execute("SHOW WARNINGS LIMIT 1")
+        warning = cursor.fetchone()
+        if warning is not None:
+            raise LoadDataWarning(f"LOAD DATA reported warnings, e.g. {warning[2]}")
+        conn.commit()
+        stats['rows_loaded'] += rows_loaded
+        stats['batches'] += 1
+    finally:
+        cursor.close()
+
+
+# Stream the CSV into MySQL chunk by chunk so memory stays bounded by
+# chunk_size rather than the file size. The table already has column types
+# that fit the whole file; date columns are parsed so they load as dates.
+def stream_csv_to_table(conn, filepath, table_name, column_types, stats, batch_size, chunk_size):
+    columns = ", ".join(column_types)
+    placeholders = ", ".join(["%s"] * len(column_types))
+    insert_query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+    date_columns = [col for col, sql_type in column_types.items() if sql_type.startswith(('DATE', 'DATETIME'))]
+    rows_seen = 0
+    for chunk in iter_csv_chunks(filepath, chunk_size):
+        for col in date_columns:
+            # Offsets are converted to UTC; MySQL DATETIME has no time zone
+            chunk[col] = pd.to_datetime(chunk[col], format='ISO8601', utc=True).dt.tz_localize(None)
+        insert_rows_in_batches(conn, insert_query, chunk, stats, batch_size=batch_size, first_row=rows_seen)
+        rows_seen += len(chunk)
+        stats['chunks'] = stats.get('chunks', 0) + 1
+
+
+def process_csv_file_and_load_to_db(filepath, table_name, batch_size=None, use_load_data=None, chunk_size=None):
+    batch_size = batch_size or app.config['CSV_BATCH_SIZE']
+    if use_load_data is None:
+        use_load_data = app.config['CSV_USE_LOAD_DATA']
+    if chunk_size is None:
+        chunk_size = app.config['CSV_CHUNK_SIZE']
+
+    conn = get_db_connection(allow_local_infile=True) if use_load_data else get_db_connection()
+    try:
+        fallback_error = None
+        profiles = profile_csv_columns(filepath, chunk_size)
+        column_types = {col: profile.sql_type() for col, profile in profiles.items()}
+        create_table_from_csv(conn, None, table_name, column_types=column_types)
+        if use_load_data and any(profile.time_zone for profile in profiles.values()):
+            # LOAD DATA cannot convert Z or offset suffixes to UTC; the batched inserts do
+            print(f"Skipping LOAD DATA for {table_name}: it has dates with time zones")
+            use_load_data = False
+        if use_load_data:
+            stats = new_load_stats('load_data')
+            UPLOAD_PROGRESS[('mysql', table_name)] = stats
+            try:
+                load_csv_with_load_data(conn, filepath, table_name, list(column_types), stats)
+                index_loaded_table(conn, table_name, column_types, stats, profiles)
+                return finish_load_stats(stats)
+            except (mysql.connector.Error, LoadDataWarning) as err:
+                # Server refused LOCAL INFILE, or the file did not parse cleanly; fall back to batched inserts
+                conn.rollback()
+                print(f"LOAD DATA failed for {table_name}, falling back to executemany: {err}")
+                fallback_error = str(err)
+                # Start again from an empty table
+                create_table_from_csv(conn, None, table_name, column_types=column_types)
+
+        stats = new_load_stats('executemany')
+        UPLOAD_PROGRESS[('mysql', table_name)] = stats
+        if fallback_error:
+            stats['errors'].append({'batch': None, 'error': f"LOAD DATA failed: {fallback_error}"})
+        stream_csv_to_table(conn, filepath, table_name, column_types, stats, batch_size, chunk_size)
+        index_loaded_table(conn, table_name, column_types, stats, profiles)
+        return finish_load_stats(stats)
+    finally:
+        conn.close()
+        notify_dataset_changed('mysql', table_name)
+
+
+# MySQL column type for an Arrow (Parquet) column type
+def sql_type_for_arrow(arrow_type):
+    types = pa.types
+    if types.is_dictionary(arrow_type):
+        return sql_type_for_arrow(arrow_type.value_type)
+    if types.is_boolean(arrow_type):
+        return 'BOOLEAN'
+    if types.is_integer(arrow_type):
+        sql_type = {8: 'TINYINT', 16: 'SMALLINT', 32: 'INT', 64: 'BIGINT'}[arrow_type.bit_width]
+        return f"{sql_type} UNSIGNED" if types.is_unsigned_integer(arrow_type) else sql_type
+    if types.is_float64(arrow_type):
+        return 'DOUBLE'
+    if types.is_floating(arrow_type):
+        return 'FLOAT'
+    if types.is_decimal(arrow_type) and arrow_type.precision <= 65:
+        return f"DECIMAL({arrow_type.precision}, {arrow_type.scale})"
+    if types.is_date(arrow_type):
+        return 'DATE'
+    if types.is_timestamp(arrow_type):
+        return {'s': 'DATETIME', 'ms': 'DATETIME(3)'}.get(arrow_type.unit, 'DATETIME(6)')
+    if types.is_time(arrow_type) or types.is_duration(arrow_type):
+        return 'TIME(6)'
+    if types.is_fixed_size_binary(arrow_type):
+        return f"BINARY({arrow_type.byte_width})"
+    if types.is_binary(arrow_type) or types.is_large_binary(arrow_type):
+        return 'LONGBLOB'
+    if types.is_nested(arrow_type):
+        return 'JSON'
+    # Strings, and decimals wider than MySQL allows
+    return 'TEXT'
+
+
+# Rows of a record batch as tuples of values the MySQL driver accepts
+def arrow_batch_to_rows(batch):
+    columns = []
+    for column in batch.columns:
+        if pa.types.is_dictionary(column.type):
+            column = column.dictionary_decode()
+        if pa.types.is_timestamp(column.type) and (column.type.tz or column.type.unit == 'ns'):
+            # Naive UTC; nanoseconds truncated to what DATETIME(6) holds
+            column = column.cast(pa.timestamp('us' if column.type.unit == 'ns' else column.type.unit), safe=False)
+        values = column.to_pylist()
+        if pa.types.is_decimal(column.type) and column.type.precision > 65:
+            values = [None if value is None else str(value) for value in values]
+        elif pa.types.is_nested(column.type):
+            values = [None if value is None else dumps_json(value).decode('utf-8') for value in values]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+# Load a Parquet file into MySQL one row group at a time. Column types come
+# straight from the Parquet schema, so nothing is inferred or widened.
+def process_parquet_file_and_load_to_db(filepath, table_name, batch_size=None):
+    batch_size = batch_size or app.config['CSV_BATCH_SIZE']
+    parquet_file = pq.ParquetFile(filepath)
+    # Skip the index pandas stores alongside the data
+    fields = [field for field in parquet_file.schema_arrow if not field.name.startswith('__index_level_')]
+    column_types = {field.name: sql_type_for_arrow(field.type) for field in fields}
+    column_indexes = [parquet_file.schema_arrow.get_field_index(field.name) for field in fields]
+
+    def row_group_bytes(index):
+        row_group = parquet_file.metadata.row_group(index)
+        return sum(row_group.column(i).total_compressed_size for i in column_indexes)
+
+    stats = new_load_stats('executemany')
+    stats.update({'row_groups': 0, 'bytes_read': 0,
+                  'total_bytes': sum(row_group_bytes(i) for i in range(parquet_file.num_row_groups))})
+    UPLOAD_PROGRESS[('mysql', table_name)] = stats
+
+    conn = get_db_connection()
+    try:
+        create_table_from_csv(conn, None, table_name, column_types=column_types)
+        columns = ", ".join(column_types)
+        placeholders = ", ".join(["%s"] * len(column_types))
+        insert_query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+        cursor = conn.cursor()
+        first_row = 0
+        for index in range(parquet_file.num_row_groups):
+            row_group = parquet_file.read_row_group(index, columns=list(column_types))
+            for batch in row_group.to_batches(max_chunksize=batch_size):
+                rows = arrow_batch_to_rows(batch)
+                insert_row_batch(conn, cursor, insert_query, rows, stats, first_row)
+                first_row += len(rows)
+            stats['row_groups'] += 1
+            stats['bytes_read'] += row_group_bytes(index)
+        cursor.close()
+        index_loaded_table(conn, table_name, column_types, stats)
+        return finish_load_stats(stats)
+    finally:
+        conn.close()
+        notify_dataset_changed('mysql', table_name)
+
+
+def preprocess_json_data(data):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                if '$oid' in value:
+                    data[key] = value['$oid']
+                elif '$date' in value:
+                    try:
+                        data[key] = datetime.fromisoformat(value['$date'].replace("Z", "+00:00"))
+                    except ValueError:
+                        data[key] = value['$date']
+                else:
+                    preprocess_json_data(value)
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    preprocess_json_data(item)
+            elif isinstance(value, str):
+                try:
+                    parsed_date = datetime.fromisoformat(value)
+                    data[key] = parsed_date
+                except ValueError:
+                    pass
+    elif isinstance(data, list):
+        for item in data:
+            preprocess_json_data(item)
+
+# K-minimum-values sketch for approximate distinct counts. Keeps the k smallest
+# 64-bit hashes seen; memory stays fixed no matter how many values are added.
+class DistinctSketch:
+    def __init__(self, k=MONGO_SCHEMA_SKETCH_SIZE):
+        self.k = k
+        self._heap = []      # negated hashes, so the largest kept hash is on top
+        self._hashes = set()
+
+    def add(self, value):
+        digest = hashlib.blake2b(repr(value).encode('utf-8'), digest_size=8).digest()
+        h = int.from_bytes(digest, 'big')
+        if h in self._hashes:
+            return
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, -h)
+            self._hashes.add(h)
+        elif h < -self._heap[0]:
+            self._hashes.discard(-heapq.heappushpop(self._heap, -h))
+            self._hashes.add(h)
+
+    def estimate(self):
+        if len(self._heap) < self.k:
+            return len(self._heap)
+        return int((self.k - 1) / ((-self._heap[0] + 1) / 2 ** 64))
+
+
+def bson_type_name(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'double'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, datetime):
+        return 'date'
+    if isinstance(value, ObjectId):
+        return 'objectId'
+    if isinstance(value, dict):
+        return 'object'
+    if isinstance(value, list):
+        return 'array'
+    return type(value).__name__
+
+
+# Yield (dotted path, value) for every field of a document. Fields of
+# documents nested in arrays use the array's path, e.g. ratings.rating.
+def iter_field_paths(document, prefix=''):
+    for key, value in document.items():
+        path = f"{prefix}.{key}" if prefix else key
+        yield path, value
+        if isinstance(value, dict):
+            yield from iter_field_paths(value, path)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    yield from iter_field_paths(item, path)
+
+
+# Field statistics of a collection, merged one document at a time so
+# uploads can keep it current without rescanning the collection
+class SchemaProfile:
+    def __init__(self, source):
+        self.source = source
+        self.documents = 0
+        self.fields = {}
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    def add_document(self, document):
+        with self._lock:
+            self.documents += 1
+            seen = set()
+            for path, value in iter_field_paths(document):
+                field = self.fields.get(path)
+                if field is None:
+                    field = self.fields[path] = {
+                        'documents': 0, 'values': 0, 'nulls': 0,
+                        'types': collections.Counter(), 'sketch': DistinctSketch()
+                    }
+                if path not in seen:
+                    seen.add(path)
+                    field['documents'] += 1
+                field['values'] += 1
+                type_name = bson_type_name(value)
+                field['types'][type_name] += 1
+                if value is None:
+                    field['nulls'] += 1
+                elif type_name not in ('object', 'array'):
+                    field['sketch'].add(value)
+            self.updated_at = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            fields = {}
+            for path, field in self.fields.items():
+                fields[path] = {
+                    'presence_ratio': round(field['documents'] / self.documents, 4) if self.documents else 0.0,
+                    'null_ratio': round(field['nulls'] / field['values'], 4) if field['values'] else 0.0,
+                    'types': {name: round(count / field['values'], 4) for name, count in field['types'].most_common()},
+                    'approx_distinct': field['sketch'].estimate()
+                }
+            return {
+                'source': self.source,
+                'documents_profiled': self.documents,
+                'updated_at': self.updated_at,
+                'fields': fields
+            }
+
+    # Top-level field names, in order of first appearance
+    def top_level_fields(self):
+        with self._lock:
+            return [path for path in self.fields if '.' not in path]
+
+
+# Stored profiles, keyed by collection name
+MONGO_SCHEMA_PROFILES = {}
+
+
+# Return the stored profile of a collection, or build one from a $sample
+# of its documents. The sampled documents are returned too when a new
+# profile is built, so callers can reuse them as sample rows.
+def infer_mongo_schema(collection_name, sample_size=None, refresh=False):
+    profile = MONGO_SCHEMA_PROFILES.get(collection_name)
+    if profile is not None and not refresh:
+        return profile, None
+    sample_size = sample_size or app.config['MONGO_SCHEMA_SAMPLE_SIZE']
+    collection = get_mongo_connection()[collection_name]
+    sampled = list(collection.aggregate([{'$sample': {'size': sample_size}}]))
+    return store_sampled_profile(collection_name, sampled), sampled
+
+
+# Profile built from a $sample of a collection, kept until an upload replaces it
+def store_sampled_profile(collection_name, sampled):
+    profile = SchemaProfile('sample')
+    for document in sampled:
+        profile.add_document(document)
+    MONGO_SCHEMA_PROFILES[collection_name] = profile
+    return profile
+
+
+# Incrementally parse a JSON file into top-level documents.
+# Handles a single document, a top-level array of documents and
+# newline-delimited JSON without reading the whole file into memory.
+# Raises ValueError, with the character offset in the file, for invalid JSON
+# or a document longer than max_document_size.
+def iter_json_documents(json_file, read_size=JSON_READ_SIZE, max_document_size=JSON_MAX_DOCUMENT_SIZE):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    # Characters of the file before the start of buffer
+    offset = 0
+    eof = False
+    top_level_array = None
+    while True:
+        # Skip whitespace, and the separators between elements of a top-level array
+        while pos < len(buffer) and (buffer[pos].isspace() or (top_level_array and buffer[pos] in ',]')):
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                return
+            offset += len(buffer)
+            buffer = json_file.read(read_size)
+            pos = 0
+            eof = not buffer
+            continue
+        if top_level_array is None:
+            top_level_array = buffer[pos] == '['
+            if top_level_array:
+                pos += 1
+                continue
+        try:
+            document, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ValueError(f"Invalid JSON at character {offset + e.pos}: {e.msg}") from None
+            document, end = None, len(buffer)
+        # The document may continue past the end of the buffer: read more and retry
+        if end == len(buffer) and not eof:
+            if len(buffer) - pos > max_document_size:
+                raise ValueError(f"JSON document at character {offset + pos} is still incomplete after "
+                                 f"{max_document_size} characters; the file is malformed or the document "
+                                 f"is larger than JSON_MAX_DOCUMENT_SIZE")
+            # Read at least as much as is buffered, so a long document is
+            # re-parsed a logarithmic rather than linear number of times
+            more = json_file.read(max(read_size, len(buffer) - pos))
+            eof = not more
+            offset += pos
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+        pos = end
+        yield document
+
+
+# Generator stage that applies the $oid/$date normalization one document at a time
+def normalize_json_documents(documents):
+    for document in documents:
+        preprocess_json_data(document)
+        yield document
+
+
+def insert_document_batch(collection, batch, stats):
+    try:
+        result = collection.insert_many(batch, ordered=False)
+        stats['rows_loaded'] += len(result.inserted_ids)
+    except BulkWriteError as err:
+        write_errors = err.details.get('writeErrors', [])
+        stats['rows_loaded'] += err.details.get('nInserted', 0)
+        stats['rows_failed'] += len(write_errors)
+        stats['errors'].append({
+            'batch': stats['batches'],
+            'failed': len(write_errors),
+            'error': write_errors[0]['errmsg'] if write_errors else str(err)
+        })
+    stats['batches'] += 1
+
+
+# Binary reader that decompresses the file as it is read
+def open_decompressed(raw_file, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw_file, mode='rb')
+    if compression == 'zstd':
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw_file, read_across_frames=True))
+    return raw_file
+
+
+def process_json_file_and_load_to_mongo(filepath, collection_name, batch_size=None, compression=None):
+    batch_size = batch_size or app.config['MONGO_BATCH_SIZE']
+    db = get_mongo_connection()
+    collection = db[collection_name]
+    if collection_name in db.list_collection_names():
+        collection.drop()
+
+    stats = new_load_stats('insert_many')
+    stats.update({'documents_read': 0, 'bytes_read': 0, 'total_bytes': os.path.getsize(filepath)})
+    UPLOAD_PROGRESS[('mongodb', collection_name)] = stats
+    # Profile the documents as they stream past instead of sampling the collection afterwards
+    profile = SchemaProfile('upload')
+    MONGO_SCHEMA_PROFILES[collection_name] = profile
+
+    try:
+        with open(filepath, 'rb') as raw_file:
+            # bytes_read follows the compressed file, so percent matches total_bytes
+            json_file = io.TextIOWrapper(open_decompressed(raw_file, compression), encoding='utf-8')
+            documents = iter_json_documents(json_file, app.config['JSON_READ_SIZE'], app.config['JSON_MAX_DOCUMENT_SIZE'])
+            batch = []
+            for document in normalize_json_documents(documents):
+                stats['documents_read'] += 1
+                if not isinstance(document, dict):
+                    stats['rows_failed'] += 1
+                    stats['errors'].append({'document': stats['documents_read'] - 1, 'error': 'Top-level value is not an object'})
+                    continue
+                profile.add_document(document)
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    insert_document_batch(collection, batch, stats)
+                    stats['bytes_read'] = raw_file.tell()
+                    batch = []
+            if batch:
+                insert_document_batch(collection, batch, stats)
+            stats['bytes_read'] = raw_file.tell()
+    except Exception as e:
+        stats['state'] = 'failed'
+        stats['errors'].append({'batch': stats['batches'], 'error': str(e)})
+        finish_load_stats(stats)
+        raise
+    finally:
+        notify_dataset_changed('mongodb', collection_name)
+    return finish_load_stats(stats)
+
+
+# Public view of a load stats dict; running loads get live elapsed time and rate
+def load_progress_snapshot(stats):
+    snapshot = {key: value for key, value in stats.items() if not key.startswith('_')}
+    if '_started' in stats:
+        elapsed = time.perf_counter() - stats['_started']
+        snapshot['state'] = 'running'
+        snapshot['elapsed_seconds'] = round(elapsed, 3)
+        snapshot['rows_per_sec'] = round(stats['rows_loaded'] / elapsed, 1) if elapsed > 0 else 0.0
+    else:
+        snapshot.setdefault('state', 'done')
+    if snapshot.get('total_bytes'):
+        snapshot['percent'] = round(100.0 * snapshot['bytes_read'] / snapshot['total_bytes'], 1)
+    return snapshot
+
+
+# Background upload jobs. Loads run on a small worker pool so the request
+# returns at once; loads into the same table/collection are serialized.
+class UploadJobRegistry:
+    def __init__(self, workers, history):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self.workers = workers
+        self.history = history
+        self.jobs = collections.OrderedDict()
+        self.target_locks = collections.defaultdict(threading.Lock)
+        self.lock = threading.Lock()
+
+    def target_lock(self, db_type, target):
+        with self.lock:
+            return self.target_locks[(db_type, target)]
+
+    def submit(self, filename, db_type, target, load):
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'filename': filename,
+            'db_type': db_type,
+            'target': target,
+            'state': 'queued',
+            'submitted_at': datetime.utcnow().isoformat() + 'Z',
+            'started_at': None,
+            'finished_at': None,
+            'load_stats': None,
+            'error': None
+        }
+        with self.lock:
+            self.jobs[job['job_id']] = job
+            self._prune()
+        self.executor.submit(self._run, job, load)
+        return job
+
+    def _run(self, job, load):
+        with self.target_lock(job['db_type'], job['target']):
+            job['started_at'] = datetime.utcnow().isoformat() + 'Z'
+            job['state'] = 'running'
+            # Stats left by an earlier load of this target must not show as this job's progress
+            UPLOAD_PROGRESS.pop((job['db_type'], job['target']), None)
+            try:
+                job['load_stats'] = load()
+                job['state'] = 'done'
+            except Exception as e:
+                print(f"Upload job {job['job_id']} ({job['filename']}) failed: {e}")
+                job['error'] = str(e)
+                job['state'] = 'failed'
+                stats = UPLOAD_PROGRESS.get((job['db_type'], job['target']))
+                if stats is not None:
+                    if '_started' in stats:
+                        stats['state'] = 'failed'
+                        finish_load_stats(stats)
+                    job['load_stats'] = stats
+            finally:
+                job['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['state'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    def snapshot(self, job):
+        snapshot = {key: value for key, value in job.items() if key != 'load_stats'}
+        stats = job['load_stats']
+        if stats is None and job['state'] == 'running':
+            stats = UPLOAD_PROGRESS.get((job['db_type'], job['target']))
+        if stats is not None:
+            progress = load_progress_snapshot(stats)
+            progress.pop('state', None)
+            snapshot.update({
+                'rows_loaded': progress.get('rows_loaded', 0),
+                'rows_failed': progress.get('rows_failed', 0),
+                'rows_per_sec': progress.get('rows_per_sec', 0.0),
+                'errors': progress.get('errors', []),
+                'load_stats': progress
+            })
+        return snapshot
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return self.snapshot(job) if job is not None else None
+
+    def list(self, state=None):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [self.snapshot(job) for job in jobs if state is None or job['state'] == state]
+
+    def stats(self):
+        with self.lock:
+            states = collections.Counter(job['state'] for job in self.jobs.values())
+        return {'workers': self.workers, 'jobs': dict(states)}
+
+
+upload_jobs = UploadJobRegistry(UPLOAD_WORKERS, UPLOAD_JOB_HISTORY)
+
+
+# Route to poll background upload jobs
+@app.route('/api/upload/jobs', methods=['GET'])
+@app.route('/api/upload/jobs/<job_id>', methods=['GET'])
+def upload_job_status(job_id=None):
+    if job_id is None:
+        return jsonify({'jobs': upload_jobs.list(request.args.get('state'))}), 200
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f"No upload job '{job_id}'"}), 404
+    return jsonify(job), 200
+
+
+# Route to report progress counters of uploads, per engine. db_type picks the
+# engine when a MySQL table and a MongoDB collection share the name.
+@app.route('/api/upload/progress', methods=['GET'])
+@app.route('/api/upload/progress/<name>', methods=['GET'])
+def upload_progress(name=None):
+    db_type = request.args.get('db_type', '').lower()
+    matches = [(key, stats) for key, stats in list(UPLOAD_PROGRESS.items())
+               if (not db_type or key[0] == db_type) and (name is None or key[1] == name)]
+    if name is None:
+        progress = {}
+        for (engine, target), stats in matches:
+            progress.setdefault(engine, {})[target] = load_progress_snapshot(stats)
+        return jsonify(progress), 200
+    if not matches:
+        return jsonify({'error': f"No upload found for '{name}'"}), 404
+    if len(matches) > 1:
+        return jsonify({'error': f"Both a MySQL table and a MongoDB collection are named '{name}'; pass db_type"}), 400
+    return jsonify(load_progress_snapshot(matches[0][1])), 200
+
+# Cached explore results per engine. Each table/collection is cached
+# separately so an upload only causes its own entry to be refetched.
+class SchemaCache:
+    def __init__(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'partial_refreshes': 0, 'invalidations': 0}
+
+    # Returns (details, missing_names); details is None when a full load is needed
+    def get(self, db_type, ttl):
+        with self._lock:
+            entry = self._engines.get(db_type)
+            if entry is None or time.monotonic() - entry['loaded_at'] > ttl:
+                self.counters['misses'] += 1
+                return None, None
+            missing = [name for name in entry['names'] if name not in entry['details']]
+            self.counters['partial_refreshes' if missing else 'hits'] += 1
+            return dict(entry['details']), missing
+
+    def put(self, db_type, details, names=None):
+        with self._lock:
+            entry = self._engines.get(db_type)
+            if names is not None or entry is None:
+                self._engines[db_type] = {
+                    'loaded_at': time.monotonic(),
+                    'names': list(names if names is not None else details),
+                    'details': dict(details)
+                }
+            else:
+                entry['details'].update(details)
+
+    def invalidate(self, db_type, name=None):
+        with self._lock:
+            self.counters['invalidations'] += 1
+            entry = self._engines.get(db_type)
+            if entry is None:
+                return
+            if name is None:
+                del self._engines[db_type]
+                return
+            entry['details'].pop(name, None)
+            if name not in entry['names']:
+                entry['names'].append(name)
+
+    def drop(self, db_type, name):
+        with self._lock:
+            entry = self._engines.get(db_type)
+            if entry is not None:
+                entry['details'].pop(name, None)
+                if name in entry['names']:
+                    entry['names'].remove(name)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = {db_type: len(entry['details']) for db_type, entry in self._engines.items()}
+        return stats
+
+
+schema_cache = SchemaCache()
+explore_executor = concurrent.futures.ThreadPoolExecutor(max_workers=EXPLORE_SAMPLE_WORKERS,
+                                                         thread_name_prefix='explore')
+# Runs query batch items and per-engine explores; separate from explore_executor,
+# whose tasks these wait on
+fanout_executor = concurrent.futures.ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+
+
+def decode_if_bytes(value):
+    return value.decode('utf-8') if isinstance(value, (bytes, bytearray)) else value
+
+
+# One information_schema query for the columns of all (or the given) tables
+def mysql_columns_query(table_names=None):
+    query = (
+        "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_DEFAULT, EXTRA "
+        "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+    )
+    params = ()
+    if table_names is not None:
+        query += f" AND TABLE_NAME IN ({', '.join(['%s'] * len(table_names))})"
+        params = tuple(table_names)
+    query += " ORDER BY TABLE_NAME, ORDINAL_POSITION"
+    return query, params
+
+
+# Table name -> [Field, Type, Null, Key, Default, Extra] rows, the same shape as DESCRIBE
+def group_mysql_columns(rows):
+    columns = {}
+    for row in rows:
+        table_name, *attribute = [decode_if_bytes(value) for value in row]
+        columns.setdefault(table_name, []).append(attribute)
+    return columns
+
+
+# Column metadata of all (or the given) tables in one information_schema query
+def fetch_mysql_columns(table_names=None):
+    query, params = mysql_columns_query(table_names)
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        columns = group_mysql_columns(cursor.fetchall())
+        cursor.close()
+        return columns
+    finally:
+        connection.close()
+
+
+def mysql_sample_query(table_name, limit):
+    return f"SELECT * FROM `{table_name}` LIMIT {int(limit)}"
+
+
+def fetch_mysql_sample(table_name, limit):
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(mysql_sample_query(table_name, limit))
+        sample_data = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
+        cursor.close()
+    finally:
+        connection.close()
+    return format_sample_rows(columns, sample_data)
+
+
+# Sample rows as {column: value} dicts
+def format_sample_rows(columns, sample_data):
+    sample_data_formatted = []
+    for row in sample_data:
+        formatted_row = {}
+        for col, val in zip(columns, row):
+            # Convert timedelta to string
+            if isinstance(val, timedelta):
+                formatted_row[col] = str(val)
+            else:
+                formatted_row[col] = val
+        sample_data_formatted.append(formatted_row)
+    return sample_data_formatted
+
+
+def explore_mysql_tables(table_names=None):
+    columns = fetch_mysql_columns(table_names)
+    limit = app.config['EXPLORE_SAMPLE_SIZE']
+    samples = {name: explore_executor.submit(fetch_mysql_sample, name, limit) for name in columns}
+    return {
+        name: {'attributes': attributes, 'sample_data': samples[name].result()}
+        for name, attributes in columns.items()
+    }
+
+
+def explore_mongo_collection(db, collection_name, limit):
+    profile, sampled = infer_mongo_schema(collection_name)
+    if sampled is not None:
+        sample_data = sampled[:limit]
+    else:
+        sample_data = list(db[collection_name].find().limit(limit))
+    return mongo_collection_details(profile, sample_data)
+
+
+def mongo_collection_details(profile, sample_data):
+    schema = profile.to_dict()
+    return {'attributes': profile.top_level_fields(), 'fields': schema['fields'], 'sample_data': sample_data}
+
+
+def explore_mongo_collections(collection_names):
+    db = get_mongo_connection()
+    limit = app.config['EXPLORE_SAMPLE_SIZE']
+    futures = {name: explore_executor.submit(explore_mongo_collection, db, name, limit)
+               for name in collection_names}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def explore_schema(db_type):
+    ttl = app.config['SCHEMA_CACHE_TTL']
+    details, missing = schema_cache.get(db_type, ttl)
+    cached = details is not None and not missing
+    if details is None:
+        if db_type == 'mysql':
+            details = explore_mysql_tables()
+        else:
+            details = explore_mongo_collections(get_mongo_connection().list_collection_names())
+        schema_cache.put(db_type, details, names=list(details))
+    elif missing:
+        if db_type == 'mysql':
+            refreshed = explore_mysql_tables(missing)
+        else:
+            existing = set(get_mongo_connection().list_collection_names())
+            refreshed = explore_mongo_collections([name for name in missing if name in existing])
+        for name in missing:
+            if name not in refreshed:
+                schema_cache.drop(db_type, name)
+        schema_cache.put(db_type, refreshed)
+        details.update(refreshed)
+    return details, cached
+
+
+# Drop cached schemas (and sampled Mongo profiles) so they are rebuilt
+def reset_explore_cache(db_type):
+    schema_cache.invalidate(db_type)
+    if db_type == 'mongodb':
+        for name, profile in list(MONGO_SCHEMA_PROFILES.items()):
+            if profile.source == 'sample':
+                MONGO_SCHEMA_PROFILES.pop(name, None)
+
+
+# One engine's part of an explore across both engines, with its own status and timing
+def explore_engine(db_type):
+    started = time.perf_counter()
+    key = 'tables' if db_type == 'mysql' else 'collections'
+    try:
+        details, cached = explore_schema(db_type)
+        result = {'status': 200, key: details, 'cached': cached}
+    except Exception as e:
+        result = {'status': 500, 'error': str(e)}
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def explore_engines():
+    started = time.perf_counter()
+    futures = {db_type: fanout_executor.submit(explore_engine, db_type) for db_type in ('mysql', 'mongodb')}
+    engines = {db_type: future.result() for db_type, future in futures.items()}
+    return {'db_type': 'all', 'engines': engines, 'total_ms': round((time.perf_counter() - started) * 1000, 3)}
+
+
+# Route to explore MySQL databases and show tables
+@app.route('/api/explore', methods=['POST'])
+def explore():
+    db_type = request.json.get('db_type', '').lower()
+    if request.json.get('refresh'):
+        for name in (('mysql', 'mongodb') if db_type == 'all' else (db_type,)):
+            reset_explore_cache(name)
+
+    if db_type == 'all':
+        return jsonify(explore_engines())
+
+    if db_type == 'mysql':
+        try:
+            table_details, cached = explore_schema('mysql')
+            return jsonify({"db_type": "mysql", "tables": table_details, "cached": cached})
+
+        except Exception as e:
+            return jsonify({"error": str(e)})
+
+
+    elif db_type == 'mongodb':
+        try:
+            collection_details, cached = explore_schema('mongodb')
+            return jsonify({"db_type": "mongodb", "collections": collection_details, "cached": cached})
+
+        except Exception as e:
+            return jsonify({"error": str(e)})
+
+    else:
+        return jsonify({"error": "Invalid database type specified."})
+
+
+
+# JSON forms of the driver values JSON has no type for
+JSON_TYPE_CONVERTERS = {
+    Decimal: str,  # exact digits
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    timedelta: str,  # MySQL TIME columns
+    ObjectId: str,
+    Decimal128: str,
+    bytes: lambda value: value.decode('utf-8', 'replace'),
+    bytearray: lambda value: value.decode('utf-8', 'replace'),
+}
+
+
+def json_default(value):
+    for value_type in type(value).__mro__:
+        converter = JSON_TYPE_CONVERTERS.get(value_type)
+        if converter is not None:
+            return converter(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def stdlib_json_dumps(value):
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_dumps(value):
+    try:
+        return orjson.dumps(value, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # Integers wider than 64 bits and other values orjson refuses
+        return stdlib_json_dumps(value)
+
+
+RESULT_SERIALIZERS = {'orjson': orjson_dumps, 'json': stdlib_json_dumps}
+
+
+# Encode a response body with the configured serializer
+def dumps_json(value):
+    name = app.config['RESULT_SERIALIZER']
+    if name == 'orjson' and orjson is None:
+        name = 'json'
+    return RESULT_SERIALIZERS[name](value)
+
+
+# Routes jsonify() through dumps_json, handing the bytes straight to the response
+class ResultJSONProvider(DefaultJSONProvider):
+    default = staticmethod(json_default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_json(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(dumps_json(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+
+
+app.json = ResultJSONProvider(app)
+
+
+# Mongo documents as rows: headers are every key in first-seen order and
+# documents without a key get null in that column
+def align_documents(documents):
+    headers = list(dict.fromkeys(key for document in documents for key in document))
+    return headers, [[document.get(header) for header in headers] for document in documents]
+
+
+def unique_column_names(headers):
+    seen = collections.Counter()
+    names = []
+    for header in headers:
+        seen[header] += 1
+        names.append(header if seen[header] == 1 else f"{header}_{seen[header]}")
+    return names
+
+
+# Column-oriented form of a result payload: {column: [values...]} instead of
+# one list per row. Repeated column names (e.g. from a join) get a _2, _3 suffix.
+def columnar_payload(payload):
+    payload = dict(payload)
+    headers = unique_column_names(payload.pop('headers'))
+    rows = payload.pop('result')
+    columns = zip(*rows) if rows else ([] for _ in headers)
+    return {'headers': headers, 'columns': dict(zip(headers, columns)), 'rows': len(rows), **payload}
+
+
+# Build the aggregation pipeline for the structured MongoDB query form
+def build_mongo_pipeline(user_query, optimize=None):
+    collection_name = user_query.get('collection')
+    query = user_query.get('query', {})
+    projection = user_query.get('projection')  # Optional projection
+    sort = user_query.get('sort')  # Optional sort
+    limit = user_query.get('limit')  # Optional limit
+    skip = user_query.get('skip')  # Optional skip
+    aggregation = user_query.get('aggregation')  # Optional aggregation pipeline
+    lookup = user_query.get('lookup')  # Optional lookup
+    unwind = user_query.get('unwind')  # Optional unwind
+    group = user_query.get('group')  # Optional group
+
+    pipeline = list(aggregation) if aggregation else []
+
+    if lookup:
+        pipeline.append({
+            '$lookup': {
+                'from': lookup.get('from'),
+                'localField': lookup.get('localField'),
+                'foreignField': lookup.get('foreignField'),
+                'as': lookup.get('as')
+            }
+        })
+    if unwind:
+        pipeline.append({'$unwind': unwind})
+    if group:
+        pipeline.append({'$group': group})
+    if query:
+        pipeline.append({'$match': query})
+    if projection:
+        pipeline.append({'$project': projection})
+    if sort:
+        pipeline.append({'$sort': sort})
+    if skip:
+        pipeline.append({'$skip': skip})
+    if limit:
+        pipeline.append({'$limit': limit})
+    if optimize is None:
+        optimize = app.config['MONGO_PIPELINE_OPTIMIZER']
+    if optimize:
+        pipeline = optimize_mongo_pipeline(pipeline)[0]
+    return collection_name, pipeline
+
+
+# MongoDB pipeline planner. The structured query form always produces
+# $lookup, $unwind, $group, $match, $project, $sort, $skip, $limit in that
+# order; these passes move filtering and limiting in front of the expensive
+# stages wherever the result is provably the same.
+
+def stage_name(stage):
+    return next(iter(stage)) if isinstance(stage, dict) and len(stage) == 1 else None
+
+
+def paths_overlap(first, second):
+    return first == second or first.startswith(second + '.') or second.startswith(first + '.')
+
+
+# Field paths an aggregation expression reads; None if it reads the whole
+# document ($$ROOT, $$CURRENT) or runs code
+def expression_field_paths(expression):
+    if isinstance(expression, str):
+        if expression.startswith(('$$ROOT', '$$CURRENT')):
+            return None
+        return {expression[1:]} if expression.startswith('$') and not expression.startswith('$$') else set()
+    if isinstance(expression, dict):
+        if '$function' in expression or '$accumulator' in expression:
+            return None
+        values = expression.values()
+    elif isinstance(expression, list):
+        values = expression
+    else:
+        return set()
+    paths = set()
+    for value in values:
+        value_paths = expression_field_paths(value)
+        if value_paths is None:
+            return None
+        paths |= value_paths
+    return paths
+
+
+# Field paths a $match filter reads; None if that cannot be told ($where)
+def match_field_paths(query):
+    paths = set()
+    for key, value in query.items():
+        if key in ('$and', '$or', '$nor'):
+            clause_paths = [match_field_paths(clause) for clause in value]
+            if None in clause_paths:
+                return None
+            paths = paths.union(*clause_paths)
+        elif key == '$expr':
+            value_paths = expression_field_paths(value)
+            if value_paths is None:
+                return None
+            paths |= value_paths
+        elif key == '$where':
+            return None
+        elif not key.startswith('$'):  # $text and $comment read no named field
+            paths.add(key)
+    return paths
+
+
+# Field paths a stage adds or replaces, for the stages a $match or $sort
+# may be moved in front of; None for every other stage
+def stage_written_paths(stage):
+    name = stage_name(stage)
+    spec = stage.get(name)
+    if name == '$lookup':
+        return {spec['as']}
+    if name == '$unwind':
+        if isinstance(spec, str):
+            return {spec.lstrip('$')}
+        return {spec['path'].lstrip('$')} | ({spec['includeArrayIndex']} if spec.get('includeArrayIndex') else set())
+    if name in ('$addFields', '$set'):
+        return set(spec)
+    if name in ('$sort', '$match'):
+        return set()
+    return None
+
+
+def is_simple_projection(spec):
+    return all(value in (0, 1, True, False) for value in spec.values())
+
+
+# Whether a field reaches the output of a $project unchanged
+def projection_keeps(spec, path):
+    related = {key: value for key, value in spec.items() if paths_overlap(key, path)}
+    if not related:
+        exclusion = all(value in (0, False) for key, value in spec.items() if key != '_id')
+        return exclusion or path == '_id'
+    return all(value in (1, True) and (path == key or path.startswith(key + '.')) for key, value in related.items())
+
+
+# One $match per top-level condition, so each can move on its own
+def split_matches(pipeline):
+    split = []
+    for stage in pipeline:
+        if stage_name(stage) == '$match' and len(stage['$match']) > 1:
+            split.extend({'$match': {key: value}} for key, value in stage['$match'].items())
+        else:
+            split.append(stage)
+    pipeline[:] = split
+
+
+def merge_adjacent_matches(pipeline):
+    merged = []
+    for stage in pipeline:
+        if stage_name(stage) == '$match' and merged and stage_name(merged[-1]) == '$match':
+            previous = merged[-1]['$match']
+            if set(previous).isdisjoint(stage['$match']):
+                merged[-1] = {'$match': {**previous, **stage['$match']}}
+            else:
+                merged[-1] = {'$match': {'$and': [previous, stage['$match']]}}
+        else:
+            merged.append(stage)
+    pipeline[:] = merged
+
+
+# Move each $match condition in front of the stages it does not depend on:
+# $lookup, $unwind, $addFields/$set that write none of the fields it reads,
+# $sort and other conditions
+def push_down_matches(pipeline, rewrites):
+    split_matches(pipeline)
+    for index in range(len(pipeline)):
+        if stage_name(pipeline[index]) != '$match':
+            continue
+        reads = match_field_paths(pipeline[index]['$match'])
+        target = index
+        while target > 0 and reads is not None:
+            written = stage_written_paths(pipeline[target - 1])
+            if written is None or any(paths_overlap(read, path) for read in reads for path in written):
+                break
+            target -= 1
+        if target < index:
+            passed = [stage_name(stage) for stage in pipeline[target:index]]
+            pipeline.insert(target, pipeline.pop(index))
+            rewrites.append(f"Moved $match on {', '.join(sorted(reads)) or 'text'} ahead of {', '.join(passed)}")
+    merge_adjacent_matches(pipeline)
+
+
+# Whether a $sort/$limit block can move in front of a stage: the stage must
+# keep one document per input document and leave the sort keys unchanged
+def sort_commutes_with(stage, sort_keys):
+    name = stage_name(stage)
+    if name == '$project':
+        spec = stage['$project']
+        return is_simple_projection(spec) and all(projection_keeps(spec, key) for key in sort_keys)
+    if name in ('$lookup', '$addFields', '$set'):
+        written = stage_written_paths(stage)
+        return not any(paths_overlap(key, path) for key in sort_keys for path in written)
+    return False
+
+
+# $sort [+ $skip] + $limit becomes a top-k sort of skip + limit documents
+# (the server keeps only k documents in memory), moved in front of $lookup
+# and $project so only the k documents that are returned get joined
+def merge_sort_limit(pipeline, rewrites):
+    index = 0
+    while index < len(pipeline):
+        if stage_name(pipeline[index]) != '$sort':
+            index += 1
+            continue
+        following = [stage_name(stage) for stage in pipeline[index + 1:index + 3]]
+        if following[:2] == ['$skip', '$limit']:
+            skip, limit, end = pipeline[index + 1]['$skip'], pipeline[index + 2]['$limit'], index + 3
+        elif following[:1] == ['$limit']:
+            skip, limit, end = 0, pipeline[index + 1]['$limit'], index + 2
+        else:
+            index += 1
+            continue
+        if not isinstance(skip, int) or not isinstance(limit, int):
+            index += 1
+            continue
+        block = [pipeline[index], {'$limit': skip + limit}] + ([{'$skip': skip}] if skip else [])
+        rewrites.append(f"Merged $sort and $limit into a top-{skip + limit} sort")
+        sort_keys = list(pipeline[index]['$sort'])
+        target = index
+        while target > 0 and sort_commutes_with(pipeline[target - 1], sort_keys):
+            target -= 1
+        if target < index:
+            passed = [stage_name(stage) for stage in pipeline[target:index]]
+            rewrites.append(f"Moved the top-{skip + limit} sort ahead of {', '.join(passed)}")
+        pipeline[index:end] = []
+        pipeline[target:target] = block
+        index = target + len(block)
+
+
+# Fields a $lookup needs from the documents it joins
+def lookup_read_paths(spec):
+    if 'localField' in spec:
+        return {spec['localField']}
+    return expression_field_paths(spec.get('let', {}))
+
+
+# The $project that follows a $lookup, and the fields the $lookup and the
+# stages up to that $project read; (None, None) if another kind of stage
+# comes first or the fields cannot be told
+def projection_after_lookup(pipeline, lookup_index):
+    reads = lookup_read_paths(pipeline[lookup_index]['$lookup'])
+    for stage in pipeline[lookup_index + 1:]:
+        name = stage_name(stage)
+        if reads is None:
+            break
+        if name == '$project':
+            return stage['$project'], reads
+        if name == '$unwind':
+            reads = reads | stage_written_paths(stage)
+        elif name == '$match':
+            match_paths = match_field_paths(stage['$match'])
+            reads = None if match_paths is None else reads | match_paths
+        elif name == '$sort':
+            reads = reads | set(stage['$sort'])
+        elif name not in ('$skip', '$limit'):
+            break
+    return None, None
+
+
+# A simple $project after a $lookup also goes in front of it, trimmed to the
+# fields the $lookup and the stages up to the $project need, so smaller
+# documents flow through the join. The original $project stays in place.
+def project_before_lookup(pipeline, rewrites):
+    for lookup_index, stage in enumerate(pipeline):
+        if stage_name(stage) != '$lookup':
+            continue
+        projection, reads = projection_after_lookup(pipeline, lookup_index)
+        if projection is None or not is_simple_projection(projection):
+            continue
+        joined = stage['$lookup']['as']
+        reads = {path for path in reads if not paths_overlap(path, joined)}
+        if all(value in (0, False) for key, value in projection.items() if key != '_id'):
+            early = {key: 0 for key in projection
+                     if not paths_overlap(key, joined) and not any(paths_overlap(key, path) for path in reads)}
+        else:
+            keep = {key for key, value in projection.items() if value in (1, True) and not paths_overlap(key, joined)} | reads
+            # A parent path already includes its children
+            early = {key: 1 for key in sorted(keep) if not any(key.startswith(other + '.') for other in keep)}
+        if early and early != projection:
+            pipeline.insert(lookup_index, {'$project': early})
+            rewrites.append(f"Added $project of {', '.join(early)} ahead of $lookup from {stage['$lookup'].get('from')}")
+        return
+
+
+def optimize_mongo_pipeline(pipeline):
+    pipeline = list(pipeline)
+    rewrites = []
+    push_down_matches(pipeline, rewrites)
+    merge_sort_limit(pipeline, rewrites)
+    project_before_lookup(pipeline, rewrites)
+    return pipeline, rewrites
+
+
+# Indexes that can serve the $match and $sort a pipeline starts with (only
+# leading stages can use an index), and a suggested index when none can.
+# Equality fields come first in the suggestion, then sort keys, then ranges.
+def mongo_index_report(collection, pipeline):
+    indexes = {name: [key for key, _ in info['key']] for name, info in collection.index_information().items()}
+    leading = list(pipeline[:2])
+    match = leading.pop(0)['$match'] if leading and stage_name(leading[0]) == '$match' else {}
+    sort = leading[0]['$sort'] if leading and stage_name(leading[0]) == '$sort' else {}
+    equality = [key for key, value in match.items() if not key.startswith('$') and
+                (not isinstance(value, dict) or set(value) <= {'$eq', '$in'})]
+    ranges = [key for key in match if not key.startswith('$') and key not in equality]
+    report = {
+        'indexes': indexes,
+        'match_fields': equality + ranges,
+        'match_indexes': sorted(name for name, keys in indexes.items() if keys[0] in match),
+        'sort_fields': list(sort),
+        'sort_indexes': sorted(name for name, keys in indexes.items() if sort and keys[:len(sort)] == list(sort))
+    }
+    if (match and not report['match_indexes']) or (sort and not report['sort_indexes']):
+        suggested = dict.fromkeys(equality, 1)
+        suggested.update((key, direction) for key, direction in sort.items() if key not in suggested)
+        suggested.update((key, 1) for key in ranges if key not in suggested)
+        report['suggested_index'] = suggested
+    return report
+
+
+# Plan for the explain flag: the pipeline as written and as rewritten, the
+# rewrites applied, index coverage and the server's own explain output
+def explain_mongo_query(user_query):
+    collection_name, original = build_mongo_pipeline(user_query, optimize=False)
+    if app.config['MONGO_PIPELINE_OPTIMIZER']:
+        pipeline, rewrites = optimize_mongo_pipeline(original)
+    else:
+        pipeline, rewrites = original, []
+    db = get_mongo_connection()
+    plan = {
+        'collection': collection_name,
+        'original_pipeline': original,
+        'pipeline': pipeline,
+        'rewrites': rewrites,
+        'index_report': mongo_index_report(db[collection_name], pipeline)
+    }
+    try:
+        plan['server_explain'] = db.command('aggregate', collection_name, pipeline=pipeline, explain=True)
+    except Exception as e:
+        plan['server_explain'] = {'error': str(e)}
+    return plan
+
+
+# MySQL error for a SELECT stopped by its MAX_EXECUTION_TIME hint
+MYSQL_QUERY_TIMEOUT_ERRNO = 3024
+
+
+class QueryRejectedError(Exception):
+    pass
+
+
+@app.errorhandler(QueryRejectedError)
+def handle_query_rejected(e):
+    return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
+
+
+# Per-engine concurrency limit for /api/execute_query. Queries past the limit
+# wait in a bounded queue; a full queue, or a wait longer than
+# QUERY_QUEUE_TIMEOUT, rejects the request with 429 instead of letting it pile
+# up on the connection pools.
+class QueryAdmission:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._running = collections.Counter()
+        self._waiting = collections.Counter()
+        self.counters = {'admitted': collections.Counter(), 'queued': collections.Counter(),
+                         'rejected': collections.Counter()}
+
+    # blocking=False returns False instead of queueing when no slot is free
+    def acquire(self, db_type, blocking=True):
+        limit = app.config['QUERY_CONCURRENCY'][db_type]
+        with self._condition:
+            if self._running[db_type] >= limit or self._waiting[db_type]:
+                if not blocking:
+                    return False
+                if self._waiting[db_type] >= app.config['QUERY_QUEUE_SIZE']:
+                    self.counters['rejected'][db_type] += 1
+                    raise QueryRejectedError(f"Too many {db_type} queries waiting; try again shortly")
+                self.counters['queued'][db_type] += 1
+                self._waiting[db_type] += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self._running[db_type] < limit,
+                                                        app.config['QUERY_QUEUE_TIMEOUT'])
+                finally:
+                    self._waiting[db_type] -= 1
+                if not admitted:
+                    self.counters['rejected'][db_type] += 1
+                    raise QueryRejectedError(f"No {db_type} query slot free within "
+                                             f"{app.config['QUERY_QUEUE_TIMEOUT']}s; try again shortly")
+            self._running[db_type] += 1
+            self.counters['admitted'][db_type] += 1
+        return True
+
+    def release(self, db_type):
+        with self._condition:
+            self._running[db_type] -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            stats = {'running': dict(self._running), 'waiting': dict(self._waiting)}
+            stats.update((name, dict(counter)) for name, counter in self.counters.items())
+        for values in stats.values():
+            for db_type in app.config['QUERY_CONCURRENCY']:
+                values.setdefault(db_type, 0)
+        return stats
+
+
+# A query admitted to run. Its engine registers a callback that stops it on
+# the server (KILL QUERY, killOp); cancel() calls it for a client's cancel
+# request or, with reason 'timeout', when the budget runs out.
+class RunningQuery:
+    def __init__(self, query_id, db_type, budget_ms):
+        self.id = query_id
+        self.db_type = db_type
+        self.budget_ms = budget_ms
+        self.deadline = time.monotonic() + budget_ms / 1000 if budget_ms else None
+        self.reason = None
+        self.finished = False
+        # Set while a stream holds the query open past the request handler
+        self.detached = False
+        self._cancel = None
+        self._lock = threading.Lock()
+
+    def remaining_ms(self):
+        if self.deadline is None:
+            return None
+        return max(1, int((self.deadline - time.monotonic()) * 1000))
+
+    # Cleared (None) before the query's connection is released, so a late
+    # cancel never reaches a query that reused it
+    def set_cancel(self, callback):
+        with self._lock:
+            self._cancel = callback
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.finished or self.reason is not None:
+                return False
+            self.reason = reason
+            if self._cancel is not None:
+                try:
+                    self._cancel()
+                except Exception as e:
+                    app.logger.warning("Could not stop query %s: %s", self.id, e)
+        return True
+
+    def finish(self):
+        with self._lock:
+            finished, self.finished = self.finished, True
+        return not finished
+
+
+# Queries running through /api/execute_query, by id, with a watchdog thread
+# that cancels each one when its deadline passes
+class RunningQueries:
+    def __init__(self):
+        self._queries = {}
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._watchdog = None
+        self.counters = {'started': 0, 'timed_out': 0, 'cancelled': 0}
+
+    def start(self, query_id, db_type, budget_ms):
+        query = RunningQuery(query_id or uuid.uuid4().hex, db_type, budget_ms)
+        with self._condition:
+            if query.id in self._queries:
+                raise ValueError(f"A query with id '{query.id}' is already running")
+            self._queries[query.id] = query
+            self.counters['started'] += 1
+            if query.deadline is not None:
+                heapq.heappush(self._deadlines, (query.deadline, next(self._sequence), query))
+                if self._watchdog is None:
+                    self._watchdog = threading.Thread(target=self._watch, name='query-watchdog', daemon=True)
+                    self._watchdog.start()
+                self._condition.notify()
+        return query
+
+    # True for the first call only
+    def finish(self, query):
+        if not query.finish():
+            return False
+        with self._condition:
+            if self._queries.get(query.id) is query:
+                del self._queries[query.id]
+        return True
+
+    def cancel(self, query_id, reason='cancelled'):
+        with self._condition:
+            query = self._queries.get(query_id)
+        return query is not None and self._cancel(query, reason)
+
+    def _cancel(self, query, reason):
+        if not query.cancel(reason):
+            return False
+        with self._condition:
+            self.counters['timed_out' if reason == 'timeout' else 'cancelled'] += 1
+        return True
+
+    def _watch(self):
+        while True:
+            with self._condition:
+                while not self._deadlines or self._deadlines[0][0] > time.monotonic():
+                    self._condition.wait(self._deadlines[0][0] - time.monotonic() if self._deadlines else None)
+                _, _, query = heapq.heappop(self._deadlines)
+            self._cancel(query, 'timeout')
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self.counters)
+            stats['running'] = len(self._queries)
+        return stats
+
+
+query_admission = QueryAdmission()
+running_queries = RunningQueries()
+
+
+# Budget for one request: QUERY_TIMEOUT_MS, or a lower timeout_ms it asks for
+def query_budget_ms(options):
+    budget = app.config['QUERY_TIMEOUT_MS']
+    if options.get('timeout_ms') is not None:
+        requested = int(options['timeout_ms'])
+        if requested <= 0:
+            raise ValueError('timeout_ms must be a positive number of milliseconds')
+        budget = min(requested, budget) if budget else requested
+    return budget or None
+
+
+# Wait for a query slot of the engine, then register the query and its deadline
+def admit_query(db_type, query_id, budget_ms, admitted=False):
+    if not admitted:
+        query_admission.acquire(db_type)
+    try:
+        return running_queries.start(query_id, db_type, budget_ms)
+    except Exception:
+        query_admission.release(db_type)
+        raise
+
+
+def finish_query(query):
+    if running_queries.finish(query):
+        query_admission.release(query.db_type)
+
+
+# Add a MAX_EXECUTION_TIME hint to a SELECT so the server itself stops it
+# when the budget runs out; other statements rely on the watchdog's KILL QUERY
+def with_execution_time_hint(user_query, analysis, budget_ms):
+    if not budget_ms or analysis['statement'] != 'select':
+        return user_query
+    match = re.match(r'\s*select\b(?!\s*/\*\+)', user_query, re.IGNORECASE)
+    if match is None:
+        return user_query
+    return f"{user_query[:match.end()]} /*+ MAX_EXECUTION_TIME({int(budget_ms)}) */{user_query[match.end():]}"
+
+
+# KILL QUERY from a separate, unpooled connection, so it works even when the
+# pool is exhausted
+def kill_mysql_query(connection_id):
+    conn = mysql.connector.connect(**get_mysql_pool().connect_options)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"KILL QUERY {int(connection_id)}")
+        cursor.close()
+    finally:
+        conn.close()
+
+
+# killOp for the operations tagged with the query's id as their comment
+def kill_mongo_query(query_id):
+    admin = get_mongo_client().admin
+    for operation in admin.aggregate([{'$currentOp': {}}, {'$match': {'command.comment': query_id}}]):
+        admin.command('killOp', op=operation['opid'])
+
+
+# aggregate() options that tag a MongoDB query with its id and budget
+def mongo_query_options(query):
+    if query is None:
+        return {}
+    query.set_cancel(functools.partial(kill_mongo_query, query.id))
+    options = {'comment': query.id}
+    if query.deadline is not None:
+        options['maxTimeMS'] = query.remaining_ms()
+    return options
+
+
+# Error payload and status for a failed query: 504 when its budget ran out,
+# 409 when it was cancelled, 400 otherwise
+def query_error_payload(query, error):
+    if query is None:
+        return {'error': str(error)}, 400
+    reason = query.reason
+    # mysql.connector errors carry errno; PyMySQL's (aiomysql) have the code first in args
+    code = getattr(error, 'errno', None)
+    if code is None and isinstance(error, Exception) and error.args:
+        code = error.args[0]
+    if reason is None and (code == MYSQL_QUERY_TIMEOUT_ERRNO or isinstance(error, ExecutionTimeout)):
+        reason = 'timeout'
+    if reason == 'timeout':
+        return {'error': f"Query exceeded its time budget of {query.budget_ms} ms", 'query_id': query.id}, 504
+    if reason == 'cancelled':
+        return {'error': 'Query was cancelled', 'query_id': query.id}, 409
+    return {'error': str(error)}, 400
+
+
+def query_error_response(query, error):
+    payload, status = query_error_payload(query, error)
+    return jsonify(payload), status
+
+
+# A query result that is read incrementally from a server-side cursor.
+# close(exhausted=False) releases the cursor without reading the rest.
+class QueryResult:
+    def __init__(self, db_type, headers, rows, close):
+        self.db_type = db_type
+        self.headers = headers
+        self.rows = rows
+        self._close = close
+        self.rows_sent = 0
+        self.bytes_sent = 0
+
+    def close(self, exhausted=True):
+        if self._close is not None:
+            close, self._close = self._close, None
+            close(exhausted)
+
+
+def open_mysql_result(user_query, fetch_size, params=None, query=None):
+    conn = get_db_connection()
+    if query is not None:
+        query.set_cancel(functools.partial(kill_mysql_query, conn.connection_id))
+    try:
+        # Unbuffered: rows stay on the server until fetched
+        cursor = conn.cursor(buffered=False)
+        with stage_timer('mysql_execute'):
+            cursor.execute(user_query, params)
+    except Exception:
+        if query is not None:
+            query.set_cancel(None)
+        conn.close()
+        raise
+
+    if cursor.description is None:
+        # Statement without a result set (INSERT, UPDATE, DDL, ...)
+        conn.commit()
+        cursor.close()
+        if query is not None:
+            query.set_cancel(None)
+        conn.close()
+        return QueryResult('mysql', [], iter(()), None)
+
+    def rows():
+        while True:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                return
+            yield from batch
+
+    def close(exhausted):
+        if query is not None:
+            query.set_cancel(None)
+        if exhausted:
+            cursor.close()
+            conn.close()
+        else:
+            conn.discard()
+
+    headers = [desc[0] for desc in cursor.description]
+    return QueryResult('mysql', headers, rows(), close)
+
+
+def open_mongo_result(user_query, fetch_size, query=None):
+    collection_name, pipeline = build_mongo_pipeline(user_query)
+    return open_mongo_pipeline(collection_name, pipeline, fetch_size, query)
+
+
+def open_mongo_pipeline(collection_name, pipeline, fetch_size, query=None):
+    with stage_timer('mongodb_execute'):
+        cursor = get_mongo_connection()[collection_name].aggregate(pipeline, batchSize=fetch_size,
+                                                                   **mongo_query_options(query))
+        first = next(cursor, None)
+    if first is None:
+        cursor.close()
+        return QueryResult('mongodb', [], iter(()), None)
+    # Documents need not share keys: headers grows as new ones turn up, so a
+    # row is as long as the headers were when it was read (see pad_rows)
+    headers = list(first.keys())
+    seen = set(headers)
+
+    def rows():
+        for document in itertools.chain([first], cursor):
+            for key in document:
+                if key not in seen:
+                    seen.add(key)
+                    headers.append(key)
+            yield [document.get(header) for header in headers]
+
+    return QueryResult('mongodb', headers, rows(), lambda exhausted: cursor.close())
+
+
+def open_query_result(db_type, user_query, query=None):
+    fetch_size = app.config['RESULT_FETCH_SIZE']
+    if db_type == 'mysql':
+        return open_mysql_result(user_query, fetch_size, query=query)
+    return open_mongo_result(json.loads(user_query), fetch_size, query)
+
+
+# Open results that clients page through with a cursor token
+class CursorRegistry:
+    def __init__(self):
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        timeout = app.config['CURSOR_IDLE_TIMEOUT']
+        with self._lock:
+            expired = [token for token, (result, last_used) in self._cursors.items() if now - last_used > timeout]
+            expired_results = [self._cursors.pop(token)[0] for token in expired]
+        for result in expired_results:
+            result.close(exhausted=False)
+
+    def open(self, result):
+        self._expire()
+        with self._lock:
+            if len(self._cursors) >= app.config['MAX_OPEN_CURSORS']:
+                return None
+            token = uuid.uuid4().hex
+            self._cursors[token] = (result, time.monotonic())
+        return token
+
+    # Remove the cursor while a request reads from it, so it is never used concurrently
+    def take(self, token):
+        self._expire()
+        with self._lock:
+            entry = self._cursors.pop(token, None)
+        return entry[0] if entry else None
+
+    def put_back(self, token, result):
+        with self._lock:
+            self._cursors[token] = (result, time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            return {'open': len(self._cursors)}
+
+
+cursor_registry = CursorRegistry()
+
+
+def row_limits(options):
+    max_rows = app.config['RESULT_MAX_ROWS']
+    if options.get('max_rows'):
+        max_rows = min(int(options['max_rows']), max_rows)
+    return max_rows, app.config['RESULT_MAX_BYTES']
+
+
+# Extend rows read before a MongoDB result met a new key to the full width, with null
+def pad_rows(rows, width):
+    for row in rows:
+        if len(row) < width:
+            row.extend([None] * (width - len(row)))
+    return rows
+
+
+# Stream a result as NDJSON (one row per line) or as one chunked JSON document.
+# Columns that first appear after the header (MongoDB documents with new keys)
+# are announced by another headers line in NDJSON, and listed as headers_added
+# at the end of the JSON document.
+def stream_query_result(result, fmt, max_rows, max_bytes):
+    def generate():
+        exhausted = False
+        truncated = False
+        announced = width = len(result.headers)
+        try:
+            if fmt == 'ndjson':
+                yield json.dumps({'headers': result.headers}) + '\n'
+            else:
+                yield '{"headers": ' + json.dumps(result.headers) + ', "result": ['
+            for row in result.rows:
+                if result.rows_sent >= max_rows or result.bytes_sent >= max_bytes:
+                    truncated = True
+                    break
+                if len(row) > width:
+                    width = len(row)
+                    if fmt == 'ndjson':
+                        yield json.dumps({'headers': result.headers[:width]}) + '\n'
+                line = dumps_json(row)
+                if fmt == 'ndjson':
+                    line += b'\n'
+                elif result.rows_sent:
+                    line = b', ' + line
+                result.rows_sent += 1
+                result.bytes_sent += len(line)
+                yield line
+            else:
+                exhausted = True
+            summary = {'rows': result.rows_sent, 'truncated': truncated}
+            metrics.inc('chatdb_rows_returned_total', result.rows_sent, db_type=result.db_type)
+            metrics.inc('chatdb_http_response_bytes_total', result.bytes_sent, endpoint=request.url_rule.rule)
+            if fmt == 'ndjson':
+                yield json.dumps(summary) + '\n'
+            else:
+                added = result.headers[announced:width]
+                yield ('], "rows": ' + json.dumps(summary['rows']) + ', "truncated": ' + json.dumps(truncated)
+                       + (', "headers_added": ' + json.dumps(added) if added else '') + '}')
+        finally:
+            result.close(exhausted)
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+EXPORT_MIMETYPES = {'arrow': 'application/vnd.apache.arrow.stream', 'parquet': 'application/vnd.apache.parquet'}
+EXPORT_EXTENSIONS = {'arrow': 'arrows', 'parquet': 'parquet'}
+
+
+# Write-only file that hands back what was written since the last drain, so
+# the Arrow/Parquet writers can be streamed out batch by batch. tell() keeps
+# counting across drains because Parquet records absolute offsets.
+class ExportSink(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Text form of a value for a column without a single Arrow type
+def arrow_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list, tuple)):
+        return dumps_json(value).decode('utf-8')
+    try:
+        return str(json_default(value))
+    except TypeError:
+        return str(value)
+
+
+# A column of the first batch, in the type Arrow infers from its values.
+# Decimals get the widest precision so later batches fit; mixed or
+# unsupported values (ObjectId, ...) and all-null columns become strings.
+def infer_arrow_column(values):
+    try:
+        array = pa.array(values)
+    except (pa.ArrowException, TypeError, ValueError):
+        return pa.array([arrow_text(value) for value in values], pa.string())
+    if pa.types.is_null(array.type):
+        return array.cast(pa.string())
+    if pa.types.is_decimal(array.type):
+        return array.cast(pa.decimal128(38, array.type.scale))
+    return array
+
+
+# A column of a later batch in the type chosen for the first one.
+# Returns the array and how many values did not fit and were written as null.
+def arrow_column(values, arrow_type):
+    try:
+        return pa.array(values, type=arrow_type), 0
+    except (pa.ArrowException, TypeError, ValueError):
+        pass
+    if pa.types.is_string(arrow_type):
+        return pa.array([arrow_text(value) for value in values], arrow_type), 0
+    fitted = []
+    for value in values:
+        try:
+            pa.array([value], type=arrow_type)
+            fitted.append(value)
+        except (pa.ArrowException, TypeError, ValueError):
+            fitted.append(None)
+    return pa.array(fitted, type=arrow_type), fitted.count(None) - values.count(None)
+
+
+def open_export_writer(fmt, sink, schema):
+    if fmt == 'parquet':
+        return pq.ParquetWriter(sink, schema)
+    return pa.ipc.new_stream(sink, schema)
+
+
+# Stream a result as an Arrow IPC stream or a Parquet file, converting
+# EXPORT_BATCH_ROWS rows at a time into record batches (one Parquet row group
+# each). The schema is fixed by the first batch, so MongoDB keys that first
+# appear later cannot be added; they are listed as columns_dropped. The row
+# count, truncation and dropped values and columns are written as metadata:
+# on a final empty record batch for Arrow, in the file footer for Parquet.
+def export_query_result(result, fmt, max_rows, max_bytes):
+    batch_rows = app.config['EXPORT_BATCH_ROWS']
+
+    def generate():
+        exhausted = False
+        truncated = False
+        dropped = 0
+        width = 0
+        sink = ExportSink()
+        schema = writer = None
+        try:
+            while True:
+                if result.rows_sent >= max_rows or result.bytes_sent >= max_bytes:
+                    truncated = next(result.rows, None) is not None
+                    break
+                rows = list(itertools.islice(result.rows, min(batch_rows, max_rows - result.rows_sent)))
+                if not rows:
+                    break
+                if writer is None:
+                    columns = [list(values) for values in zip(*pad_rows(rows, len(result.headers)))]
+                    arrays = [infer_arrow_column(values) for values in columns]
+                    names = unique_column_names(result.headers)
+                    schema = pa.schema([pa.field(name, array.type) for name, array in zip(names, arrays)])
+                    writer = open_export_writer(fmt, sink, schema)
+                else:
+                    width = max(width, *(len(row) for row in rows))
+                    columns = [list(values) for values in zip(*(row[:len(schema)] for row in rows))]
+                    arrays = []
+                    for values, field in zip(columns, schema):
+                        array, lost = arrow_column(values, field.type)
+                        arrays.append(array)
+                        dropped += lost
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+                result.rows_sent += len(rows)
+                chunk = sink.drain()
+                result.bytes_sent += len(chunk)
+                yield chunk
+            exhausted = not truncated
+
+            if writer is None:
+                schema = pa.schema([pa.field(name, pa.string()) for name in unique_column_names(result.headers)])
+                writer = open_export_writer(fmt, sink, schema)
+            columns_dropped = result.headers[len(schema):width]
+            summary = {'rows': str(result.rows_sent), 'truncated': json.dumps(truncated), 'values_dropped': str(dropped),
+                       'columns_dropped': json.dumps(columns_dropped)}
+            if fmt == 'parquet':
+                writer.add_key_value_metadata(summary)
+            else:
+                writer.write_batch(pa.RecordBatch.from_pylist([], schema=schema), custom_metadata=summary)
+            writer.close()
+            chunk = sink.drain()
+            result.bytes_sent += len(chunk)
+            yield chunk
+            if dropped:
+                app.logger.warning("Export wrote %d values that did not fit their column type as null", dropped)
+            if columns_dropped:
+                app.logger.warning("Export left out columns that first appeared after the first batch: %s",
+                                   ', '.join(columns_dropped))
+            metrics.inc('chatdb_rows_returned_total', result.rows_sent, db_type=result.db_type)
+            metrics.inc('chatdb_http_response_bytes_total', result.bytes_sent, endpoint=request.url_rule.rule)
+        finally:
+            result.close(exhausted)
+
+    headers = {'Content-Disposition': f'attachment; filename="result.{EXPORT_EXTENSIONS[fmt]}"'}
+    return Response(stream_with_context(generate()), mimetype=EXPORT_MIMETYPES[fmt], headers=headers)
+
+
+# Read one page from a result; keep the cursor open under a token if rows remain
+def page_query_result(result, page_size, max_rows, token=None):
+    page_size = max(1, min(page_size, max_rows - result.rows_sent))
+    with stage_timer(f"{result.db_type}_fetch"):
+        page = list(itertools.islice(result.rows, page_size))
+    result.rows_sent += len(page)
+    metrics.inc('chatdb_rows_returned_total', len(page), db_type=result.db_type)
+
+    # Columns only ever get added, so a later page's headers extend this one's
+    headers = list(result.headers)
+    response = {'headers': headers, 'result': pad_rows(page, len(headers)), 'next_cursor': None, 'truncated': False}
+    following = next(result.rows, None)
+    if following is None:
+        result.close()
+        return response
+    if result.rows_sent >= max_rows:
+        result.close(exhausted=False)
+        response['truncated'] = True
+        return response
+
+    # Push the peeked row back in front of the remaining rows
+    result.rows = itertools.chain([following], result.rows)
+    if token is not None:
+        cursor_registry.put_back(token, result)
+    else:
+        token = cursor_registry.open(result)
+        if token is None:
+            result.close(exhausted=False)
+            response['truncated'] = True
+            response['error'] = 'Too many open cursors; result truncated to the first page'
+            return response
+    response['next_cursor'] = token
+    return response
+
+
+# LRU cache of serialized read-only query responses with a memory budget and
+# per-entry TTL. Entries remember the tables they read so writes and uploads
+# can drop exactly the affected entries.
+class QueryResultCache:
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+        self._by_table = collections.defaultdict(set)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            if time.monotonic() > entry['expires']:
+                self._remove(key)
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry['body']
+
+    def put(self, key, body, tables):
+        size = len(body)
+        max_bytes = app.config['QUERY_CACHE_MAX_BYTES']
+        if size > min(app.config['QUERY_CACHE_MAX_ENTRY_BYTES'], max_bytes):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._bytes + size > max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+            self._entries[key] = {
+                'body': body,
+                'size': size,
+                'tables': tables,
+                'expires': time.monotonic() + app.config['QUERY_CACHE_TTL']
+            }
+            self._bytes += size
+            for table in tables:
+                self._by_table[table].add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+        for table in entry['tables']:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    # Drop entries that read the given table; name=None drops every entry of db_type
+    def invalidate(self, db_type, name=None):
+        with self._lock:
+            if name is None:
+                keys = [key for key in self._entries if key[0] == db_type]
+            else:
+                keys = list(self._by_table.get((db_type, name.lower()), ()))
+            for key in keys:
+                self._remove(key)
+            self.counters['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+query_cache = QueryResultCache()
+
+SQL_READ_STATEMENTS = {'select', 'show', 'describe', 'desc', 'explain', 'with'}
+# Reads whose result changes without any write, or that take locks
+SQL_UNCACHEABLE_PATTERN = re.compile(
+    r'\b(?:now|rand|uuid|uuid_short|sysdate|curdate|curtime|current_date|current_time|current_timestamp|'
+    r'localtime|localtimestamp|unix_timestamp|utc_date|utc_time|utc_timestamp|connection_id|last_insert_id|'
+    r'found_rows|sleep|get_lock|benchmark)\b|\bfor\s+update\b|\block\s+in\s+share\s+mode\b|\binto\s+(?:outfile|dumpfile|@)',
+    re.IGNORECASE
+)
+SQL_SCHEMA_STATEMENTS = {'create', 'drop', 'alter', 'rename', 'truncate'}
+SQL_IDENTIFIER = r'`?([\w$]+)`?(?:\.`?([\w$]+)`?)?'
+SQL_READ_TABLE_PATTERN = re.compile(r'\b(?:from|join)\s+' + SQL_IDENTIFIER + r'((?:\s*(?:as\s+)?\w*\s*,\s*' + SQL_IDENTIFIER + r')*)', re.IGNORECASE)
+SQL_WRITE_TABLE_PATTERN = re.compile(
+    r'^\s*(?:insert(?:\s+ignore)?\s+(?:into\s+)?|replace\s+(?:into\s+)?|update\s+(?:ignore\s+)?|'
+    r'delete\s+(?:\w+\s+)*?from\s+|truncate\s+(?:table\s+)?|alter\s+table\s+|'
+    r'create\s+(?:temporary\s+)?table\s+(?:if\s+not\s+exists\s+)?|'
+    r'drop\s+(?:temporary\s+)?tables?\s+(?:if\s+exists\s+)?|rename\s+tables?\s+)' + SQL_IDENTIFIER,
+    re.IGNORECASE
+)
+SQL_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+# Statements that describe one table: DESCRIBE t, SHOW COLUMNS/INDEX FROM t, SHOW CREATE TABLE t
+SQL_TABLE_METADATA_PATTERN = re.compile(
+    r'^\s*(?:(?:describe|desc|explain)\s+(?!(?:select|with|table|insert|update|delete|replace|format|analyze|'
+    r'extended|partitions)\b)|show\s+(?:full\s+)?(?:columns|fields|index|indexes|keys)\s+(?:from|in)\s+|'
+    r'show\s+create\s+table\s+)' + SQL_IDENTIFIER,
+    re.IGNORECASE
+)
+# Reads of the server's own schemas, whose results change with any DDL or upload
+SQL_SYSTEM_SCHEMA_PATTERN = re.compile(r'\b(?:information_schema|performance_schema|mysql|sys)`?\s*\.', re.IGNORECASE)
+
+
+def qualified_table_name(first, second):
+    # db.table -> table; the cache tracks tables of the connection's database
+    return (second or first).lower()
+
+
+# Collapse whitespace outside string literals and drop trailing semicolons
+def normalize_sql(query):
+    parts = []
+    last = 0
+    for match in SQL_STRING_LITERAL.finditer(query):
+        parts.append(re.sub(r'\s+', ' ', query[last:match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(re.sub(r'\s+', ' ', query[last:]))
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+# Work out what a query reads and writes:
+# {'read_only', 'cacheable', 'tables' (read), 'writes' (None = unknown, so all), 'schema_change'}
+def analyze_sql_query(query):
+    normalized = normalize_sql(query)
+    without_literals = SQL_STRING_LITERAL.sub("''", normalized)
+    keyword = (re.match(r'[\s(]*(\w+)', without_literals) or [None, ''])[1].lower()
+    tables = set()
+    for match in SQL_READ_TABLE_PATTERN.finditer(without_literals):
+        tables.add(qualified_table_name(match.group(1), match.group(2)))
+        for extra in re.finditer(SQL_IDENTIFIER, match.group(3) or ''):
+            if extra.group(1).lower() != 'as':
+                tables.add(qualified_table_name(extra.group(1), extra.group(2)))
+    metadata = SQL_TABLE_METADATA_PATTERN.match(without_literals)
+    if metadata:
+        tables.add(qualified_table_name(metadata.group(1), metadata.group(2)))
+    # Other SHOW statements (SHOW TABLES, SHOW DATABASES, ...) and system schema
+    # reads have no table whose writes would invalidate them
+    table_less_metadata = (keyword == 'show' and metadata is None) or SQL_SYSTEM_SCHEMA_PATTERN.search(without_literals)
+    read_only = keyword in SQL_READ_STATEMENTS and not re.search(r'\b(?:insert|update|delete|replace)\b', without_literals, re.IGNORECASE)
+    analysis = {
+        'normalized': normalized,
+        'statement': keyword,
+        'read_only': read_only,
+        'cacheable': read_only and not SQL_UNCACHEABLE_PATTERN.search(without_literals) and not table_less_metadata,
+        'tables': tables,
+        'writes': set(),
+        'schema_change': keyword in SQL_SCHEMA_STATEMENTS
+    }
+    if not read_only:
+        match = SQL_WRITE_TABLE_PATTERN.match(without_literals)
+        analysis['writes'] = {qualified_table_name(match.group(1), match.group(2))} if match else None
+        if match and keyword in ('drop', 'rename'):
+            # DROP TABLE a, b / RENAME TABLE a TO b, c TO d touch every listed table
+            analysis['writes'].update(qualified_table_name(m.group(1), m.group(2))
+                                      for m in re.finditer(SQL_IDENTIFIER, without_literals[match.end():])
+                                      if m.group(1).lower() not in ('to', 'if', 'exists', 'restrict', 'cascade'))
+    return analysis
+
+
+# Collections an aggregation pipeline reads ($lookup, $graphLookup, $unionWith, nested pipelines)
+def pipeline_collections(pipeline):
+    names = set()
+    for stage in pipeline:
+        for operator, spec in stage.items():
+            if operator in ('$lookup', '$graphLookup') and isinstance(spec, dict):
+                if spec.get('from'):
+                    names.add(spec['from'])
+                names |= pipeline_collections(spec.get('pipeline', []))
+            elif operator == '$unionWith':
+                names.add(spec if isinstance(spec, str) else spec.get('coll'))
+                if isinstance(spec, dict):
+                    names |= pipeline_collections(spec.get('pipeline', []))
+            elif operator == '$facet' and isinstance(spec, dict):
+                for sub_pipeline in spec.values():
+                    names |= pipeline_collections(sub_pipeline)
+    return {name for name in names if name}
+
+
+def analyze_mongo_query(user_query):
+    parsed = json.loads(user_query)
+    collection_name, pipeline = build_mongo_pipeline(parsed)
+    writes = set()
+    for stage in pipeline:
+        if '$out' in stage:
+            target = stage['$out']
+            writes.add(target if isinstance(target, str) else target.get('coll'))
+        elif '$merge' in stage:
+            target = stage['$merge']
+            target = target if isinstance(target, str) else target.get('into')
+            writes.add(target if isinstance(target, str) else (target or {}).get('coll'))
+    writes.discard(None)
+    return {
+        'normalized': json.dumps(parsed, sort_keys=True, separators=(',', ':')),
+        'collection': collection_name,
+        'read_only': not writes,
+        'cacheable': not writes,
+        'tables': {name.lower() for name in pipeline_collections(pipeline) | {collection_name} if name},
+        'writes': {name.lower() for name in writes},
+        'schema_change': bool(writes)
+    }
+
+
+def analyze_query(db_type, user_query):
+    if db_type == 'mysql':
+        return analyze_sql_query(user_query)
+    return analyze_mongo_query(user_query)
+
+
+def query_cache_key(db_type, analysis, layout='rows'):
+    return (db_type, analysis.get('collection'), analysis['normalized'], layout)
+
+
+# Invalidate caches for the tables a successful query wrote to
+def apply_query_writes(db_type, analysis):
+    if analysis['read_only']:
+        return
+    if analysis['writes'] is None:
+        query_cache.invalidate(db_type)
+        schema_cache.invalidate(db_type)
+        return
+    for name in analysis['writes']:
+        notify_dataset_changed(db_type, name, schema_changed=analysis['schema_change'])
+
+
+def run_mysql_query(user_query, query=None):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if query is not None:
+        query.set_cancel(functools.partial(kill_mysql_query, conn.connection_id))
+    try:
+        # Run the query only when this endpoint is explicitly called
+        with stage_timer('mysql_execute'):
+            cursor.execute(user_query)
+        with stage_timer('mysql_fetch'):
+            rows = cursor.fetchall() if cursor.description else []
+        conn.commit()
+
+        headers = [desc[0] for desc in cursor.description] if cursor.description else []
+        metrics.inc('chatdb_rows_returned_total', len(rows), db_type='mysql')
+
+        # Row tuples go to the encoder as they are; it converts the cell types
+        return {'headers': headers, 'result': rows}, 200
+    except Exception as e:
+        return query_error_payload(query, e)
+    finally:
+        if query is not None:
+            query.set_cancel(None)
+        conn.close()
+
+
+def run_mongo_query(user_query, query=None):
+    # MongoDB Query Handling
+    db = get_mongo_connection()
+    try:
+        user_query = json.loads(user_query)  # Parse the input query
+        collection_name, pipeline = build_mongo_pipeline(user_query)
+        collection = db[collection_name]
+
+        with stage_timer('mongodb_execute'):
+            cursor = collection.aggregate(pipeline, **mongo_query_options(query))
+        with stage_timer('mongodb_fetch'):
+            documents = list(cursor)
+
+        with stage_timer('format'):
+            headers, result = align_documents(documents)
+        metrics.inc('chatdb_rows_returned_total', len(result), db_type='mongodb')
+
+        return {'headers': headers, 'result': result}, 200
+    except Exception as e:
+        return query_error_payload(query, e)
+
+
+# Statements MySQL can EXPLAIN without running them
+SQL_EXPLAINABLE_STATEMENTS = {'select', 'with', 'table', 'insert', 'replace', 'update', 'delete'}
+SQL_NUMBER_LITERAL = re.compile(r'(?<![\w$.`])\d+(?:\.\d+)?(?:e[-+]?\d+)?(?![\w$`])', re.IGNORECASE)
+SQL_ALIAS_EXCLUDED = r'(?!(?:where|on|using|join|inner|left|right|outer|cross|natural|straight_join|group|order|having|limit|union|window|for|lock|set|values)\b)'
+SQL_TABLE_ALIAS_PATTERN = re.compile(r'\b(?:from|join|update|into)\s+' + SQL_IDENTIFIER +
+                                     r'(?:\s+(?:as\s+)?' + SQL_ALIAS_EXCLUDED + r'(\w+))?', re.IGNORECASE)
+SQL_COLUMN_REFERENCE = r'(?:`?(\w+)`?\.)?`?(\w+)`?'
+SQL_PREDICATE_PATTERN = re.compile(
+    SQL_COLUMN_REFERENCE + r'\s*(<=>|<=|>=|<>|!=|=|<|>|\bnot\s+in\b|\bin\b|\bnot\s+like\b|\blike\b|\bnot\s+between\b|\bbetween\b|\bis\b)',
+    re.IGNORECASE
+)
+SQL_JOIN_EQUALITY_PATTERN = re.compile(r'`?(\w+)`?\.`?(\w+)`?\s*=\s*`?((?!\d)\w+)`?\.`?(\w+)`?')
+SQL_WHERE_CLAUSE = re.compile(r'\bwhere\b(.*?)(?=\b(?:group\s+by|order\s+by|having|limit|window|union|for\s+update)\b|$)',
+                              re.IGNORECASE | re.DOTALL)
+SQL_ON_CLAUSE = re.compile(r'\bon\b(.*?)(?=\b(?:where|join|inner|left|right|cross|straight_join|natural|group\s+by|'
+                           r'order\s+by|having|limit|union)\b|$)', re.IGNORECASE | re.DOTALL)
+SQL_USING_CLAUSE = re.compile(r'\busing\s*\(([^)]*)\)', re.IGNORECASE)
+SQL_ORDER_CLAUSE = re.compile(r'\b(order|group)\s+by\b(.*?)(?=\b(?:having|order\s+by|limit|with\s+rollup|window|union|'
+                              r'for\s+update|lock\s+in)\b|\)|$)', re.IGNORECASE | re.DOTALL)
+SQL_EQUALITY_OPERATORS = {'=', '<=>', 'in', 'is'}
+SQL_RANGE_OPERATORS = {'<', '>', '<=', '>=', 'like', 'between'}
+
+
+# Query shape used to group slow queries: literals become ?, IN lists collapse
+def sql_fingerprint(normalized):
+    text = SQL_NUMBER_LITERAL.sub('?', SQL_STRING_LITERAL.sub('?', normalized))
+    return re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', text).lower()
+
+
+# Problems in an EXPLAIN FORMAT=JSON plan: full table/index scans,
+# filesorts and temporary tables
+def mysql_plan_findings(plan):
+    findings = []
+
+    def walk(node, operation):
+        if isinstance(node, list):
+            for item in node:
+                walk(item, operation)
+            return
+        if not isinstance(node, dict):
+            return
+        access_type = node.get('access_type')
+        if 'table_name' in node and access_type in ('ALL', 'index'):
+            findings.append({
+                'issue': 'full_table_scan' if access_type == 'ALL' else 'full_index_scan',
+                'table': node['table_name'],
+                'rows_examined': node.get('rows_examined_per_scan'),
+                'possible_keys': node.get('possible_keys', [])
+            })
+        if node.get('using_filesort'):
+            findings.append({'issue': 'filesort', 'table': node.get('table_name'), 'operation': operation})
+        if node.get('using_temporary_table'):
+            findings.append({'issue': 'temporary_table', 'table': node.get('table_name'), 'operation': operation})
+        for key, value in node.items():
+            walk(value, key if key.endswith('_operation') or key == 'duplicates_removal' else operation)
+
+    walk(plan, None)
+    return findings
+
+
+# Alias (and table name) -> table name, in FROM/JOIN order
+def sql_table_aliases(text, tables):
+    aliases = {}
+    for match in SQL_TABLE_ALIAS_PATTERN.finditer(text):
+        table = qualified_table_name(match.group(1), match.group(2))
+        aliases.setdefault(table, table)
+        if match.group(3):
+            aliases[match.group(3).lower()] = table
+    for table in sorted(tables):
+        aliases.setdefault(table, table)
+    return aliases
+
+
+# (kind, qualifier, column) for every column the query filters, joins,
+# sorts or groups on; kind is equality, range, join, order or group
+def sql_column_references(text):
+    references = []
+    for clause in SQL_WHERE_CLAUSE.findall(text) + SQL_ON_CLAUSE.findall(text):
+        for qualifier, column, operator in SQL_PREDICATE_PATTERN.findall(SQL_JOIN_EQUALITY_PATTERN.sub(' ', clause)):
+            operator = re.sub(r'\s+', ' ', operator.lower())
+            if operator in SQL_EQUALITY_OPERATORS:
+                references.append(('equality', qualifier, column))
+            elif operator in SQL_RANGE_OPERATORS:
+                references.append(('range', qualifier, column))
+        for left_table, left_column, right_table, right_column in SQL_JOIN_EQUALITY_PATTERN.findall(clause):
+            references.append(('join', left_table, left_column))
+            references.append(('join', right_table, right_column))
+    for columns in SQL_USING_CLAUSE.findall(text):
+        references.extend(('join', '', column.strip(' `')) for column in columns.split(','))
+    for kind, clause in SQL_ORDER_CLAUSE.findall(text):
+        for item in clause.split(','):
+            match = re.fullmatch(r'\s*' + SQL_COLUMN_REFERENCE + r'(?:\s+(?:asc|desc))?\s*', item, re.IGNORECASE)
+            if match:
+                references.append((kind.lower(), match.group(1) or '', match.group(2)))
+    return references
+
+
+# Table and [Field, Type, Null, Key, ...] attribute a column reference points at
+def resolve_sql_column(qualifier, column, aliases, columns):
+    if qualifier:
+        candidates = [aliases[qualifier.lower()]] if qualifier.lower() in aliases else []
+    else:
+        candidates = list(dict.fromkeys(aliases.values()))
+    for table in candidates:
+        for attribute in columns.get(table, ()):
+            if attribute[0].lower() == column.lower():
+                return table, attribute
+    return None
+
+
+# CREATE INDEX suggestions for the tables the plan scans in full (or sorts
+# through a filesort/temporary table): equality columns first, then the
+# ORDER BY/GROUP BY columns of the first table or the join columns of the
+# others, then one range column
+def suggest_sql_indexes(text, tables, columns, findings):
+    aliases = sql_table_aliases(text, tables)
+    driving_table = next(iter(aliases.values()), None)
+    candidates = {}
+    for kind, qualifier, column in sql_column_references(text):
+        resolved = resolve_sql_column(qualifier, column, aliases, columns)
+        if resolved is None:
+            continue
+        table, attribute = resolved
+        kinds = candidates.setdefault(table, {'equality': {}, 'join': {}, 'order': {}, 'group': {}, 'range': {}})
+        kinds[kind].setdefault(attribute[0], attribute)
+
+    reasons = {}
+    for finding in findings:
+        table = aliases.get((finding.get('table') or '').lower())
+        if finding['issue'] in ('full_table_scan', 'full_index_scan') and table:
+            reasons.setdefault(table, []).append(finding['issue'])
+        elif finding['issue'] in ('filesort', 'temporary_table') and driving_table:
+            reasons.setdefault(table or driving_table, []).append(finding['issue'])
+
+    suggestions = []
+    for table, table_reasons in reasons.items():
+        kinds = candidates.get(table)
+        if kinds is None:
+            continue
+        chosen = dict(kinds['equality'])
+        if table == driving_table:
+            chosen.update(kinds['order'] or kinds['group'])
+        else:
+            # Join columns are looked up on the inner tables of the join
+            chosen.update(kinds['join'])
+        chosen.update(itertools.islice(kinds['range'].items(), 1))
+        chosen = {name: attribute for name, attribute in chosen.items() if not attribute[1].lower().startswith('json')}
+        if not chosen or (len(chosen) == 1 and next(iter(chosen.values()))[3] in ('PRI', 'UNI', 'MUL')):
+            continue
+        parts = [f"`{name}`(64)" if re.search(r'text|blob', attribute[1], re.IGNORECASE) else f"`{name}`"
+                 for name, attribute in chosen.items()]
+        index_name = f"idx_{table}_{'_'.join(chosen)}"[:64]
+        suggestions.append({
+            'table': table,
+            'columns': list(chosen),
+            'reasons': sorted(set(table_reasons)),
+            'statement': f"CREATE INDEX `{index_name}` ON `{table}` ({', '.join(parts)})"
+        })
+    return suggestions
+
+
+# EXPLAIN FORMAT=JSON of a SQL query with the problems found in the plan and
+# suggested indexes; the query itself is not run
+def advise_mysql_query(user_query, analysis=None):
+    analysis = analysis or analyze_sql_query(user_query)
+    if analysis['statement'] not in SQL_EXPLAINABLE_STATEMENTS:
+        raise ValueError(f"EXPLAIN is not available for {analysis['statement'].upper() or 'this'} statements")
+    query = user_query.strip().rstrip(';').strip()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('EXPLAIN FORMAT=JSON ' + query)
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    plan = json.loads(decode_if_bytes(row[0]))
+    findings = mysql_plan_findings(plan)
+
+    tables = set(analysis['tables']) | set(analysis['writes'] or ())
+    columns = {}
+    if tables:
+        columns = {name.lower(): attributes for name, attributes in fetch_mysql_columns().items()
+                   if name.lower() in tables}
+    text = SQL_STRING_LITERAL.sub("''", analysis['normalized'])
+    return {
+        'query': query,
+        'plan': plan,
+        'findings': findings,
+        'suggested_indexes': suggest_sql_indexes(text, tables, columns, findings)
+    }
+
+
+# SQL queries from /api/execute_query that took at least SLOW_QUERY_THRESHOLD_MS,
+# grouped by query shape. The first time a shape is recorded (and again every
+# SLOW_QUERY_EXPLAIN_INTERVAL seconds) it is explained on a background thread,
+# so the request that was slow is not delayed further.
+class SlowQueryLog:
+    SORT_KEYS = ('total_ms', 'max_ms', 'mean_ms', 'count', 'last_seen')
+
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+        self.counters = {'recorded': 0, 'evictions': 0, 'explains': 0, 'explain_errors': 0}
+
+    def observe(self, user_query, analysis, elapsed, rows):
+        if not app.config['SLOW_QUERY_LOG_ENABLED']:
+            return
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < app.config['SLOW_QUERY_THRESHOLD_MS']:
+            return
+        fingerprint = sql_fingerprint(analysis['normalized'])
+        explainable = analysis['statement'] in SQL_EXPLAINABLE_STATEMENTS
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                entry = self._entries[fingerprint] = {
+                    'fingerprint': fingerprint,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'first_seen': now,
+                    'explained_at': None,
+                    'explain_pending': False,
+                    'explain_error': None if explainable else 'EXPLAIN is not available for this statement',
+                    'plan': None,
+                    'findings': [],
+                    'suggested_indexes': []
+                }
+                while len(self._entries) > app.config['SLOW_QUERY_LOG_SIZE']:
+                    self._entries.popitem(last=False)
+                    self.counters['evictions'] += 1
+            else:
+                self._entries.move_to_end(fingerprint)
+            entry['query'] = user_query.strip()
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['last_ms'] = elapsed_ms
+            entry['last_rows'] = rows
+            entry['last_seen'] = now
+            self.counters['recorded'] += 1
+            explain = explainable and not entry['explain_pending'] and (
+                entry['explained_at'] is None or now - entry['explained_at'] >= app.config['SLOW_QUERY_EXPLAIN_INTERVAL'])
+            if explain:
+                entry['explain_pending'] = True
+        if explain:
+            self._executor.submit(self._explain, fingerprint, user_query, analysis)
+
+    def _explain(self, fingerprint, user_query, analysis):
+        try:
+            advice, error = advise_mysql_query(user_query, analysis), None
+        except Exception as e:
+            advice, error = None, str(e)
+        with self._lock:
+            self.counters['explains' if error is None else 'explain_errors'] += 1
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return
+            entry['explain_pending'] = False
+            entry['explained_at'] = time.time()
+            entry['explain_error'] = error
+            if advice is not None:
+                entry['plan'] = advice['plan']
+                entry['findings'] = advice['findings']
+                entry['suggested_indexes'] = advice['suggested_indexes']
+
+    def entries(self, sort='total_ms', limit=None):
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        for entry in entries:
+            entry['mean_ms'] = entry['total_ms'] / entry['count']
+            for key in ('total_ms', 'max_ms', 'mean_ms', 'last_ms'):
+                entry[key] = round(entry[key], 3)
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        return entries[:limit] if limit is not None else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+slow_query_log = SlowQueryLog()
+
+
+# Route to read, configure or clear the slow query log
+@app.route('/api/slow_queries', methods=['GET', 'POST', 'DELETE'])
+def slow_queries():
+    if request.method == 'DELETE':
+        slow_query_log.clear()
+    elif request.method == 'POST':
+        options = request.json or {}
+        if 'enabled' in options:
+            app.config['SLOW_QUERY_LOG_ENABLED'] = bool(options['enabled'])
+        if 'threshold_ms' in options:
+            try:
+                app.config['SLOW_QUERY_THRESHOLD_MS'] = float(options['threshold_ms'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'threshold_ms must be a number'}), 400
+    sort = request.args.get('sort', 'total_ms')
+    if sort not in SlowQueryLog.SORT_KEYS:
+        return jsonify({'error': f"sort must be one of {', '.join(SlowQueryLog.SORT_KEYS)}"}), 400
+    return jsonify({
+        'enabled': app.config['SLOW_QUERY_LOG_ENABLED'],
+        'threshold_ms': app.config['SLOW_QUERY_THRESHOLD_MS'],
+        'queries': slow_query_log.entries(sort, request.args.get('limit', type=int)),
+        'stats': slow_query_log.stats()
+    }), 200
+
+
+# Route to handle receiving and executing MySQL queries
+@app.route('/api/execute_query', methods=['POST'])
+def execute_query():
+    options = request.json
+    # A bare list is a batch too
+    if isinstance(options, list):
+        return execute_query_batch(options)
+    if not isinstance(options, dict):
+        return jsonify({'error': 'The request body must be a JSON object or a list of queries'}), 400
+    if 'queries' in options:
+        return execute_query_batch(options['queries'])
+    user_query = options.get('query')
+    db_type = options.get('db_type', 'mysql').lower()
+    max_rows, max_bytes = row_limits(options)
+    layout = 'columnar' if options.get('format') == 'columnar' else 'rows'
+
+    # Next page of an earlier paged query
+    if options.get('cursor'):
+        token = options['cursor']
+        result = cursor_registry.take(token)
+        if result is None:
+            return jsonify({'error': 'Unknown or expired cursor'}), 404
+        try:
+            page_size = int(options.get('page_size') or app.config['RESULT_FETCH_SIZE'])
+            page = page_query_result(result, page_size, max_rows, token)
+            return jsonify(columnar_payload(page) if layout == 'columnar' else page), 200
+        except Exception as e:
+            result.close(exhausted=False)
+            return jsonify({'error': str(e)}), 400
+
+    if not user_query:
+        return jsonify({'error': 'No query provided'}), 400
+
+    if db_type not in ('mysql', 'mongodb'):
+        return jsonify({'error': 'Invalid database type specified'}), 400
+
+    try:
+        analysis = analyze_query(db_type, user_query)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    if options.get('explain'):
+        try:
+            if db_type == 'mysql':
+                return jsonify(advise_mysql_query(user_query, analysis)), 200
+            return jsonify(explain_mongo_query(json.loads(user_query))), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+
+    if options.get('stream') and layout == 'columnar':
+        return jsonify({'error': 'Streamed results are written as ndjson or json rows, not columnar'}), 400
+
+    export = options.get('format') in EXPORT_MIMETYPES
+    if export and pa is None:
+        return jsonify({'error': 'Arrow and Parquet export need the pyarrow package'}), 400
+
+    try:
+        budget_ms = query_budget_ms(options)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not (options.get('stream') or options.get('page_size') or export):
+        body, status, headers = run_full_query(options, db_type, user_query, analysis, layout, budget_ms)
+        return Response(body, status=status, mimetype='application/json', headers=headers)
+
+    try:
+        query = admit_query(db_type, options.get('query_id'), budget_ms)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    # Paged cursors outlive the request, so only the watchdog bounds their first page
+    paging = not (options.get('stream') or export)
+    query_text = user_query
+    if db_type == 'mysql' and not paging:
+        query_text = with_execution_time_hint(user_query, analysis, budget_ms)
+
+    started = time.perf_counter()
+    try:
+        try:
+            result = open_query_result(db_type, query_text, query)
+        except Exception as e:
+            return query_error_response(query, e)
+        apply_query_writes(db_type, analysis)
+        if export or options.get('stream'):
+            # Only the execute time is known before the rows are streamed out
+            if db_type == 'mysql':
+                slow_query_log.observe(user_query, analysis, time.perf_counter() - started, None)
+            if export:
+                response = export_query_result(result, options['format'], max_rows, max_bytes)
+            else:
+                response = stream_query_result(result, options.get('format', 'ndjson'), max_rows, max_bytes)
+            # The stream keeps its query slot and budget until it ends
+            query.detached = True
+            response.call_on_close(functools.partial(result.close, False))
+            response.call_on_close(functools.partial(finish_query, query))
+            response.headers['X-Query-Id'] = query.id
+            return response
+        try:
+            page = page_query_result(result, int(options['page_size']), max_rows)
+            if db_type == 'mysql':
+                slow_query_log.observe(user_query, analysis, time.perf_counter() - started, len(page['result']))
+            return jsonify(columnar_payload(page) if layout == 'columnar' else page), 200, {'X-Query-Id': query.id}
+        except Exception as e:
+            result.close(exhausted=False)
+            return query_error_response(query, e)
+    finally:
+        if not query.detached:
+            finish_query(query)
+
+
+# Run a query to its complete result, through the result cache and admission
+# control: (body, status, headers)
+def run_full_query(options, db_type, user_query, analysis, layout, budget_ms):
+    cache_key = None
+    if analysis['cacheable'] and options.get('cache', True):
+        cache_key = query_cache_key(db_type, analysis, layout)
+        body = query_cache.get(cache_key)
+        if body is not None:
+            return body, 200, {'X-Query-Cache': 'HIT'}
+
+    try:
+        query = admit_query(db_type, options.get('query_id'), budget_ms)
+    except ValueError as e:
+        return dumps_json({'error': str(e)}), 409, {}
+    started = time.perf_counter()
+    try:
+        if db_type == 'mysql':
+            query_text = with_execution_time_hint(user_query, analysis, budget_ms)
+            payload, status = run_mysql_query(query_text, query)
+            if status == 200:
+                slow_query_log.observe(user_query, analysis, time.perf_counter() - started, len(payload['result']))
+        else:
+            payload, status = run_mongo_query(user_query, query)
+    finally:
+        finish_query(query)
+
+    body = encode_query_payload(db_type, analysis, payload, status, layout, cache_key)
+    headers = {'X-Query-Id': query.id}
+    if status == 200 and cache_key is not None:
+        headers['X-Query-Cache'] = 'MISS'
+    return body, status, headers
+
+
+# Options that need a response of their own (a cursor, a stream or explain output)
+BATCH_UNSUPPORTED_OPTIONS = ('cursor', 'page_size', 'stream', 'explain')
+
+
+# Query, engine and budget checks for a complete result: (db_type, user_query,
+# analysis, budget_ms), or ValueError/TypeError with the message to return
+def validate_query_options(options):
+    user_query = options.get('query')
+    db_type = str(options.get('db_type', 'mysql')).lower()
+    if not user_query:
+        raise ValueError('No query provided')
+    if db_type not in ('mysql', 'mongodb'):
+        raise ValueError('Invalid database type specified')
+    try:
+        analysis = analyze_query(db_type, user_query)
+    except Exception as e:
+        raise ValueError(str(e))
+    return db_type, user_query, analysis, query_budget_ms(options)
+
+
+# The run_full_query arguments of a batch item: (arguments, None) or (None, error message)
+def prepare_batch_query(options):
+    if not isinstance(options, dict):
+        return None, 'Each query must be a JSON object'
+    unsupported = [name for name in BATCH_UNSUPPORTED_OPTIONS if options.get(name)]
+    if options.get('format') in EXPORT_MIMETYPES:
+        unsupported.append('format')
+    if unsupported:
+        return None, f"Not supported in a batch: {', '.join(unsupported)}"
+    try:
+        db_type, user_query, analysis, budget_ms = validate_query_options(options)
+    except (TypeError, ValueError) as e:
+        return None, str(e)
+    layout = 'columnar' if options.get('format') == 'columnar' else 'rows'
+    return (options, db_type, user_query, analysis, layout, budget_ms), None
+
+
+def run_batch_query(options):
+    arguments, error = prepare_batch_query(options)
+    if error is not None:
+        return dumps_json({'error': error}), 400, {}
+    return run_full_query(*arguments)
+
+
+# One batch item on the fan-out pool: (body, status, headers, elapsed_ms)
+def run_batch_item(options):
+    started = time.perf_counter()
+    try:
+        body, status, headers = run_batch_query(options)
+    except QueryRejectedError as e:
+        body, status, headers = dumps_json({'error': str(e)}), 429, {}
+    except PoolTimeoutError as e:
+        body, status, headers = dumps_json({'error': str(e)}), 503, {}
+    return body, status, headers, round((time.perf_counter() - started) * 1000, 3)
+
+
+# A batch item's status and timing around its encoded body, which is spliced
+# in as is (cached bodies are never parsed again)
+def encode_batch_item(index, body, status, headers, elapsed_ms):
+    item = {'index': index, 'status': status, 'elapsed_ms': elapsed_ms}
+    if 'X-Query-Id' in headers:
+        item['query_id'] = headers['X-Query-Id']
+    if 'X-Query-Cache' in headers:
+        item['cache'] = headers['X-Query-Cache']
+    return dumps_json(item)[:-1] + b',"body":' + body + b'}'
+
+
+def encode_query_batch(results, total_ms):
+    succeeded = sum(1 for result in results if result[1] == 200)
+    summary = {'succeeded': succeeded, 'failed': len(results) - succeeded, 'total_ms': total_ms}
+    items = b','.join(encode_batch_item(index, *result) for index, result in enumerate(results))
+    return b'{"results":[' + items + b'],' + dumps_json(summary)[1:]
+
+
+# Queries sent as a list run concurrently on the fan-out pool (admission control
+# still bounds each engine) and come back in one response, in request order
+def execute_query_batch(items):
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'queries must be a non-empty list'}), 400
+    if len(items) > app.config['FANOUT_MAX_ITEMS']:
+        return jsonify({'error': f"A batch holds at most {app.config['FANOUT_MAX_ITEMS']} queries"}), 400
+    started = time.perf_counter()
+    futures = [fanout_executor.submit(run_batch_item, item) for item in items]
+    results = [future.result() for future in futures]
+    body = encode_query_batch(results, round((time.perf_counter() - started) * 1000, 3))
+    return Response(body, status=200, mimetype='application/json')
+
+
+# Response body of a finished query. A successful result applies its writes
+# (cache and schema invalidation) and is cached under cache_key when given.
+def encode_query_payload(db_type, analysis, payload, status, layout, cache_key=None):
+    if status == 200 and layout == 'columnar':
+        with stage_timer('format'):
+            payload = columnar_payload(payload)
+    with stage_timer('serialize'):
+        body = dumps_json(payload)
+    if status == 200:
+        apply_query_writes(db_type, analysis)
+        if cache_key is not None:
+            query_cache.put(cache_key, body, {(db_type, name) for name in analysis['tables']})
+    return body
 
-# MySQL connection function
-def get_db_connection():
-    conn = mysql.connector.connect(
-        host="127.0.0.1",
-        port=3306,
-        user="root",
-        password="Dsci-551",
-        database="chatdb",
-        auth_plugin="mysql_native_password"
-    )
-    return conn
 
+# Route to cancel a query sent to /api/execute_query with a query_id
+@app.route('/api/execute_query/cancel', methods=['POST'])
+def cancel_query():
+    query_id = (request.json or {}).get('query_id')
+    if not query_id:
+        return jsonify({'error': 'No query_id provided'}), 400
+    if not running_queries.cancel(query_id):
+        return jsonify({'error': f"No running query '{query_id}'"}), 404
+    return jsonify({'query_id': query_id, 'cancelled': True}), 200
 
-# MongoDB connection function
-def get_mongo_connection():
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["chatdb"]
-    return db
 
+# Column types that hold numbers; tinyint(1)/bit are treated as boolean flags
+NUMERIC_SQL_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint',
+                     'decimal', 'numeric', 'float', 'double', 'real'}
+NUMERIC_BSON_TYPES = {'int', 'double', 'long', 'decimal', 'Decimal128'}
+# Key-like names: id, _id, StudentID, userId, store_id
+ID_COLUMN_PATTERN = re.compile(r'(?i:^_?id$)|_(?i:id)$|[a-z0-9](?:ID|Id)$')
 
-# Route to serve the main page
-@app.route('/')
-def index():
-    return render_template('index.html')
 
-# Route to handle file upload
-# Global variable to store the name of the last uploaded table
-last_uploaded_table = None
+def is_id_column(name):
+    return bool(ID_COLUMN_PATTERN.search(name.rsplit('.', 1)[-1]))
 
-@app.route('/api/upload', methods=['POST'])
-def upload_file():
-    if 'file' not in request.files:
-        return jsonify({'message': 'No file part'}), 400
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'message': 'No selected file'}), 400
+# Qualitative attributes are ordered so the best GROUP BY candidates come first:
+# non-key columns before keys, then by increasing number of distinct values
+def order_qualitative(columns, cardinality):
+    return sorted(columns, key=lambda col: (is_id_column(col), cardinality.get(col, 0) <= 1, cardinality.get(col, 0)))
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        collection_name = filename.rsplit('.', 1)[0]
-        if filename.endswith('.csv'):
-            table_name = collection_name
-            process_csv_file_and_load_to_db(filepath, table_name)
-        elif filename.endswith('.json'):
-            process_json_file_and_load_to_mongo(filepath, collection_name)
-         
-        return jsonify({'message': 'File successfully uploaded', 'filename': filename}), 200
-    else:
-        return jsonify({'message': 'Invalid file type'}), 400
 
+# Arrays (outermost first) a field path runs through, e.g. items for items.price
+def enclosing_arrays(path, arrays):
+    return sorted((array for array in arrays if path.startswith(array + '.')), key=len)
 
-def create_table_from_csv(conn, df, table_name):
-    cursor = conn.cursor()
-    cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
-    conn.commit()
 
-    column_definitions = []
-    for col in df.columns:
-        col_type = df[col].dtype
-        if col_type == 'int64':
-            sql_type = 'INT'
-        elif col_type == 'float64':
-            sql_type = 'FLOAT'
-        elif col_type == 'bool':
-            sql_type = 'BOOLEAN'
-        elif pd.api.types.is_datetime64_any_dtype(df[col]):
-            sql_type = 'DATETIME'
-        else:
-            sql_type = 'VARCHAR(255)'
-        column_definitions.append(f"{col} {sql_type}")
+def catalog_entry(columns, quantitative, qualitative, cardinality, arrays=()):
+    # Paths inside arrays need an $unwind to be summed or grouped on, so
+    # columns picked by default are plain fields first
+    def in_array(path):
+        return bool(enclosing_arrays(path, arrays))
 
-    columns = ", ".join(column_definitions)
-    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns});")
-    conn.commit()
+    return {
+        'columns': list(columns),
+        'quantitative': sorted(quantitative, key=in_array),
+        'qualitative': sorted(order_qualitative(qualitative, cardinality), key=in_array),
+        'arrays': list(arrays),
+        'cardinality': dict(cardinality),
+        # Lower-case name -> real name, since chat messages are lower-cased
+        'column_lookup': {col.lower(): col for col in columns}
+    }
 
-def process_csv_file_and_load_to_db(filepath, table_name):
-    df = pd.read_csv(filepath)
-    conn = get_db_connection()
-    create_table_from_csv(conn, df, table_name)
 
-    columns = ", ".join(df.columns)
-    placeholders = ", ".join(["%s"] * len(df.columns))
-    insert_query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+# Distinct counts (and min/max of numeric columns) over a sample of the table
+def fetch_mysql_column_profile(table_name, attributes, sample_rows):
+    numeric = [attr[0] for attr in attributes if attr[1].split('(')[0].split()[0].lower() in NUMERIC_SQL_TYPES]
+    selects = [f"COUNT(DISTINCT `{attr[0]}`)" for attr in attributes]
+    selects += [f"MIN(`{col}`), MAX(`{col}`)" for col in numeric]
+    query = f"SELECT {', '.join(selects)} FROM (SELECT * FROM `{table_name}` LIMIT {int(sample_rows)}) AS sample"
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query)
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        connection.close()
+    cardinality = {attr[0]: row[i] for i, attr in enumerate(attributes)}
+    offset = len(attributes)
+    ranges = {col: (row[offset + 2 * i], row[offset + 2 * i + 1]) for i, col in enumerate(numeric)}
+    return cardinality, ranges
 
-    cursor = conn.cursor()
-    for index, row in df.iterrows():
-        try:
-            values = [None if pd.isna(value) else value for value in row]
-            cursor.execute(insert_query, tuple(values))
-        except mysql.connector.Error as err:
-            print(f"Error inserting row {index}: {err}")
-            conn.rollback()
-    conn.commit()
-    conn.close()
 
+def classify_mysql_table(table_name, attributes, sample_rows):
+    cardinality, ranges = fetch_mysql_column_profile(table_name, attributes, sample_rows)
+    quantitative, qualitative = [], []
+    for attr in attributes:
+        col, col_type = attr[0], attr[1].lower()
+        base_type = col_type.split('(')[0].split()[0]
+        is_flag = col_type.startswith('tinyint(1)') or base_type in ('bit', 'bool', 'boolean') or \
+            (cardinality[col] <= 2 and ranges.get(col, (None, None))[0] in (0, 1) and ranges[col][1] in (0, 1))
+        if base_type in NUMERIC_SQL_TYPES and not is_id_column(col) and not is_flag:
+            quantitative.append(col)
+        else:
+            qualitative.append(col)
+    return catalog_entry([attr[0] for attr in attributes], quantitative, qualitative, cardinality)
 
-def preprocess_json_data(data):
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, dict):
-                if '$oid' in value:
-                    data[key] = value['$oid']
-                elif '$date' in value:
-                    try:
-                        data[key] = datetime.fromisoformat(value['$date'].replace("Z", "+00:00"))
-                    except ValueError:
-                        data[key] = value['$date']
-                else:
-                    preprocess_json_data(value)
-            elif isinstance(value, list):
-                for i, item in enumerate(value):
-                    preprocess_json_data(item)
-            elif isinstance(value, str):
-                try:
-                    parsed_date = datetime.fromisoformat(value)
-                    data[key] = parsed_date
-                except ValueError:
-                    pass
-    elif isinstance(data, list):
-        for item in data:
-            preprocess_json_data(item)
 
-def process_json_file_and_load_to_mongo(filepath, collection_name):
-    db = get_mongo_connection()
-    collection = db[collection_name]
-    if collection_name in db.list_collection_names():
-        collection.drop()
+def build_mysql_catalog(table_names=None):
+    columns = fetch_mysql_columns(table_names)
+    sample_rows = app.config['CATALOG_SAMPLE_ROWS']
+    futures = {name: explore_executor.submit(classify_mysql_table, name, attributes, sample_rows)
+               for name, attributes in columns.items()}
+    return {name: future.result() for name, future in futures.items()}
 
-    with open(filepath, 'r') as json_file:
-        data = json.load(json_file)
-    preprocess_json_data(data)
-    if isinstance(data, list):
-        collection.insert_many(data)
+
+def classify_mongo_collection(collection_name):
+    profile, _ = infer_mongo_schema(collection_name)
+    fields = profile.to_dict()['fields']
+    quantitative, qualitative, arrays = [], [], []
+    cardinality = {}
+    for path, field in fields.items():
+        types = {name: ratio for name, ratio in field['types'].items() if name != 'null'}
+        if not types:
+            continue
+        dominant = max(types, key=types.get)
+        cardinality[path] = field['approx_distinct']
+        if dominant == 'array':
+            arrays.append(path)
+        elif dominant == 'object':
+            continue
+        elif dominant in NUMERIC_BSON_TYPES and not is_id_column(path) and field['approx_distinct'] > 2:
+            quantitative.append(path)
+        else:
+            qualitative.append(path)
+    return catalog_entry(list(fields), quantitative, qualitative, cardinality, arrays)
+
+
+def build_mongo_catalog(collection_names=None):
+    existing = get_mongo_connection().list_collection_names()
+    if collection_names is None:
+        collection_names = existing
     else:
-        collection.insert_one(data)
- 
-# Route to explore MySQL databases and show tables
-@app.route('/api/explore', methods=['POST'])
-def explore():
-    db_type = request.json.get('db_type', '').lower()
+        collection_names = [name for name in collection_names if name in existing]
+    futures = {name: explore_executor.submit(classify_mongo_collection, name) for name in collection_names}
+    return {name: future.result() for name, future in futures.items()}
 
+
+# Hardcoded schemas, used only when an engine cannot be read at all
+def static_catalog(db_type):
     if db_type == 'mysql':
-        try:
-            connection = get_db_connection()  # Use your existing MySQL connection function
-            cursor = connection.cursor()
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
+        return {
+            table: catalog_entry(fields, SQL_QUANTITATIVE_ATTRIBUTES.get(table, []),
+                                 SQL_QUALITATIVE_ATTRIBUTES.get(table, []), {})
+            for table, fields in SQL_DATABASES["chatDB"].items()
+        }
+    return {
+        collection: catalog_entry(details["fields"], QUANTITATIVE_ATTRIBUTES.get(collection, []),
+                                  QUALITATIVE_ATTRIBUTES.get(collection, []), {})
+        for collection, details in DATABASES["chatDB"].items()
+    }
 
-            table_details = {}
-            for table in tables:
-                table_name = table[0]
-                cursor.execute(f"DESCRIBE {table_name}")
-                attributes = cursor.fetchall()
-                # Fetch sample data
-                cursor.execute(f"SELECT * FROM {table_name} LIMIT 5")
-                sample_data = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                
-                # Format the sample data
-                sample_data_formatted = []
-                for row in sample_data:
-                    formatted_row = {}
-                    for col, val in zip(columns, row):
-                        # Convert timedelta to string
-                        if isinstance(val, timedelta):
-                            formatted_row[col] = str(val)
-                        else:
-                            formatted_row[col] = val
-                    sample_data_formatted.append(formatted_row)
-
-                table_details[table_name] = {
-                    'attributes': attributes,
-                    'sample_data': sample_data_formatted
-                }
 
-            cursor.close()
-            connection.close()
+CATALOG_BUILDERS = {'mysql': build_mysql_catalog, 'mongodb': build_mongo_catalog}
 
-            return jsonify({"db_type": "mysql", "tables": table_details})
 
-        except Exception as e:
-            return jsonify({"error": str(e)})
+# In-memory catalog of the tables/collections chat can talk about.
+# Readers get immutable snapshots, so chat lookups are plain dict reads
+# and never touch the database; writers swap in new dicts.
+class Catalog:
+    def __init__(self):
+        self.version = 0
+        self.loaded_at = None
+        self._engines = {'mysql': {}, 'mongodb': {}}
+        self._names = {'mysql': {}, 'mongodb': {}}
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._refreshing = False
 
+    def tables(self, db_type):
+        return self._engines[db_type]
 
-    elif db_type == 'mongodb':
+    def entry(self, db_type, name):
+        return self._engines[db_type].get(name)
+
+    # Real table/collection name for a lower-cased name from a chat message
+    def resolve(self, db_type, name):
+        return self._names[db_type].get(name.lower())
+
+    def _publish(self, db_type, entries):
+        self._engines[db_type] = entries
+        self._names[db_type] = {name.lower(): name for name in entries}
+        self.version += 1
+
+    def load(self, db_type):
         try:
-            db = get_mongo_connection()
-            collection_names = db.list_collection_names()
-            collection_details = {}
-
-            for collection_name in collection_names:
-                collection = db[collection_name]
-                attributes = list(collection.find_one().keys()) if collection.find_one() else []
-                sample_data = list(collection.find().limit(5))
-
-                collection_details[collection_name] = {
-                    'attributes': attributes,
-                    'sample_data': sample_data
-                }
+            entries = CATALOG_BUILDERS[db_type]()
+            source = 'live'
+        except Exception as e:
+            if self._sources.get(db_type) == 'live':
+                print(f"Catalog refresh failed for {db_type}, keeping the previous catalog: {e}")
+                return
+            print(f"Catalog could not read {db_type}, using the built-in schema: {e}")
+            entries = static_catalog(db_type)
+            source = 'static'
+        with self._lock:
+            self._sources[db_type] = source
+            self._publish(db_type, entries)
 
-            return jsonify({"db_type": "mongodb", "collections": collection_details})
+    def refresh(self):
+        for db_type in CATALOG_BUILDERS:
+            self.load(db_type)
+        self.loaded_at = time.monotonic()
 
+    # Re-read one table/collection after it was uploaded, changed or dropped
+    def refresh_entry(self, db_type, name):
+        try:
+            entries = CATALOG_BUILDERS[db_type]([name])
         except Exception as e:
-            return jsonify({"error": str(e)})
+            print(f"Catalog refresh failed for {db_type}.{name}: {e}")
+            return
+        with self._lock:
+            updated = dict(self._engines[db_type])
+            if name in entries:
+                updated[name] = entries[name]
+            else:
+                updated.pop(name, None)
+            self._publish(db_type, updated)
 
-    else:
-        return jsonify({"error": "Invalid database type specified."})
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
 
+    # Load on first use; afterwards refresh in the background once the catalog is stale.
+    # Requests arriving during the first load wait for it instead of reading an empty catalog.
+    def ensure_fresh(self):
+        if self.loaded_at is None:
+            with self._first_load:
+                if self.loaded_at is None:
+                    self.refresh()
+            return self
+        if time.monotonic() - self.loaded_at > app.config['CATALOG_REFRESH_INTERVAL']:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._background_refresh, daemon=True).start()
+        return self
 
+    def stats(self):
+        return {
+            'version': self.version,
+            'sources': dict(self._sources),
+            'tables': {db_type: len(entries) for db_type, entries in self._engines.items()}
+        }
 
-# Route to handle receiving and executing MySQL queries
-@app.route('/api/execute_query', methods=['POST'])
-def execute_query():
-    user_query = request.json.get('query')
-    db_type = request.json.get('db_type', 'mysql').lower()
 
-    if not user_query:
-        return jsonify({'error': 'No query provided'}), 400
-    
-    if db_type == 'mysql':
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            # Run the query only when this endpoint is explicitly called
-            cursor.execute(user_query)
-            rows = cursor.fetchall()
-            conn.commit()
+catalog = Catalog()
 
-            headers = [desc[0] for desc in cursor.description] if cursor.description else []
-            result = []
-            for row in rows:
-                formatted_row = [str(item) if isinstance(item, timedelta) else item for item in row]
-                result.append(formatted_row)
 
-            return jsonify({'headers': headers, 'result': result}), 200
-        except Exception as e:
-            return jsonify({'error': str(e)}), 400
-        finally:
-            conn.close()
-    
-    elif db_type == 'mongodb':
-        # MongoDB Query Handling
-        db = get_mongo_connection()
-        try:
-            user_query = json.loads(user_query)  # Parse the input query
-            collection_name = user_query.get('collection')
-            query = user_query.get('query', {})
-            projection = user_query.get('projection')  # Optional projection
-            sort = user_query.get('sort')  # Optional sort
-            limit = user_query.get('limit')  # Optional limit
-            skip = user_query.get('skip')  # Optional skip
-            aggregation = user_query.get('aggregation')  # Optional aggregation pipeline
-            lookup = user_query.get('lookup')  # Optional lookup
-            unwind = user_query.get('unwind')  # Optional unwind
-            group = user_query.get('group')  # Optional group
-
-            collection = db[collection_name]
-
-            pipeline = aggregation if aggregation else []
-
-            if lookup:
-                pipeline.append({
-                    '$lookup': {
-                        'from': lookup.get('from'),
-                        'localField': lookup.get('localField'),
-                        'foreignField': lookup.get('foreignField'),
-                        'as': lookup.get('as')
-                    }
-                })
-            if unwind:
-                pipeline.append({'$unwind': unwind})
-            if group:
-                pipeline.append({'$group': group})
-            if query:
-                pipeline.append({'$match': query})
-            if projection:
-                pipeline.append({'$project': projection})
-            if sort:
-                pipeline.append({'$sort': sort})
-            if skip:
-                pipeline.append({'$skip': skip})
-            if limit:
-                pipeline.append({'$limit': limit})
-
-            documents = list(collection.aggregate(pipeline))
-
-            headers = list(documents[0].keys()) if documents else []
-            result = [list(doc.values()) for doc in documents]
-
-            return jsonify({'headers': headers, 'result': result}), 200
-        except Exception as e:
-            return jsonify({'error': str(e)}), 400
+def get_catalog():
+    return catalog.ensure_fresh()
 
-    else:
-        return jsonify({'error': 'Invalid database type specified'}), 400
 
+# Called whenever a table or collection is (re)loaded so cached views of it are updated
+# schema_changed=False (plain INSERT/UPDATE/DELETE) skips the catalog refresh.
+def notify_dataset_changed(db_type, name, schema_changed=True):
+    query_cache.invalidate(db_type, name)
+    schema_cache.invalidate(db_type, name)
+    if schema_changed and catalog.loaded_at is not None:
+        catalog.refresh_entry(db_type, name)
+
+
+# Aho-Corasick automaton over (keyword, value) pairs. One pass over a message
+# yields the value of every keyword it contains, overlapping ones included,
+# so the cost per message does not grow with the number of keywords.
+class KeywordAutomaton:
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for keyword, value in keywords:
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(value)
+
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def find(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            yield from out[state]
+
+
+CHAT_COMMANDS = ('explore', 'sample')
+
+
+# Keywords chat looks for in a message: the commands, the construct names and the
+# tables/collections of one catalog snapshot. For constructs and tables the one
+# listed first wins, as with the scans this replaces.
+class ChatKeywordMatcher:
+    def __init__(self, constructs, tables):
+        self.tables = tables
+        keywords = [(command, ('command', 0, command)) for command in CHAT_COMMANDS]
+        keywords += [(construct, ('construct', rank, construct)) for rank, construct in enumerate(constructs)]
+        keywords += [(table.lower(), ('table', rank, table)) for rank, table in enumerate(tables)]
+        self.automaton = KeywordAutomaton(keywords)
+
+    def scan(self, message):
+        found = {'commands': set(), 'construct': None, 'table': None}
+        ranks = {}
+        for kind, rank, name in self.automaton.find(message):
+            if kind == 'command':
+                found['commands'].add(name)
+            elif kind not in ranks or rank < ranks[kind]:
+                ranks[kind] = rank
+                found[kind] = name
+        return found
+
+
+chat_keyword_matchers = {}
+
+
+# Matcher for the current catalog snapshot; rebuilt only when the snapshot is swapped
+def get_chat_keyword_matcher(db_type, constructs):
+    tables = get_catalog().tables(db_type)
+    matcher = chat_keyword_matchers.get(db_type)
+    if matcher is None or matcher.tables is not tables:
+        matcher = ChatKeywordMatcher(constructs, tables)
+        chat_keyword_matchers[db_type] = matcher
+    return matcher
+
+
+# A list of (regex, label) pairs compiled into one alternation with a named group
+# per pattern, so a message is searched once instead of once per pattern. The
+# earliest match in the message wins; at the same position, the pattern listed
+# first. Matching ignores case, so captured values keep the user's.
+class PatternMatcher:
+    def __init__(self, patterns):
+        parts = []
+        self.labels = {}
+        offset = 0
+        for index, (pattern, label) in enumerate(patterns):
+            name = f"p{index}"
+            parts.append(f"(?P<{name}>{pattern.pattern})")
+            self.labels[name] = (label, offset + 1, pattern.groups)
+            offset += pattern.groups + 1
+        self.regex = re.compile('|'.join(parts), re.IGNORECASE)
+
+    # (label, captured groups) for every match, left to right
+    def finditer(self, message):
+        for match in self.regex.finditer(message):
+            label, first, count = self.labels[match.lastgroup]
+            yield label, match.groups()[first:first + count]
+
+    def match(self, message):
+        return next(self.finditer(message), None)
+
+
+class QuerySlotError(ValueError):
+    pass
+
+
+WORD_PATTERN = re.compile(r"[a-z_][\w.]*")
+NUMBER_PATTERN = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+QUOTED_PATTERN = re.compile(r"'[^']+'")
+
+
+# Lower-cased message with its quoted strings blanked out, for the keyword,
+# column and number scans. Quoted text is a value: messages that differ only
+# in it share a cached translation, so it must not pick the table, construct
+# or columns.
+def unquoted_message(message):
+    return QUOTED_PATTERN.sub("'?'", message).lower()
+
+
+# Column of a catalog entry named by a (lower-cased) word from a chat message.
+# Nested MongoDB fields may also be named by their last path segment.
+def resolve_column(entry, word):
+    word = word.lower()
+    column = entry['column_lookup'].get(word)
+    if column is None:
+        column = next((col for col in entry['columns'] if col.rsplit('.', 1)[-1].lower() == word), None)
+    return column
+
+
+def parse_number(text):
+    value = float(text)
+    return int(value) if value.is_integer() and '.' not in text else value
+
+
+# Values for the placeholders of a query template. Words captured by the
+# matched pattern are used first and checked against the catalog entry. Slots
+# the pattern did not capture come from columns and numbers the message
+# mentions, then from the entry's preferred columns. The same message always
+# gives the same query.
+class QuerySlots:
+    def __init__(self, table, entry, captured=None, message=''):
+        self.table = table
+        self.entry = entry
+        self.captured = captured or {}
+        message = unquoted_message(message)
+        mentioned = (resolve_column(entry, word.rstrip('.')) for word in WORD_PATTERN.findall(message))
+        self.mentioned = list(dict.fromkeys(col for col in mentioned if col is not None))
+        self.numbers = collections.deque(NUMBER_PATTERN.findall(message))
+        for slot, value in self.captured.items():
+            if value in self.numbers:
+                self.numbers.remove(value)
+        self.message = message
+        self.used = set()
+
+    # allowed limits which columns a captured word may name; pool is the
+    # preference order when nothing was captured
+    def column(self, slot, allowed=None, label='', pool=None):
+        word = self.captured.get(slot)
+        if word is not None:
+            column = resolve_column(self.entry, word)
+            if column is None:
+                raise QuerySlotError(f"Unknown column '{word}' in {self.table}. Columns: {', '.join(self.entry['columns'])}.")
+            if allowed is not None and column not in allowed:
+                raise QuerySlotError(f"Column '{column}' in {self.table} is not {label}.")
+        else:
+            pool = pool if pool is not None else (allowed if allowed is not None else self.entry['columns'])
+            column = next((col for col in self.mentioned if col in pool and col not in self.used), None)
+            if column is None:
+                column = next((col for col in pool if col not in self.used), None)
+            if column is None:
+                raise QuerySlotError(f"Insufficient attributes to generate queries: {self.table} has no {label} columns.")
+        self.used.add(column)
+        return column
+
+    def quantitative(self, slot):
+        return self.column(slot, self.entry['quantitative'], 'numeric')
+
+    def qualitative(self, slot):
+        return self.column(slot, self.entry['qualitative'], 'categorical')
+
+    # Any column; numeric ones are preferred, first among those the message names
+    def any_column(self, slot):
+        if slot not in self.captured:
+            column = next((col for col in self.mentioned if col in self.entry['quantitative'] and col not in self.used), None)
+            if column is not None:
+                self.used.add(column)
+                return column
+        return self.column(slot, pool=self.entry['quantitative'] + self.entry['columns'])
+
+    # Column if the message captured a known one for this slot, else None
+    def optional_column(self, slot):
+        word = self.captured.get(slot)
+        column = resolve_column(self.entry, word) if word is not None else None
+        if column is not None:
+            self.used.add(column)
+        return column
+
+    def number(self, slot, default):
+        text = self.captured.get(slot)
+        if text is None:
+            text = self.numbers.popleft() if self.numbers else None
+        return MessageLiteral(text, 'number') if text is not None else default
+
+    # A whole, non-negative number (a row count)
+    def count(self, slot, default, example):
+        number = self.number(slot, default)
+        if isinstance(number, MessageLiteral) and not number.text.isdigit():
+            raise QuerySlotError(f"'{number.text}' is not a whole number of rows, e.g. '{example}'.")
+        return number
+
+    def value(self, slot, example):
+        value = self.captured.get(slot)
+        if value is None:
+            raise QuerySlotError(f"Please specify a value, e.g. '{example}'.")
+        return value
+
+    def descending(self, default):
+        direction = self.captured.get('direction')
+        words = {direction.lower()} if direction else set(WORD_PATTERN.findall(self.message))
+        if words & {'descending', 'desc'}:
+            return True
+        if words & {'ascending', 'asc'}:
+            return False
+        return default
+
+
+def captured_slots(slot_names, groups):
+    return {slot: value for slot, value in zip(slot_names, groups) if slot is not None and value is not None}
+
+
+# Column shared by two catalog entries to join on, preferring key columns
+def shared_join_column(entry, other_entry):
+    shared = [col for col in entry['columns'] if col.lower() in other_entry['column_lookup'] and col != '_id']
+    shared.sort(key=lambda col: not is_id_column(col))
+    if not shared:
+        return None
+    return shared[0], other_entry['column_lookup'][shared[0].lower()]
+
+
+def sql_literal(value):
+    if NUMBER_PATTERN.fullmatch(value):
+        return value
+    return "'" + value.replace('\\', '\\\\').replace("'", "''") + "'"
+
+
+# How each kind of message literal is written into a query
+LITERAL_RENDERERS = {
+    'number': lambda text: str(parse_number(text)),
+    'sql': sql_literal,
+    'sql_like': lambda text: sql_literal('%' + text + '%')
+}
+# Value each kind of message literal is bound as when the query is run
+LITERAL_VALUES = {
+    'number': parse_number,
+    'sql': lambda text: text,
+    'sql_like': lambda text: '%' + text + '%'
+}
+LITERAL_MARKER = re.compile(r"\x00(\w+):(.*?)\x00", re.DOTALL)
+MESSAGE_LITERAL = re.compile(r"'([^']+)'|" + NUMBER_PATTERN.pattern)
+
+
+# A number or string taken from a chat message. It is written into the generated
+# query as a marker, so the query can be cached as a template and filled with
+# the literals of the next message that only differs in them.
+class MessageLiteral:
+    def __init__(self, text, kind):
+        self.text = text
+        self.kind = kind
+
+    def __format__(self, spec):
+        return f"\x00{self.kind}:{self.text}\x00"
+
+
+# Chat output that is a runnable query. For MongoDB, .query holds the collection
+# and pipeline; for SQL the text itself is the query.
+class GeneratedQuery(str):
+    def __new__(cls, text, query=None):
+        generated = super().__new__(cls, text)
+        generated.query = query
+        return generated
+
+
+# Position of a message literal inside a cached structured query
+class LiteralSlot:
+    def __init__(self, kind, index):
+        self.kind = kind
+        self.index = index
+
+
+def render_literals(output):
+    return LITERAL_MARKER.sub(lambda match: LITERAL_RENDERERS[match.group(1)](match.group(2)), output)
+
+
+# Lower-cased message with its quoted strings and numbers replaced by
+# placeholders, plus the literals that were replaced (in the user's case).
+# Number placeholders keep the sign and fraction, which can decide whether
+# a number fits its slot (a row count is whole).
+def canonicalize_message(message):
+    literals = []
+
+    def placeholder(match):
+        if match.group(1) is not None:
+            literals.append(match.group(1))
+            return "'?'"
+        text = match.group(0)
+        literals.append(text)
+        return ('-' if text.startswith('-') else '') + ('?.?' if '.' in text else '?')
+
+    return MESSAGE_LITERAL.sub(placeholder, message).lower(), literals
+
+
+# Index of the message literal a marker was written from. None when no literal
+# or more than one has its text: a repeated literal could be either slot, and
+# a template bound to the wrong one would be filled wrongly for the next
+# message where the two differ.
+def literal_index(text, literals):
+    if literals.count(text) != 1:
+        return None
+    return literals.index(text)
+
+
+# Generated output split into text and (kind, literal index) slots; None if a
+# marker cannot be traced to exactly one literal of the message
+def compile_query_template(output, literals):
+    parts = LITERAL_MARKER.split(output)
+    template = []
+    for index in range(0, len(parts), 3):
+        template.append(parts[index])
+        if index + 1 < len(parts):
+            kind, text = parts[index + 1], parts[index + 2]
+            position = literal_index(text, literals)
+            if position is None:
+                return None
+            template.append((kind, position))
+    return template
+
+
+def fill_query_template(template, literals):
+    return ''.join(part if isinstance(part, str) else LITERAL_RENDERERS[part[0]](literals[part[1]])
+                   for part in template)
+
+
+# SQL with %s placeholders and the parameters bound to them
+def bind_query_template(template, literals):
+    sql = []
+    params = []
+    for part in template:
+        if isinstance(part, str):
+            sql.append(part.replace('%', '%%'))
+        else:
+            sql.append('%s')
+            params.append(LITERAL_VALUES[part[0]](literals[part[1]]))
+    return ''.join(sql), params
+
+
+# Structured query with its MessageLiterals replaced by LiteralSlots; None if
+# a literal cannot be traced to exactly one of the message's
+def compile_query_structure(value, literals):
+    if isinstance(value, MessageLiteral):
+        position = literal_index(value.text, literals)
+        return LiteralSlot(value.kind, position) if position is not None else None
+    if isinstance(value, dict):
+        compiled = {}
+        for key, item in value.items():
+            compiled[key] = compile_query_structure(item, literals)
+            if compiled[key] is None and item is not None:
+                return None
+        return compiled
+    if isinstance(value, list):
+        compiled = [compile_query_structure(item, literals) for item in value]
+        return None if any(item is None and original is not None for item, original in zip(compiled, value)) else compiled
+    return value
+
+
+def fill_query_structure(value, literals):
+    if isinstance(value, LiteralSlot):
+        return LITERAL_VALUES[value.kind](literals[value.index])
+    if isinstance(value, dict):
+        return {key: fill_query_structure(item, literals) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill_query_structure(item, literals) for item in value]
+    return value
+
+
+# LRU cache of chat translations keyed on (engine, canonical message). An
+# engine's entries are dropped as soon as its catalog snapshot is replaced.
+class TranslationCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.snapshots = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_snapshot(self, db_type, snapshot):
+        if self.snapshots.get(db_type) is not snapshot:
+            stale = [key for key in self.entries if key[0] == db_type]
+            for key in stale:
+                del self.entries[key]
+            if db_type in self.snapshots:
+                self.invalidations += 1
+            self.snapshots[db_type] = snapshot
+
+    def get(self, db_type, canonical, snapshot):
+        with self.lock:
+            self._check_snapshot(db_type, snapshot)
+            template = self.entries.get((db_type, canonical))
+            if template is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end((db_type, canonical))
+            self.hits += 1
+            return template
+
+    def put(self, db_type, canonical, snapshot, template):
+        with self.lock:
+            self._check_snapshot(db_type, snapshot)
+            self.entries[(db_type, canonical)] = template
+            self.entries.move_to_end((db_type, canonical))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.snapshots.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_SIZE)
+
+
+# Compile interpreted output into a cache entry: the text template and, for
+# MongoDB queries, the pipeline template. None if the output uses a literal
+# the message does not contain, or one whose text the message repeats.
+def compile_translation(output, literals):
+    text = compile_query_template(output, literals)
+    if text is None:
+        return None
+    query = None
+    if isinstance(output, GeneratedQuery) and output.query is not None:
+        query = compile_query_structure(output.query, literals)
+        if query is None:
+            return None
+    return {'text': text, 'query': query, 'is_query': isinstance(output, GeneratedQuery)}
+
+
+# Response text and runnable query for a filled cache entry
+def fill_translation(db_type, entry, literals):
+    text = fill_query_template(entry['text'], literals)
+    if not entry['is_query']:
+        return text, None
+    if db_type == 'mysql':
+        sql, params = bind_query_template(entry['text'], literals)
+        return text, {'sql': sql, 'params': params}
+    return text, fill_query_structure(entry['query'], literals)
+
+
+# Translate a chat message through the cache. Messages that differ only in
+# case, spacing, numbers or quoted strings share one template; the literals
+# are filled in as the user wrote them. Sample
+# requests are answered at random and are never cached.
+# Returns (response text, query or None, 'HIT'/'MISS'/None).
+def translate_chat_message(db_type, message):
+    interpret = SQL_interpret_message if db_type == 'mysql' else interpret_message
+    message = ' '.join(message.split())
+    canonical, literals = canonicalize_message(message)
+    if "sample" in canonical:
+        return render_literals(interpret(message)), None, None
+
+    snapshot = get_catalog().tables(db_type)
+    entry = translation_cache.get(db_type, canonical, snapshot)
+    status = 'HIT'
+    if entry is None:
+        status = 'MISS'
+        output = interpret(message)
+        entry = compile_translation(output, literals)
+        if entry is None:
+            # Fill from the output's own literals and leave it uncached. Markers
+            # with the same text stand for the same value, so one literal each will do.
+            literals = list(dict.fromkeys(text for kind, text in LITERAL_MARKER.findall(output)))
+            return fill_translation(db_type, compile_translation(output, literals), literals) + (None,)
+        translation_cache.put(db_type, canonical, snapshot, entry)
+    return fill_translation(db_type, entry, literals) + (status,)
 
 
 # SQL Database schema and attributes
+# Built-in schema of the sample datasets; chat reads the live catalog and only
+# falls back to these dictionaries when MySQL cannot be reached
 SQL_DATABASES = {
     "chatDB": {
         "courses": ["CourseID", "CourseName", "InstructorID", "InstructorName", "CreditHours"],
@@ -369,70 +4711,133 @@ SQL_NATURAL_LANGUAGE_PATTERNS = [
     (re.compile(r"total (\w+) by (\w+)"), "group by"),
     (re.compile(r"average (\w+) by (\w+)"), "average"),
     (re.compile(r"count (\w+) by (\w+)"), "count group by"),
-    (re.compile(r"find (\w+) greater than (\d+)"), "greater than"),
-    (re.compile(r"find (\w+) less than (\d+)"), "less than"),
-    (re.compile(r"find (\w+) between (\d+) and (\d+)"), "between"),
+    (re.compile(r"find (\w+) greater than (-?\d+(?:\.\d+)?)"), "greater than"),
+    (re.compile(r"find (\w+) less than (-?\d+(?:\.\d+)?)"), "less than"),
+    (re.compile(r"find (\w+) between (-?\d+(?:\.\d+)?) and (-?\d+(?:\.\d+)?)"), "between"),
     (re.compile(r"list all (\w+) sorted by (\w+) in (ascending|descending) order"), "order by"),
     (re.compile(r"top (\d+) (\w+) by (\w+)"), "top n order by"),
-    (re.compile(r"find (\w+) having (\w+) greater than (\d+)"), "having"),
+    (re.compile(r"find (\w+) having (\w+) greater than (-?\d+(?:\.\d+)?)"), "having"),
     (re.compile(r"join (\w+) and (\w+) on (\w+)\.(\w+) = (\w+)\.(\w+)"), "join"),
     (re.compile(r"find (\w+) where (\w+) is (\w+)"), "where equals"),
     (re.compile(r"find (\w+) where (\w+) contains '(.+?)'"), "where contains"),
 ]
+SQL_NATURAL_LANGUAGE_MATCHER = PatternMatcher(SQL_NATURAL_LANGUAGE_PATTERNS)
+
+# Template slot filled by each group of the patterns above (None: not used)
+SQL_NATURAL_LANGUAGE_SLOTS = {
+    "group by": ('A', 'B'),
+    "average": ('A', 'B'),
+    "count group by": ('A', 'B'),
+    "greater than": ('A', 'value'),
+    "less than": ('A', 'value'),
+    "between": ('A', 'low', 'high'),
+    "order by": (None, 'A', 'direction'),
+    "top n order by": ('n', None, 'A'),
+    "having": ('B', 'A', 'value'),
+    "join": ('T1', 'T2', 'J1', 'C1', 'J2', 'C2'),
+    "where equals": (None, 'B', 'value'),
+    "where contains": (None, 'B', 'value')
+}
 
 # Explore SQL Databases
 def SQL_explore_databases():
     response = "Available Databases and Tables:\n"
-    for db_name, tables in SQL_DATABASES.items():
-        response += f"- {db_name}:\n"
-        for table, fields in tables.items():
-            fields_formatted = ", ".join(fields)  # Concatenate fields with commas
-            response += f"  - Table: {table}\n"
-            response += f"    Fields: {fields_formatted}\n"  # Add fields in one line
+    response += f"- {MYSQL_CONFIG['database']}:\n"
+    for table, entry in get_catalog().tables('mysql').items():
+        fields_formatted = ", ".join(entry['columns'])  # Concatenate fields with commas
+        response += f"  - Table: {table}\n"
+        response += f"    Fields: {fields_formatted}\n"  # Add fields in one line
     return response
 
 
 
-# Generate SQL query based on a construct
-def SQL_generate_query_with_construct(table, construct):
-    if table not in SQL_DATABASES["chatDB"]:
+# Generate SQL query based on a construct, filling its slots from the message
+def SQL_generate_query_with_construct(table, construct, slots=None, message=''):
+    entry = get_catalog().entry('mysql', table)
+    if entry is None:
         return "Invalid table specified."
 
-    quantitative_attrs = SQL_QUANTITATIVE_ATTRIBUTES.get(table, [])
-    qualitative_attrs = SQL_QUALITATIVE_ATTRIBUTES.get(table, [])
-
-    if not quantitative_attrs or not qualitative_attrs:
-        return "Insufficient attributes to generate queries."
-
-    A = random.choice(quantitative_attrs)
-    B = random.choice(qualitative_attrs)
+    try:
+        return GeneratedQuery(SQL_build_construct_query(table, entry, construct, QuerySlots(table, entry, slots, message)))
+    except QuerySlotError as e:
+        return str(e)
 
+def SQL_build_construct_query(table, entry, construct, slots):
     if construct == "group by":
+        A, B = slots.quantitative('A'), slots.qualitative('B')
         return f"SELECT {B}, SUM({A}) AS total_{A} FROM {table} GROUP BY {B};"
     elif construct == "average":
+        A, B = slots.quantitative('A'), slots.qualitative('B')
         return f"SELECT {B}, AVG({A}) AS average_{A} FROM {table} GROUP BY {B};"
     elif construct == "count group by":
+        A, B = slots.optional_column('A'), slots.qualitative('B')
+        if A is None:
+            return f"SELECT {B}, COUNT(*) AS count FROM {table} GROUP BY {B};"
         return f"SELECT {B}, COUNT({A}) AS count_{A} FROM {table} GROUP BY {B};"
     elif construct == "greater than":
-        return f"SELECT * FROM {table} WHERE {A} > 1;"
+        A = slots.any_column('A')
+        return f"SELECT * FROM {table} WHERE {A} > {slots.number('value', 1)};"
     elif construct == "less than":
-        return f"SELECT * FROM {table} WHERE {A} < 1;"
+        A = slots.any_column('A')
+        return f"SELECT * FROM {table} WHERE {A} < {slots.number('value', 1)};"
     elif construct == "between":
-        return f"SELECT * FROM {table} WHERE {A} BETWEEN 50 AND 60;"
+        A = slots.any_column('A')
+        low, high = slots.number('low', 50), slots.number('high', 60)
+        return f"SELECT * FROM {table} WHERE {A} BETWEEN {low} AND {high};"
     elif construct == "order by":
-        return f"SELECT * FROM {table} ORDER BY {A} ASC;"
+        A = slots.any_column('A')
+        return f"SELECT * FROM {table} ORDER BY {A} {'DESC' if slots.descending(False) else 'ASC'};"
     elif construct == "top n order by":
-        return f"SELECT * FROM {table} ORDER BY {A} DESC LIMIT 10;"
+        A = slots.any_column('A')
+        n = slots.count('n', 10, f"top 5 {table} by {A}")
+        return f"SELECT * FROM {table} ORDER BY {A} {'DESC' if slots.descending(True) else 'ASC'} LIMIT {n};"
     elif construct == "having":
-        return f"SELECT {B}, SUM({A}) AS total_{A} FROM {table} GROUP BY {B} HAVING SUM({A}) > 1;"
+        A, B = slots.quantitative('A'), slots.qualitative('B')
+        return f"SELECT {B}, SUM({A}) AS total_{A} FROM {table} GROUP BY {B} HAVING SUM({A}) > {slots.number('value', 1)};"
     elif construct == "join":
-        return f"SELECT * FROM {table} T1 INNER JOIN {random.choice(list(SQL_DATABASES['chatDB'].keys()))} T2 ON T1.{B} = T2.{B};"
+        return SQL_generate_join_query(table, entry, slots)
     elif construct == "where equals":
-        return f"SELECT * FROM {table} WHERE {B} = 'value';"
+        B = slots.column('B', pool=entry['qualitative'] + entry['columns'])
+        value = slots.value('value', f"find {table} where {B} is <value>")
+        return f"SELECT * FROM {table} WHERE {B} = {MessageLiteral(value, 'sql')};"
     elif construct == "where contains":
-        return f"SELECT * FROM {table} WHERE {B} LIKE '%value%';"
+        B = slots.column('B', pool=entry['qualitative'] + entry['columns'])
+        value = slots.value('value', f"find {table} where {B} contains '<text>'")
+        return f"SELECT * FROM {table} WHERE {B} LIKE {MessageLiteral(value, 'sql_like')};"
     else:
-        return "Construct not recognized."
+        raise QuerySlotError("Construct not recognized.")
+
+# JOIN from "join T1 and T2 on T1.C1 = T2.C2"; without it, join the first other
+# table that shares a column with this one
+def SQL_generate_join_query(table, entry, slots):
+    catalog = get_catalog()
+    tables = catalog.tables('mysql')
+    captured = slots.captured
+    if 'T2' not in captured:
+        for other, other_entry in tables.items():
+            if other == table:
+                continue
+            shared = shared_join_column(entry, other_entry)
+            if shared:
+                return f"SELECT * FROM {table} T1 INNER JOIN {other} T2 ON T1.{shared[0]} = T2.{shared[1]};"
+        raise QuerySlotError(f"No table shares a column with {table}; "
+                             f"try 'join {table} and <table> on {table}.<column> = <table>.<column>'.")
+
+    resolved = {}
+    for slot in ('T1', 'T2', 'J1', 'J2'):
+        name = catalog.resolve('mysql', captured[slot])
+        if name is None:
+            raise QuerySlotError(f"Invalid table specified: '{captured[slot]}'.")
+        resolved[slot] = name
+    for side, column_slot in (('J1', 'C1'), ('J2', 'C2')):
+        if resolved[side] not in (resolved['T1'], resolved['T2']):
+            raise QuerySlotError(f"Table '{resolved[side]}' is not part of the join.")
+        column = resolve_column(tables[resolved[side]], captured[column_slot])
+        if column is None:
+            raise QuerySlotError(f"Unknown column '{captured[column_slot]}' in {resolved[side]}.")
+        resolved[column_slot] = column
+    return (f"SELECT * FROM {resolved['T1']} INNER JOIN {resolved['T2']} "
+            f"ON {resolved['J1']}.{resolved['C1']} = {resolved['J2']}.{resolved['C2']};")
 
 # Generate predefined SQL sample queries
 def SQL_generate_sample_queries(table):
@@ -467,45 +4872,63 @@ def SQL_generate_sample_queries(table):
     }
 
     if table not in queries_map:
-        return ["Invalid table specified."]
+        entry = get_catalog().entry('mysql', table)
+        if entry is None:
+            return ["Invalid table specified."]
+        return SQL_generic_sample_queries(table, entry)
     return random.sample(queries_map[table], 3)
 
+# Sample queries for tables without a hand-written list, built from their catalog entry
+def SQL_generic_sample_queries(table, entry):
+    queries = [f"SELECT * FROM {table} LIMIT 10;"]
+    if entry['qualitative']:
+        B = entry['qualitative'][0]
+        queries.append(f"SELECT {B}, COUNT(*) AS {B}_count FROM {table} GROUP BY {B};")
+        queries.append(f"SELECT DISTINCT {B} FROM {table};")
+    for A in entry['quantitative'][:2]:
+        queries.append(f"SELECT AVG({A}) AS average_{A} FROM {table};")
+        queries.append(f"SELECT * FROM {table} ORDER BY {A} DESC LIMIT 5;")
+    return random.sample(queries, min(3, len(queries)))
+
 # Generate SQL query from natural language
 def SQL_generate_query_from_natural_language(message, table):
-    for pattern, construct in SQL_NATURAL_LANGUAGE_PATTERNS:
-        match = pattern.search(message)
-        if match:
-            return SQL_generate_query_with_construct(table, construct)
+    match = SQL_NATURAL_LANGUAGE_MATCHER.match(message)
+    if match:
+        construct, groups = match
+        slots = captured_slots(SQL_NATURAL_LANGUAGE_SLOTS[construct], groups)
+        return SQL_generate_query_with_construct(table, construct, slots, message)
     return "Could not interpret the request."
 
 def determine_SQL_response(message):
-    message = message.lower()
+    return translate_chat_message('mysql', message)[0]
+
+def SQL_interpret_message(message):
+    found = get_chat_keyword_matcher('mysql', SQL_QUERY_PATTERNS).scan(unquoted_message(message))
+    table = found['table']
 
     # Handle explore request
-    if "explore" in message:
+    if "explore" in found['commands']:
         return SQL_explore_databases()
 
     # Handle sample queries request
-    if "sample" in message:
-        for table in SQL_DATABASES["chatDB"].keys():
-            if table in message:
-                return "\n".join(SQL_generate_sample_queries(table))
-        return "Please specify a valid table: 'courses', 'enrollments', 'sales', or 'students'."
+    if "sample" in found['commands']:
+        if table is not None:
+            return "\n".join(SQL_generate_sample_queries(table))
+        tables = get_catalog().tables('mysql')
+        return f"Please specify a valid table: {', '.join(repr(table) for table in tables)}."
 
-    # Handle construct keywords and specific tables
-    for construct in SQL_QUERY_PATTERNS.keys():
-        if construct in message:
-            for table in SQL_DATABASES["chatDB"].keys():
-                if table in message:
-                    return SQL_generate_query_with_construct(table, construct)
+    if table is None:
+        return "Error: Could not interpret the request."
 
-    # Handle natural language query
-    for table in SQL_DATABASES["chatDB"].keys():
-        if table in message:
-            return SQL_generate_query_from_natural_language(message, table)
+    # Handle natural language query; a full phrase fills the query's slots
+    # and so takes precedence over a bare construct keyword
+    if SQL_NATURAL_LANGUAGE_MATCHER.match(message) or found['construct'] is None:
+        return SQL_generate_query_from_natural_language(message, table)
 
-    return "Error: Could not interpret the request."
+    # Handle construct keywords and specific tables
+    return SQL_generate_query_with_construct(table, found['construct'], message=message)
 
+# Built-in schema of the sample collections, the catalog's fallback for MongoDB
 DATABASES = {
     "chatDB": {
         "products": {
@@ -548,122 +4971,154 @@ CONSTRUCT_KEYWORDS = {
 
 def explore_databases():
     response = "Available Databases and Collections:\n"
-    for db_name, collections in DATABASES.items():
-        response += f"- {db_name}:\n"
-        for collection, details in collections.items():
-            fields = ", ".join(details["fields"])
-            response += f"  - Collection: {collection}\n"
-            response += f"    Fields: {fields}\n"
+    response += f"- {MONGO_DB_NAME}:\n"
+    for collection, entry in get_catalog().tables('mongodb').items():
+        fields = ", ".join(entry['columns'])
+        response += f"  - Collection: {collection}\n"
+        response += f"    Fields: {fields}\n"
     return response.strip()
 
 QUERY_PATTERNS = [
     (re.compile(r"(find|show|list)\s+total\s+(\w+)\s+by\s+(\w+)\s+in\s+(\w+)"), "total <A> by <B>"),
     (re.compile(r"(find|show|list)\s+average\s+(\w+)\s+by\s+(\w+)\s+in\s+(\w+)"), "average <A> by <B>"),
     (re.compile(r"(find|show|list)\s+count\s+of\s+(\w+)\s+in\s+(\w+)"), "count of <B>"),
-    (re.compile(r"(find|list)\s+(\w+)\s+greater\s+than\s+(\d+)\s+in\s+(\w+)"), "find <A> greater than a threshold"),
-    (re.compile(r"(find|list)\s+(\w+)\s+less\s+than\s+(\d+)\s+in\s+(\w+)"), "find <A> less than a threshold"),
+    (re.compile(r"(find|list)\s+(\w+)\s+greater\s+than\s+(-?\d+(?:\.\d+)?)\s+in\s+(\w+)"), "find <A> greater than a threshold"),
+    (re.compile(r"(find|list)\s+(\w+)\s+less\s+than\s+(-?\d+(?:\.\d+)?)\s+in\s+(\w+)"), "find <A> less than a threshold"),
     (re.compile(r"(list|show)\s+all\s+(\w+)\s+sorted\s+by\s+(\w+)\s+in\s+(\w+)"), "list all <B> sorted by <A>"),
     (re.compile(r"unwind\s+(\w+)\s+in\s+(\w+)"), "unwind <B> to flatten arrays"),
     (re.compile(r"join\s+(\w+)\s+with\s+(\w+)\s+on\s+(\w+)"), "join <B> with <C> on <D>"),
     (re.compile(r"project\s+only\s+(\w+)\s+and\s+(\w+)\s+in\s+(\w+)"), "projection")
 ]
+QUERY_MATCHER = PatternMatcher(QUERY_PATTERNS)
 
-def generate_mongo_query(template, collection):
-    quantitative_attrs = QUANTITATIVE_ATTRIBUTES.get(collection, [])
-    qualitative_attrs = QUALITATIVE_ATTRIBUTES.get(collection, [])
+# Template slot filled by each group of the patterns above (None: not used)
+QUERY_SLOTS = {
+    "total <A> by <B>": (None, 'A', 'B', 'collection'),
+    "average <A> by <B>": (None, 'A', 'B', 'collection'),
+    "count of <B>": (None, 'B', 'collection'),
+    "find <A> greater than a threshold": (None, 'A', 'value', 'collection'),
+    "find <A> less than a threshold": (None, 'A', 'value', 'collection'),
+    "list all <B> sorted by <A>": (None, None, 'A', 'collection'),
+    "unwind <B> to flatten arrays": ('B', 'collection'),
+    "join <B> with <C> on <D>": ('collection', 'C', 'D'),
+    "projection": ('A', 'B', 'collection')
+}
 
-    if not quantitative_attrs or not qualitative_attrs:
+# Generate a MongoDB query from a template, filling its slots from the message.
+# The result is the shell text shown in chat; its .query holds the pipeline.
+def generate_mongo_query(template, collection, slots=None, message=''):
+    collections = get_catalog().tables('mongodb')
+    entry = collections.get(collection)
+    if entry is None:
         return "Error: Invalid dataset or attributes."
 
-    quantitative_attr = random.choice(quantitative_attrs)
-    qualitative_attr = random.choice(qualitative_attrs)
+    try:
+        query = build_mongo_template_query(template, collection, entry, collections,
+                                           QuerySlots(collection, entry, slots, message))
+    except QuerySlotError as e:
+        return f"Error: {e}"
+    return GeneratedQuery(mongo_shell_text(collection, query), {'collection': collection, 'pipeline': mongo_query_pipeline(query)})
+
+# Output field name for a path; $group rejects names containing dots
+def mongo_alias(path):
+    return path.replace('.', '_')
 
+# $unwind stages that $group needs before it reads paths inside arrays: one
+# value per element instead of the whole array
+def mongo_unwind_stages(entry, *paths):
+    arrays = sorted({array for path in paths for array in enclosing_arrays(path, entry['arrays'])}, key=len)
+    return [{"$unwind": f"${array}"} for array in arrays]
+
+# Query for a template as either an aggregation pipeline or find() arguments
+def build_mongo_template_query(template, collection, entry, collections, slots):
     if template == "total <A> by <B>":
-        return f'''
-db.{collection}.aggregate([
-    {{
-        "$group": {{
-            "_id": "${qualitative_attr}",
-            "total_{quantitative_attr}": {{
-                "$sum": "${quantitative_attr}"
-            }}
-        }}
-    }}
-])
-'''
+        quantitative_attr, qualitative_attr = slots.quantitative('A'), slots.qualitative('B')
+        return {'pipeline': mongo_unwind_stages(entry, quantitative_attr, qualitative_attr) + [
+            {"$group": {"_id": f"${qualitative_attr}", f"total_{mongo_alias(quantitative_attr)}": {"$sum": f"${quantitative_attr}"}}}]}
     elif template == "average <A> by <B>":
-        return f'''
-db.{collection}.aggregate([
-    {{
-        "$group": {{
-            "_id": "${qualitative_attr}",
-            "average_{quantitative_attr}": {{
-                "$avg": "${quantitative_attr}"
-            }}
-        }}
-    }}
-])
-'''
+        quantitative_attr, qualitative_attr = slots.quantitative('A'), slots.qualitative('B')
+        return {'pipeline': mongo_unwind_stages(entry, quantitative_attr, qualitative_attr) + [
+            {"$group": {"_id": f"${qualitative_attr}", f"average_{mongo_alias(quantitative_attr)}": {"$avg": f"${quantitative_attr}"}}}]}
     elif template == "count of <B>":
-        return f'''
-db.{collection}.aggregate([
-    {{
-        "$group": {{
-            "_id": "${qualitative_attr}",
-            "count": {{
-                "$sum": 1
-            }}
-        }}
-    }}
-])
-'''
-    elif template == "find <A> greater than a threshold":
-        return f'''
-db.{collection}.find({{
-    "{quantitative_attr}": {{
-        "$gt": 1
-    }}
-}})
-'''
+        qualitative_attr = slots.qualitative('B')
+        return {'pipeline': mongo_unwind_stages(entry, qualitative_attr) + [
+            {"$group": {"_id": f"${qualitative_attr}", "count": {"$sum": 1}}}]}
+    elif template in ("find <A> greater than a threshold", "find <A> less than a threshold"):
+        attr = slots.any_column('A')
+        operator = "$gt" if "greater" in template else "$lt"
+        return {'filter': {attr: {operator: slots.number('value', 1)}}}
     elif template == "list all <B> sorted by <A>":
-        return f'''
-db.{collection}.find().sort({{
-    "{quantitative_attr}": 1
-}})
-'''
+        attr = slots.any_column('A')
+        return {'filter': {}, 'sort': {attr: -1 if slots.descending(False) else 1}}
     elif template == "unwind <B> to flatten arrays":
-        return f'''
-db.{collection}.aggregate([
-    {{
-        "$unwind": "${qualitative_attr}"
-    }}
-])
-'''
+        if 'B' in slots.captured:
+            array_attr = slots.column('B')
+        else:
+            array_attr = slots.column('B', entry['arrays'], 'array')
+        return {'pipeline': [{"$unwind": f"${array_attr}"}]}
     elif template == "join <B> with <C> on <D>":
-        foreign_collection = random.choice(list(DATABASES["chatDB"].keys()))
-        foreign_field = random.choice(DATABASES["chatDB"][foreign_collection]["fields"])
-        return f'''
-db.{collection}.aggregate([
-    {{
-        "$lookup": {{
-            "from": "{foreign_collection}",
-            "localField": "{qualitative_attr}",
-            "foreignField": "{foreign_field}",
-            "as": "joined_data"
-        }}
-    }}
-])
-'''
+        foreign_collection, local_field, foreign_field = mongo_join_fields(collection, entry, collections, slots)
+        return {'pipeline': [{"$lookup": {"from": foreign_collection, "localField": local_field,
+                                          "foreignField": foreign_field, "as": "joined_data"}}]}
     elif template == "projection":
-        second_field = random.choice(qualitative_attrs)
-        return f'''
-db.{collection}.find({{ }}, {{
-    "{qualitative_attr}": 1,
-    "{second_field}": 1
-}})
-'''
+        first_field = slots.column('A', pool=entry['qualitative'] + entry['columns'])
+        second_field = slots.column('B', pool=entry['qualitative'] + entry['columns'])
+        return {'filter': {}, 'projection': {first_field: 1, second_field: 1}}
     else:
-        return "Error: Invalid query template."
+        raise QuerySlotError("Invalid query template.")
+
+# JSON as shown in the shell text; message literals stay markers
+def mongo_shell_json(value):
+    text = json.dumps(value, indent=4, default=format)
+    return re.sub(r'"\\u0000(\w+):(.*?)\\u0000"', lambda match: f"\x00{match.group(1)}:{match.group(2)}\x00", text)
+
+def mongo_shell_text(collection, query):
+    if 'pipeline' in query:
+        return f"\ndb.{collection}.aggregate({mongo_shell_json(query['pipeline'])})\n"
+    text = f"\ndb.{collection}.find("
+    if query['filter'] or 'projection' in query:
+        text += mongo_shell_json(query['filter'])
+    if 'projection' in query:
+        text += ", " + mongo_shell_json(query['projection'])
+    text += ")"
+    if 'sort' in query:
+        text += f".sort({mongo_shell_json(query['sort'])})"
+    return text + "\n"
+
+def mongo_query_pipeline(query):
+    if 'pipeline' in query:
+        return query['pipeline']
+    pipeline = [{'$match': query['filter']}] if query['filter'] else []
+    if 'projection' in query:
+        pipeline.append({'$project': query['projection']})
+    if 'sort' in query:
+        pipeline.append({'$sort': query['sort']})
+    return pipeline
+
+# $lookup fields from "join A with B on field"; without it, follow the first
+# <name>Id field that names another collection, then any field shared with one
+def mongo_join_fields(collection, entry, collections, slots):
+    if 'C' in slots.captured:
+        foreign_collection = get_catalog().resolve('mongodb', slots.captured['C'])
+        if foreign_collection is None:
+            raise QuerySlotError(f"Invalid collection specified: '{slots.captured['C']}'.")
+        local_field = slots.column('D')
+        foreign_field = resolve_column(collections[foreign_collection], slots.captured['D']) or '_id'
+        return foreign_collection, local_field, foreign_field
+
+    names = {name.lower(): name for name in collections if name != collection}
+    for field in entry['columns']:
+        if field == '_id' or not is_id_column(field):
+            continue
+        stem = re.sub(r'_?id$', '', field.rsplit('.', 1)[-1], flags=re.IGNORECASE).lower()
+        for candidate in (stem + 's', stem + 'es', stem):
+            if candidate in names:
+                return names[candidate], field, '_id'
+    for name in names.values():
+        shared = shared_join_column(entry, collections[name])
+        if shared:
+            return name, shared[0], shared[1]
+    raise QuerySlotError(f"No collection to join {collection} with; try 'join {collection} with <collection> on <field>'.")
 
 def generate_sample_queries(collection):
     queries_map = {
@@ -694,38 +5149,126 @@ def generate_sample_queries(collection):
     }
 
     if collection not in queries_map:
-        return ["Invalid collection specified."]
+        entry = get_catalog().entry('mongodb', collection)
+        if entry is None:
+            return ["Invalid collection specified."]
+        return generic_sample_queries(collection, entry)
     return random.sample(queries_map[collection], 3)
 
+# Sample queries for collections without a hand-written list, built from their catalog entry
+def generic_sample_queries(collection, entry):
+    queries = [f'''db.{collection}.find().limit(5)''']
+    if entry['qualitative']:
+        B = entry['qualitative'][0]
+        queries.append(f'''db.{collection}.distinct("{B}")''')
+        queries.append(f'''db.{collection}.aggregate([{{"$group": {{"_id": "${B}", "count": {{"$sum": 1}}}}}}])''')
+    for A in entry['quantitative'][:2]:
+        queries.append(f'''db.{collection}.find().sort({{"{A}": -1}}).limit(5)''')
+    for path in entry['arrays'][:1]:
+        queries.append(f'''db.{collection}.aggregate([{{"$unwind": "${path}"}}])''')
+    return random.sample(queries, min(3, len(queries)))
+
 def determine_response(message):
-    message = message.lower()
+    return translate_chat_message('mongodb', message)[0]
 
-    if "explore" in message:
+def interpret_message(message):
+    catalog = get_catalog()
+    found = get_chat_keyword_matcher('mongodb', CONSTRUCT_KEYWORDS).scan(unquoted_message(message))
+    collection = found['table']
+
+    if "explore" in found['commands']:
         return explore_databases()
 
-    if "sample" in message:
-        for collection in DATABASES["chatDB"].keys():
-            if collection in message:
-                return "\n".join(generate_sample_queries(collection))
-        return "Please specify a valid collection: 'products', 'orders', or 'reviews'."
-
-    for construct in CONSTRUCT_KEYWORDS.keys():
-        if construct in message:
-            for collection in DATABASES["chatDB"].keys():
-                if collection in message:
-                    return generate_mongo_query(CONSTRUCT_KEYWORDS[construct], collection)
-
-    for pattern, template in QUERY_PATTERNS:
-        match = pattern.search(message)
-        if match:
-            collection = match.groups()[-1]
-            if collection in DATABASES["chatDB"]:
-                return generate_mongo_query(template, collection)
+    if "sample" in found['commands']:
+        if collection is not None:
+            return "\n".join(generate_sample_queries(collection))
+        collections = catalog.tables('mongodb')
+        return f"Please specify a valid collection: {', '.join(repr(collection) for collection in collections)}."
+
+    # A full phrase fills the query's slots, so it takes precedence over a bare construct keyword
+    for template, groups in QUERY_MATCHER.finditer(message):
+        slots = captured_slots(QUERY_SLOTS[template], groups)
+        resolved = catalog.resolve('mongodb', slots['collection'])
+        if resolved is not None:
+            return generate_mongo_query(template, resolved, slots, message)
+
+    if found['construct'] is not None and collection is not None:
+        return generate_mongo_query(CONSTRUCT_KEYWORDS[found['construct']], collection, message=message)
 
     return "Error: Could not interpret the Query"
 
 
 
+# Translate a chat message and run the resulting query in the same request.
+# Returns the response text, the structured query, the first page of results
+# and how long each stage took.
+def execute_chat_message(db_type, message, options):
+    timings = {}
+    started = time.perf_counter()
+    with stage_timer('chat_translate'):
+        text, query, translation_status = translate_chat_message(db_type, message)
+    timings['translate_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    payload = {'response': text, 'query': query, 'translation_cache': translation_status, 'timings': timings}
+    if query is None:
+        payload['error'] = 'The message did not produce a query to run'
+        return payload, 400
+
+    max_rows = row_limits(options)[0]
+    page_size = int(options.get('page_size') or app.config['RESULT_FETCH_SIZE'])
+    try:
+        budget_ms = query_budget_ms(options)
+    except (TypeError, ValueError) as e:
+        payload['error'] = str(e)
+        return payload, 400
+    try:
+        running = admit_query(db_type, options.get('query_id'), budget_ms)
+    except ValueError as e:
+        payload['error'] = str(e)
+        return payload, 409
+    payload['query_id'] = running.id
+
+    # The first page is paged like execute_query's, so only the watchdog bounds it
+    stage_started = time.perf_counter()
+    try:
+        try:
+            if db_type == 'mysql':
+                result = open_mysql_result(query['sql'], page_size, query['params'], running)
+            else:
+                result = open_mongo_pipeline(query['collection'], query['pipeline'], page_size, running)
+        except PoolTimeoutError:
+            raise
+        except Exception as e:
+            error, status = query_error_payload(running, e)
+            payload.update(error)
+            return payload, status
+        timings['execute_ms'] = round((time.perf_counter() - stage_started) * 1000, 3)
+
+        stage_started = time.perf_counter()
+        try:
+            payload['result'] = page_query_result(result, page_size, max_rows)
+        except Exception as e:
+            result.close(exhausted=False)
+            error, status = query_error_payload(running, e)
+            payload.update(error)
+            return payload, status
+    finally:
+        finish_query(running)
+    timings['fetch_ms'] = round((time.perf_counter() - stage_started) * 1000, 3)
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return payload, 200
+
+
+# Body and Server-Timing header of an executed chat message
+def encode_chat_payload(payload):
+    started = time.perf_counter()
+    body = dumps_json(payload)
+    metrics.observe('chatdb_stage_duration_seconds', time.perf_counter() - started, stage='serialize')
+    # Serialization can only be timed after the body is built, so it goes in the header
+    timings = dict(payload['timings'], serialize_ms=round((time.perf_counter() - started) * 1000, 3))
+    server_timing = ', '.join(f"{stage[:-3]};dur={duration}" for stage, duration in timings.items())
+    return body, server_timing
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
@@ -736,16 +5279,28 @@ def chat():
         message = data['message']
         first_word = message.split(' ')[0].lower()
 
+        # One round trip: translate and run, answering with the first page of results
+        if data.get('execute') and first_word in ("sql", "nosql"):
+            db_type = 'mysql' if first_word == "sql" else 'mongodb'
+            payload, status = execute_chat_message(db_type, message[len(first_word) + 1:], data)
+            body, server_timing = encode_chat_payload(payload)
+            headers = {'Server-Timing': server_timing}
+            if 'query_id' in payload:
+                headers['X-Query-Id'] = payload['query_id']
+            return Response(body, status=status, mimetype='application/json', headers=headers)
+
         if first_word == "sql":
             try:
-                response = determine_SQL_response(message[len("sql "):])
+                with stage_timer('chat_translate'):
+                    response = determine_SQL_response(message[len("sql "):])
                 return jsonify({'response': response}), 200
             except Exception as e:
                 return jsonify({'response': f"Failed to process SQL query: {str(e)}"}), 500
 
         elif first_word == "nosql":
             try:
-                response = determine_response(message[len("nosql "):])
+                with stage_timer('chat_translate'):
+                    response = determine_response(message[len("nosql "):])
                 return jsonify({'response': response}), 200
             except Exception as e:
                 return jsonify({'response': f"Failed to process NoSQL query: {str(e)}"}), 500
@@ -753,6 +5308,9 @@ def chat():
         else:
             return jsonify({'response': 'Error: Invalid database type specified. Use SQL or NoSQL.'}), 400
 
+    # Answered with 429 and 503 by their error handlers
+    except (QueryRejectedError, PoolTimeoutError):
+        raise
     except Exception as e:
         return jsonify({'response': f"Internal server error: {str(e)}"}), 500
 
@@ -0,0 +1,564 @@
+"""Async (ASGI) serving mode for ChatDB.
+
+/api/execute_query, /api/chat and /api/explore run on non-blocking database
+drivers (aiomysql for MySQL, Motor for MongoDB), so one process keeps many
+queries in flight without holding a thread per request. Query analysis,
+pipeline building, chat translation, the result cache, admission control and
+JSON encoding are the functions app.py uses. Every other route (uploads,
+stats, metrics, ...) and the options the async handlers do not cover (paging
+and cursors, streaming, Arrow/Parquet export, explain, chat messages that are
+only translated) are served by the Flask app on a worker thread.
+
+    pip install starlette uvicorn aiomysql motor a2wsgi
+    uvicorn asgi:app --port 5000
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import time
+
+import aiomysql
+from a2wsgi import WSGIMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+import app as chatdb
+from app import metrics, stage_timer
+
+
+config = chatdb.app.config
+
+
+# a2wsgi closes the response iterable when the body is sent, which is what
+# releases a streamed or exported query's slot and connection
+flask_app = WSGIMiddleware(chatdb.app)
+
+
+# Connection pools, created on first use inside the server's event loop
+
+mysql_pool = None
+motor_client = None
+_pool_lock = asyncio.Lock()
+
+
+# MYSQL_CONFIG under aiomysql's argument names
+def aiomysql_options():
+    options = {key: value for key, value in chatdb.MYSQL_CONFIG.items() if key != 'database'}
+    options['db'] = chatdb.MYSQL_CONFIG.get('database')
+    return options
+
+
+async def get_async_mysql_pool():
+    global mysql_pool
+    if mysql_pool is None:
+        async with _pool_lock:
+            if mysql_pool is None:
+                mysql_pool = await aiomysql.create_pool(minsize=0, maxsize=config['MYSQL_POOL_SIZE'],
+                                                        **aiomysql_options())
+    return mysql_pool
+
+
+# A pooled connection, or PoolTimeoutError (503) after MYSQL_POOL_TIMEOUT seconds
+async def acquire_mysql_connection():
+    pool = await get_async_mysql_pool()
+    started = time.perf_counter()
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), config['MYSQL_POOL_TIMEOUT'])
+    except asyncio.TimeoutError:
+        raise chatdb.PoolTimeoutError(f"No MySQL connection available within {config['MYSQL_POOL_TIMEOUT']}s "
+                                      f"(pool size {config['MYSQL_POOL_SIZE']})")
+    metrics.observe('chatdb_stage_duration_seconds', time.perf_counter() - started, stage='mysql_pool_wait')
+    return pool, conn
+
+
+# Motor shares the pool listener, so its connections show up in /api/stats
+def get_motor_database():
+    global motor_client
+    if motor_client is None:
+        motor_client = AsyncIOMotorClient(
+            chatdb.MONGO_URI,
+            maxPoolSize=config['MONGO_MAX_POOL_SIZE'],
+            waitQueueTimeoutMS=config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+            event_listeners=[chatdb.mongo_pool_listener]
+        )
+    return motor_client[chatdb.MONGO_DB_NAME]
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    if mysql_pool is not None:
+        mysql_pool.close()
+        await mysql_pool.wait_closed()
+    if motor_client is not None:
+        motor_client.close()
+
+
+# Running queries
+
+# Cancel callback of a query awaited on the event loop. It is called from the
+# watchdog or the cancel route's thread: stop the query on the server first,
+# then cancel the task waiting for it.
+def stop_async_query(loop, task, kill=None):
+    try:
+        if kill is not None:
+            kill()
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+
+
+# Run one statement on a pooled connection. limit=None reads every row;
+# otherwise at most limit rows are read and a connection with rows left
+# unread is closed rather than drained. Returns (headers, rows, more).
+async def run_async_mysql(sql, params=None, limit=None, running=None):
+    pool, conn = await acquire_mysql_connection()
+    if running is not None:
+        kill = functools.partial(chatdb.kill_mysql_query, conn.get_thread_id())
+        running.set_cancel(functools.partial(stop_async_query, asyncio.get_running_loop(),
+                                             asyncio.current_task(), kill))
+    try:
+        cursor = await conn.cursor(aiomysql.Cursor if limit is None else aiomysql.SSCursor)
+        with stage_timer('mysql_execute'):
+            await cursor.execute(sql, params)
+        headers = [desc[0] for desc in cursor.description] if cursor.description else []
+        with stage_timer('mysql_fetch'):
+            if cursor.description is None:
+                rows = []
+            elif limit is None:
+                rows = await cursor.fetchall()
+            else:
+                rows = await cursor.fetchmany(limit + 1)
+        more = limit is not None and len(rows) > limit
+        if more:
+            conn.close()
+            rows = rows[:limit]
+        else:
+            await cursor.close()
+            await conn.commit()
+        return headers, list(rows), more
+    except asyncio.CancelledError:
+        # The connection may be in the middle of a result
+        conn.close()
+        raise
+    finally:
+        if running is not None:
+            running.set_cancel(None)
+        pool.release(conn)
+
+
+# Run an aggregation pipeline; limit works as in run_async_mysql.
+# Returns (documents, more).
+async def run_async_mongo(collection_name, pipeline, limit=None, running=None):
+    options = chatdb.mongo_query_options(running)
+    if running is not None:
+        kill = functools.partial(chatdb.kill_mongo_query, running.id)
+        running.set_cancel(functools.partial(stop_async_query, asyncio.get_running_loop(),
+                                             asyncio.current_task(), kill))
+    if limit is not None:
+        options['batchSize'] = limit + 1
+    try:
+        cursor = get_motor_database()[collection_name].aggregate(pipeline, **options)
+        with stage_timer('mongodb_execute'):
+            documents = await cursor.to_list(None if limit is None else limit + 1)
+        more = limit is not None and len(documents) > limit
+        if more:
+            await cursor.close()
+            documents = documents[:limit]
+        return documents, more
+    finally:
+        if running is not None:
+            running.set_cancel(None)
+
+
+# Like app.admit_query, but a request only takes a thread while it waits in the queue
+async def admit_query_async(db_type, query_id, budget_ms):
+    if not chatdb.query_admission.acquire(db_type, blocking=False):
+        await asyncio.to_thread(chatdb.query_admission.acquire, db_type)
+    return chatdb.admit_query(db_type, query_id, budget_ms, admitted=True)
+
+
+# Await a query in its own task, so a cancel or timeout stops only the query:
+# (payload, 200), or the error payload and status of app.query_error_payload
+async def run_query_task(running, coroutine):
+    try:
+        return await asyncio.create_task(coroutine), 200
+    except asyncio.CancelledError:
+        if running.reason is None:
+            raise
+        return chatdb.query_error_payload(running, None)
+    except chatdb.PoolTimeoutError:
+        raise
+    except Exception as e:
+        return chatdb.query_error_payload(running, e)
+
+
+async def mysql_result_payload(sql, running):
+    headers, rows, _ = await run_async_mysql(sql, running=running)
+    metrics.inc('chatdb_rows_returned_total', len(rows), db_type='mysql')
+    return {'headers': headers, 'result': rows}
+
+
+async def mongo_result_payload(user_query, running):
+    collection_name, pipeline = chatdb.build_mongo_pipeline(json.loads(user_query))
+    documents, _ = await run_async_mongo(collection_name, pipeline, running=running)
+    with stage_timer('format'):
+        headers, result = chatdb.align_documents(documents)
+    metrics.inc('chatdb_rows_returned_total', len(result), db_type='mongodb')
+    return {'headers': headers, 'result': result}
+
+
+# Responses
+
+def json_response(payload, status=200, headers=None):
+    return Response(chatdb.dumps_json(payload), status_code=status, headers=headers, media_type='application/json')
+
+
+# Hands a request whose body was already read to the Flask app
+class ForwardToFlask:
+    def __init__(self, body):
+        self.body = body
+
+    async def __call__(self, scope, receive, send):
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {'type': 'http.request', 'body': self.body, 'more_body': False}
+
+        await flask_app(scope, replay, send)
+
+
+# Records the same request metrics as app.py's after_request hook
+def instrumented(rule):
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await handler(request)
+            if isinstance(response, ForwardToFlask):
+                return response
+            metrics.observe('chatdb_http_request_duration_seconds', time.perf_counter() - started, endpoint=rule)
+            metrics.inc('chatdb_http_requests_total', endpoint=rule, method=request.method,
+                        status=str(response.status_code))
+            metrics.inc('chatdb_http_response_bytes_total', len(response.body), endpoint=rule)
+            return response
+        return wrapper
+    return decorate
+
+
+async def read_json(request):
+    body = await request.body()
+    try:
+        return body, json.loads(body)
+    except ValueError:
+        return body, None
+
+
+def handle_query_rejected(request, e):
+    return json_response({'error': str(e)}, 429, {'Retry-After': '1'})
+
+
+def handle_pool_timeout(request, e):
+    return json_response({'error': str(e)}, 503)
+
+
+# Routes
+
+# Options only the Flask view implements
+FLASK_QUERY_OPTIONS = ('cursor', 'page_size', 'stream', 'explain')
+
+
+# app.run_full_query with the query awaited on the async drivers: (body, status, headers)
+async def run_full_query_async(options, db_type, user_query, analysis, layout, budget_ms):
+    cache_key = None
+    if analysis['cacheable'] and options.get('cache', True):
+        cache_key = chatdb.query_cache_key(db_type, analysis, layout)
+        body = chatdb.query_cache.get(cache_key)
+        if body is not None:
+            return body, 200, {'X-Query-Cache': 'HIT'}
+
+    try:
+        running = await admit_query_async(db_type, options.get('query_id'), budget_ms)
+    except ValueError as e:
+        return chatdb.dumps_json({'error': str(e)}), 409, {}
+    started = time.perf_counter()
+    try:
+        if db_type == 'mysql':
+            sql = chatdb.with_execution_time_hint(user_query, analysis, budget_ms)
+            payload, status = await run_query_task(running, mysql_result_payload(sql, running))
+            if status == 200:
+                chatdb.slow_query_log.observe(user_query, analysis, time.perf_counter() - started,
+                                              len(payload['result']))
+        else:
+            payload, status = await run_query_task(running, mongo_result_payload(user_query, running))
+    finally:
+        chatdb.finish_query(running)
+
+    body = chatdb.encode_query_payload(db_type, analysis, payload, status, layout, cache_key)
+    headers = {'X-Query-Id': running.id}
+    if status == 200 and cache_key is not None:
+        headers['X-Query-Cache'] = 'MISS'
+    return body, status, headers
+
+
+# Like app.run_batch_item; the semaphore stands in for the fan-out pool
+async def run_batch_item_async(options, slots):
+    async with slots:
+        started = time.perf_counter()
+        arguments, error = chatdb.prepare_batch_query(options)
+        try:
+            if error is not None:
+                body, status, headers = chatdb.dumps_json({'error': error}), 400, {}
+            else:
+                body, status, headers = await run_full_query_async(*arguments)
+        except chatdb.QueryRejectedError as e:
+            body, status, headers = chatdb.dumps_json({'error': str(e)}), 429, {}
+        except chatdb.PoolTimeoutError as e:
+            body, status, headers = chatdb.dumps_json({'error': str(e)}), 503, {}
+        return body, status, headers, round((time.perf_counter() - started) * 1000, 3)
+
+
+async def execute_query_batch(items):
+    if not isinstance(items, list) or not items:
+        return json_response({'error': 'queries must be a non-empty list'}, 400)
+    if len(items) > config['FANOUT_MAX_ITEMS']:
+        return json_response({'error': f"A batch holds at most {config['FANOUT_MAX_ITEMS']} queries"}, 400)
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(chatdb.FANOUT_WORKERS)
+    results = await asyncio.gather(*(run_batch_item_async(item, slots) for item in items))
+    body = chatdb.encode_query_batch(results, round((time.perf_counter() - started) * 1000, 3))
+    return Response(body, media_type='application/json')
+
+
+@instrumented('/api/execute_query')
+async def execute_query(request):
+    body, options = await read_json(request)
+    if isinstance(options, list):
+        return await execute_query_batch(options)
+    if not isinstance(options, dict):
+        return json_response({'error': 'The request body must be a JSON object or a list of queries'}, 400)
+    if 'queries' in options:
+        return await execute_query_batch(options['queries'])
+    if any(options.get(name) for name in FLASK_QUERY_OPTIONS) or options.get('format') in chatdb.EXPORT_MIMETYPES:
+        return ForwardToFlask(body)
+
+    try:
+        db_type, user_query, analysis, budget_ms = chatdb.validate_query_options(options)
+    except (TypeError, ValueError) as e:
+        return json_response({'error': str(e)}, 400)
+    layout = 'columnar' if options.get('format') == 'columnar' else 'rows'
+    body, status, headers = await run_full_query_async(options, db_type, user_query, analysis, layout, budget_ms)
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+# First page of an executed chat message; limit works as in run_async_mysql
+async def mysql_page_payload(sql, params, limit, running):
+    headers, rows, more = await run_async_mysql(sql, params, limit, running)
+    metrics.inc('chatdb_rows_returned_total', len(rows), db_type='mysql')
+    return {'headers': headers, 'result': rows, 'next_cursor': None, 'truncated': more}
+
+
+async def mongo_page_payload(collection_name, pipeline, limit, running):
+    documents, more = await run_async_mongo(collection_name, pipeline, limit, running)
+    headers, rows = chatdb.align_documents(documents)
+    metrics.inc('chatdb_rows_returned_total', len(rows), db_type='mongodb')
+    return {'headers': headers, 'result': rows, 'next_cursor': None, 'truncated': more}
+
+
+# Same payload as app.execute_chat_message. There are no cursors to page
+# through here: the first page_size rows are returned with truncated=true
+# when more remain.
+async def execute_chat_message_async(db_type, message, options):
+    timings = {}
+    started = time.perf_counter()
+    with stage_timer('chat_translate'):
+        # The catalog may still be loading from the databases on first use
+        text, query, translation_status = await asyncio.to_thread(chatdb.translate_chat_message, db_type, message)
+    timings['translate_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    payload = {'response': text, 'query': query, 'translation_cache': translation_status, 'timings': timings}
+    if query is None:
+        payload['error'] = 'The message did not produce a query to run'
+        return payload, 400
+
+    max_rows = chatdb.row_limits(options)[0]
+    page_size = max(1, min(int(options.get('page_size') or config['RESULT_FETCH_SIZE']), max_rows))
+    try:
+        budget_ms = chatdb.query_budget_ms(options)
+    except (TypeError, ValueError) as e:
+        payload['error'] = str(e)
+        return payload, 400
+    try:
+        running = await admit_query_async(db_type, options.get('query_id'), budget_ms)
+    except ValueError as e:
+        payload['error'] = str(e)
+        return payload, 409
+    payload['query_id'] = running.id
+
+    stage_started = time.perf_counter()
+    try:
+        if db_type == 'mysql':
+            # Every row is read within the request, so the server can enforce the budget too
+            sql = chatdb.with_execution_time_hint(query['sql'], chatdb.analyze_sql_query(query['sql']), budget_ms)
+            result, status = await run_query_task(running, mysql_page_payload(sql, query['params'], page_size, running))
+        else:
+            result, status = await run_query_task(
+                running, mongo_page_payload(query['collection'], query['pipeline'], page_size, running))
+    finally:
+        chatdb.finish_query(running)
+    timings['execute_ms'] = round((time.perf_counter() - stage_started) * 1000, 3)
+    if status != 200:
+        payload.update(result)
+        return payload, status
+    payload['result'] = result
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return payload, 200
+
+
+@instrumented('/api/chat')
+async def chat(request):
+    body, data = await read_json(request)
+    if not isinstance(data, dict) or not data.get('execute'):
+        return ForwardToFlask(body)
+    message = data.get('message')
+    first_word = message.split(' ')[0].lower() if isinstance(message, str) else ''
+    if first_word not in ('sql', 'nosql'):
+        return ForwardToFlask(body)
+
+    db_type = 'mysql' if first_word == 'sql' else 'mongodb'
+    try:
+        payload, status = await execute_chat_message_async(db_type, message[len(first_word) + 1:], data)
+    # Answered with 429 and 503 by their exception handlers
+    except (chatdb.QueryRejectedError, chatdb.PoolTimeoutError):
+        raise
+    except Exception as e:
+        return json_response({'response': f"Internal server error: {str(e)}"}, 500)
+    body, server_timing = chatdb.encode_chat_payload(payload)
+    headers = {'Server-Timing': server_timing}
+    if 'query_id' in payload:
+        headers['X-Query-Id'] = payload['query_id']
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+async def explore_mysql_tables_async(table_names=None):
+    query, params = chatdb.mysql_columns_query(table_names)
+    _, rows, _ = await run_async_mysql(query, params)
+    columns = chatdb.group_mysql_columns(rows)
+    limit = config['EXPLORE_SAMPLE_SIZE']
+    samples = await asyncio.gather(*(run_async_mysql(chatdb.mysql_sample_query(name, limit)) for name in columns))
+    return {
+        name: {'attributes': attributes, 'sample_data': chatdb.format_sample_rows(headers, sample)}
+        for (name, attributes), (headers, sample, _) in zip(columns.items(), samples)
+    }
+
+
+async def explore_mongo_collection_async(db, collection_name, limit):
+    profile = chatdb.MONGO_SCHEMA_PROFILES.get(collection_name)
+    if profile is None:
+        pipeline = [{'$sample': {'size': config['MONGO_SCHEMA_SAMPLE_SIZE']}}]
+        sampled = await db[collection_name].aggregate(pipeline).to_list(None)
+        profile = chatdb.store_sampled_profile(collection_name, sampled)
+        sample_data = sampled[:limit]
+    else:
+        sample_data = await db[collection_name].find().limit(limit).to_list(None)
+    return chatdb.mongo_collection_details(profile, sample_data)
+
+
+async def explore_mongo_collections_async(collection_names):
+    db = get_motor_database()
+    limit = config['EXPLORE_SAMPLE_SIZE']
+    details = await asyncio.gather(*(explore_mongo_collection_async(db, name, limit) for name in collection_names))
+    return dict(zip(collection_names, details))
+
+
+# app.explore_schema on the async drivers, sharing its schema cache
+async def explore_schema_async(db_type):
+    details, missing = chatdb.schema_cache.get(db_type, config['SCHEMA_CACHE_TTL'])
+    cached = details is not None and not missing
+    if details is None:
+        if db_type == 'mysql':
+            details = await explore_mysql_tables_async()
+        else:
+            details = await explore_mongo_collections_async(await get_motor_database().list_collection_names())
+        chatdb.schema_cache.put(db_type, details, names=list(details))
+    elif missing:
+        if db_type == 'mysql':
+            refreshed = await explore_mysql_tables_async(missing)
+        else:
+            existing = set(await get_motor_database().list_collection_names())
+            refreshed = await explore_mongo_collections_async([name for name in missing if name in existing])
+        for name in missing:
+            if name not in refreshed:
+                chatdb.schema_cache.drop(db_type, name)
+        chatdb.schema_cache.put(db_type, refreshed)
+        details.update(refreshed)
+    return details, cached
+
+
+# Like app.explore_engine
+async def explore_engine_async(db_type):
+    started = time.perf_counter()
+    key = 'tables' if db_type == 'mysql' else 'collections'
+    try:
+        details, cached = await explore_schema_async(db_type)
+        result = {'status': 200, key: details, 'cached': cached}
+    except Exception as e:
+        result = {'status': 500, 'error': str(e)}
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+async def explore_engines_async():
+    started = time.perf_counter()
+    results = await asyncio.gather(explore_engine_async('mysql'), explore_engine_async('mongodb'))
+    engines = dict(zip(('mysql', 'mongodb'), results))
+    return {'db_type': 'all', 'engines': engines, 'total_ms': round((time.perf_counter() - started) * 1000, 3)}
+
+
+@instrumented('/api/explore')
+async def explore(request):
+    body, data = await read_json(request)
+    db_type = (data.get('db_type') or '').lower() if isinstance(data, dict) else ''
+    if db_type not in ('mysql', 'mongodb', 'all'):
+        return ForwardToFlask(body)
+    if data.get('refresh'):
+        for name in (('mysql', 'mongodb') if db_type == 'all' else (db_type,)):
+            chatdb.reset_explore_cache(name)
+    if db_type == 'all':
+        return json_response(await explore_engines_async())
+    try:
+        details, cached = await explore_schema_async(db_type)
+    except Exception as e:
+        return json_response({'error': str(e)})
+    key = 'tables' if db_type == 'mysql' else 'collections'
+    return json_response({'db_type': db_type, key: details, 'cached': cached})
+
+
+# Flask-CORS covers the routes served by Flask
+cors = [Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+
+app = Starlette(
+    routes=[
+        Route('/api/execute_query', execute_query, methods=['POST'], middleware=cors),
+        Route('/api/chat', chat, methods=['POST'], middleware=cors),
+        Route('/api/explore', explore, methods=['POST'], middleware=cors),
+        Mount('/', app=flask_app)
+    ],
+    exception_handlers={
+        chatdb.QueryRejectedError: handle_query_rejected,
+        chatdb.PoolTimeoutError: handle_pool_timeout
+    },
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5000)
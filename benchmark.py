@@ -0,0 +1,554 @@
+"""Benchmarks for the upload, query, explore and chat paths of app.py.
+
+The Flask app runs in-process against local stand-ins, so no database
+servers are needed: SQLite plays MySQL (through a small mysql.connector
+compatible wrapper) and mongomock plays MongoDB. Synthetic datasets shaped
+like the samples in uploads/ are generated at the requested sizes, and the
+results are written as JSON so runs can be compared.
+
+    python benchmark.py --rows 10000
+    python benchmark.py --rows 10000,1000000 --output after.json --compare before.json
+
+Numbers from the stand-ins are for comparing changes to app.py against each
+other, not for predicting latency against real MySQL/MongoDB servers.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+
+# SQLite stand-in for mysql.connector
+
+# DESCRIBE-shaped rows for app.fetch_mysql_columns()
+INFORMATION_SCHEMA_QUERY = re.compile(r'\binformation_schema\.COLUMNS\b', re.IGNORECASE)
+# Statements SQLite has no equivalent for and that only tune the MySQL schema
+IGNORED_STATEMENTS = re.compile(r'^\s*(ALTER\s+TABLE|KILL\s+QUERY|SET\s+SESSION)\b', re.IGNORECASE)
+
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.db.cursor()
+        self._rows = None
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def _translate(self, query, params):
+        if params:
+            query = query.replace('%s', '?').replace('%%', '%')
+        return query
+
+    def execute(self, query, params=None):
+        self._rows = None
+        self.description = None
+        if IGNORED_STATEMENTS.match(query):
+            return
+        if re.match(r'^\s*LOAD\s+DATA', query, re.IGNORECASE):
+            raise mysql.connector.errors.NotSupportedError(msg='LOAD DATA is not supported by the SQLite stand-in')
+        if re.match(r'^\s*SHOW\s+TABLES', query, re.IGNORECASE):
+            query = "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        elif INFORMATION_SCHEMA_QUERY.search(query):
+            self._describe_tables(params)
+            return
+        try:
+            self._cursor.execute(self._translate(query, params), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise mysql.connector.errors.DatabaseError(msg=str(e))
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        if self._cursor.description:
+            self.description = [(column[0], None, None, None, None, None, True) for column in self._cursor.description]
+
+    def _describe_tables(self, table_names):
+        db = self.connection.db
+        if not table_names:
+            table_names = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+        rows = []
+        for table_name in sorted(table_names):
+            for _, name, column_type, notnull, default, pk in db.execute(f'PRAGMA table_info("{table_name}")'):
+                column_type = (column_type or 'text').lower()
+                rows.append((table_name, name, column_type, 'NO' if notnull else 'YES', 'PRI' if pk else '', default, ''))
+        self._rows = rows
+        self.description = [(name, None, None, None, None, None, True) for name in
+                            ('TABLE_NAME', 'COLUMN_NAME', 'COLUMN_TYPE', 'IS_NULLABLE', 'COLUMN_KEY', 'COLUMN_DEFAULT', 'EXTRA')]
+
+    def executemany(self, query, seq_params):
+        try:
+            self._cursor.executemany(self._translate(query, True), [tuple(params) for params in seq_params])
+        except sqlite3.Error as e:
+            raise mysql.connector.errors.DatabaseError(msg=str(e))
+        self.rowcount = self._cursor.rowcount
+
+    def fetchmany(self, size=1):
+        if self._rows is not None:
+            batch, self._rows = self._rows[:size], self._rows[size:]
+            return batch
+        return self._cursor.fetchmany(size)
+
+    def fetchone(self):
+        batch = self.fetchmany(1)
+        return batch[0] if batch else None
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    _ids = iter(range(1, 1 << 30))
+
+    def __init__(self, path, **options):
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self.connection_id = next(self._ids)
+        self.db.create_function('DATABASE', 0, lambda: 'chatdb')
+        self.db.create_function('CONNECTION_ID', 0, lambda: self.connection_id)
+        self._open = True
+
+    def cursor(self, *args, **kwargs):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    @property
+    def in_transaction(self):
+        return self.db.in_transaction
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if not self._open:
+            raise mysql.connector.errors.InterfaceError(msg='Connection is closed')
+
+    def is_connected(self):
+        return self._open
+
+    def close(self):
+        self._open = False
+        self.db.close()
+
+
+# Point app.py at the stand-ins; must run before the first request
+def install_stand_ins(app_module, workdir):
+    import mongomock
+
+    db_path = os.path.join(workdir, 'chatdb.sqlite')
+    with sqlite3.connect(db_path) as db:
+        # WAL lets readers run while an upload writes
+        db.execute('PRAGMA journal_mode=WAL')
+    mysql.connector.connect = lambda **options: SQLiteConnection(db_path, **options)
+    mongo_client = mongomock.MongoClient()
+    app_module.MongoClient = lambda *args, **kwargs: mongo_client
+    app_module.app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.makedirs(app_module.app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+
+# Synthetic datasets shaped like the samples in uploads/
+
+FIRST_NAMES = ['John', 'Jane', 'Alice', 'Bob', 'Carol', 'David', 'Eve', 'Frank', 'Grace', 'Heidi']
+LAST_NAMES = ['Doe', 'Smith', 'Brown', 'Johnson', 'Lee', 'Garcia', 'Martin', 'Clark', 'Lewis', 'Walker']
+MAJORS = ['Computer Science', 'Business', 'Mathematics', 'Physics', 'Biology', 'History', 'Economics']
+INSTRUCTORS = ['Dr. Brown', 'Dr. Smith', 'Dr. Lee', 'Dr. Garcia', 'Dr. Clark', 'Dr. Martin']
+COURSE_WORDS = ['Data', 'Structures', 'Calculus', 'Algebra', 'Systems', 'Networks', 'Databases', 'Statistics']
+SEMESTERS = ['Fall 2022', 'Spring 2023', 'Fall 2023', 'Spring 2024', 'Fall 2024']
+GRADES = ['A', 'B', 'C', 'D', 'F']
+BRANDS = ['BrandX', 'BrandY', 'BrandZ', 'Acme', 'Globex', 'Initech']
+CATEGORIES = ['Electronics', 'Mobile Phones', 'Wearables', 'Home', 'Books', 'Toys']
+STATUSES = ['pending', 'shipped', 'delivered', 'cancelled']
+CITIES = [('New York', 'USA'), ('Los Angeles', 'USA'), ('London', 'UK'), ('Toronto', 'Canada'), ('Berlin', 'Germany')]
+REVIEW_WORDS = ['great', 'good', 'okay', 'bad', 'pricey', 'sound', 'quality', 'fast', 'shipping', 'love']
+
+
+def object_id(prefix, number):
+    return f"{prefix:08x}{number:016x}"
+
+
+def timestamp(rng):
+    return (datetime(2023, 1, 1) + timedelta(seconds=rng.randrange(365 * 24 * 3600))).isoformat() + 'Z'
+
+
+def course_rows(rng, rows):
+    for i in range(rows):
+        instructor = rng.randrange(len(INSTRUCTORS))
+        yield [100 + i, f"{rng.choice(COURSE_WORDS)} {rng.choice(COURSE_WORDS)} {i}", instructor + 1,
+               INSTRUCTORS[instructor], rng.randint(1, 5)]
+
+
+def student_rows(rng, rows):
+    for i in range(rows):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        advisor = rng.randrange(len(INSTRUCTORS))
+        yield [i + 1, first, last, f"{first.lower()}.{last.lower()}{i}@example.com", rng.choice(MAJORS),
+               advisor + 1, INSTRUCTORS[advisor]]
+
+
+def enrollment_rows(rng, rows):
+    for i in range(rows):
+        yield [i + 1, rng.randint(1, rows), 100 + rng.randrange(rows), rng.choice(SEMESTERS), rng.choice(GRADES)]
+
+
+def product_documents(rng, rows):
+    for i in range(rows):
+        yield {
+            '_id': object_id(0x22, i), 'name': f"{rng.choice(BRANDS)} product {i}",
+            'description': ' '.join(rng.choice(REVIEW_WORDS) for _ in range(8)),
+            'category': rng.choice(CATEGORIES), 'price': round(rng.uniform(5, 1500), 2),
+            'stock': rng.randint(0, 500), 'brand': rng.choice(BRANDS), 'createdAt': timestamp(rng),
+            'ratings': [{'userId': object_id(0x11, rng.randrange(rows)), 'rating': rng.randint(1, 5)}
+                        for _ in range(rng.randint(0, 3))]
+        }
+
+
+def order_documents(rng, rows):
+    for i in range(rows):
+        items = [{'productId': object_id(0x22, rng.randrange(rows)), 'quantity': rng.randint(1, 4),
+                  'price': round(rng.uniform(5, 500), 2)} for _ in range(rng.randint(1, 4))]
+        city, country = rng.choice(CITIES)
+        yield {
+            '_id': object_id(0x101, i), 'userId': object_id(0x11, rng.randrange(rows)), 'items': items,
+            'totalAmount': round(sum(item['price'] * item['quantity'] for item in items), 2),
+            'orderDate': timestamp(rng), 'status': rng.choice(STATUSES),
+            'shippingAddress': {'city': city, 'country': country}, 'itemCount': len(items)
+        }
+
+
+def review_documents(rng, rows):
+    for i in range(rows):
+        yield {
+            '_id': object_id(0x55, i), 'userId': object_id(0x11, rng.randrange(rows)),
+            'productId': object_id(0x22, rng.randrange(rows)), 'rating': rng.randint(1, 5),
+            'review': ' '.join(rng.choice(REVIEW_WORDS) for _ in range(6)), 'createdAt': timestamp(rng)
+        }
+
+
+# name -> (file extension, header or None, row generator)
+DATASETS = {
+    'courses': ('csv', ['CourseID', 'CourseName', 'InstructorID', 'InstructorName', 'CreditHours'], course_rows),
+    'students': ('csv', ['StudentID', 'FirstName', 'LastName', 'Email', 'Major', 'AdvisorID', 'AdvisorName'], student_rows),
+    'enrollments': ('csv', ['EnrollmentID', 'StudentID', 'CourseID', 'Semester', 'Grade'], enrollment_rows),
+    'products': ('ndjson', None, product_documents),
+    'orders': ('ndjson', None, order_documents),
+    'reviews': ('ndjson', None, review_documents),
+}
+
+
+# Write a dataset to disk row by row, so 10M-row files never sit in memory
+def generate_dataset(name, rows, directory, seed):
+    extension, header, generator = DATASETS[name]
+    path = os.path.join(directory, f"{name}.{extension}")
+    rng = random.Random(f"{seed}:{name}")
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        if extension == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(generator(rng, rows))
+        else:
+            for document in generator(rng, rows):
+                file.write(json.dumps(document) + '\n')
+    return path
+
+
+# Measurements
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': round(at(0.50) * 1000, 3),
+        'p90_ms': round(at(0.90) * 1000, 3),
+        'p99_ms': round(at(0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def timed_request(send):
+    started = time.perf_counter()
+    response = send()
+    data = response.get_data()
+    return time.perf_counter() - started, response, data
+
+
+def benchmark_uploads(client, files):
+    results = {}
+    for name, path in files.items():
+        with open(path, 'rb') as file:
+            elapsed, response, data = timed_request(lambda: client.post(
+                '/api/upload', data={'file': (file, os.path.basename(path)), 'async': 'false'}))
+        if response.status_code != 200:
+            raise RuntimeError(f"Upload of {name} failed: {data[:500]!r}")
+        load_stats = json.loads(data)['load_stats'] or {}
+        results[name] = {
+            'rows': load_stats.get('rows_loaded'),
+            'rows_failed': load_stats.get('rows_failed'),
+            'method': load_stats.get('method'),
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(load_stats.get('rows_loaded', 0) / elapsed, 1) if elapsed else 0.0,
+            'bytes_per_sec': round(os.path.getsize(path) / elapsed, 1) if elapsed else 0.0
+        }
+    return results
+
+
+SQL_QUERIES = {
+    'point_lookup': "SELECT * FROM students WHERE StudentID = 42",
+    'range_filter': "SELECT * FROM courses WHERE CreditHours > 3 LIMIT 100",
+    'group_by': "SELECT Major, COUNT(*) AS students FROM students GROUP BY Major",
+    'aggregate_join': ("SELECT c.InstructorName, COUNT(*) AS enrollments FROM enrollments e "
+                       "JOIN courses c ON e.CourseID = c.CourseID GROUP BY c.InstructorName"),
+    'scan_1000': "SELECT * FROM enrollments LIMIT 1000"
+}
+
+MONGO_QUERIES = {
+    'match_sort_limit': {'collection': 'products', 'query': {'price': {'$gt': 100}}, 'sort': {'price': -1}, 'limit': 100},
+    'group_by': {'collection': 'orders', 'group': {'_id': '$status', 'total': {'$sum': '$totalAmount'}}},
+    'unwind_limit': {'collection': 'orders', 'unwind': '$items', 'limit': 1000},
+    'match_equality': {'collection': 'reviews', 'query': {'rating': 5}, 'limit': 1000}
+}
+
+
+def benchmark_queries(client, iterations, datasets):
+    results = {}
+    queries = [('mysql', name, query) for name, query in SQL_QUERIES.items()]
+    queries += [('mongodb', name, json.dumps(query)) for name, query in MONGO_QUERIES.items()]
+    for db_type, name, query in queries:
+        tables = set(re.findall(r'\b(?:FROM|JOIN)\s+(\w+)', query)) if db_type == 'mysql' else {json.loads(query)['collection']}
+        if not tables <= set(datasets):
+            continue
+        samples = []
+        rows = None
+        for _ in range(iterations):
+            elapsed, response, data = timed_request(lambda: client.post(
+                '/api/execute_query', json={'db_type': db_type, 'query': query, 'cache': False}))
+            if response.status_code != 200:
+                raise RuntimeError(f"{db_type} query {name} failed: {data[:500]!r}")
+            samples.append(elapsed)
+            rows = len(json.loads(data).get('result', []))
+        result = percentiles(samples)
+        result['rows'] = rows
+        result['response_bytes'] = len(data)
+        # Repeat traffic answered from the result cache
+        client.post('/api/execute_query', json={'db_type': db_type, 'query': query})
+        cached = [timed_request(lambda: client.post('/api/execute_query', json={'db_type': db_type, 'query': query}))[0]
+                  for _ in range(iterations)]
+        result['cached_p50_ms'] = percentiles(cached)['p50_ms']
+        results[f"{db_type}.{name}"] = result
+    return results
+
+
+def benchmark_explore(client, iterations):
+    results = {}
+    for db_type in ('mysql', 'mongodb'):
+        cold = [timed_request(lambda: client.post('/api/explore', json={'db_type': db_type, 'refresh': True}))[0]
+                for _ in range(iterations)]
+        warm = [timed_request(lambda: client.post('/api/explore', json={'db_type': db_type}))[0]
+                for _ in range(iterations)]
+        results[db_type] = {'cold': percentiles(cold), 'warm': percentiles(warm)}
+    return results
+
+
+# (dataset the message needs, message)
+CHAT_MESSAGES = [
+    ('courses', "sql average credithours by instructorname in courses"),
+    ('courses', "sql top 10 courses by credithours"),
+    ('courses', "sql find credithours greater than 3 in courses"),
+    ('students', "sql count students by major in students"),
+    ('students', "sql find students where major is business"),
+    ('products', "nosql show total price by brand in products"),
+    ('products', "nosql find price greater than 500 in products"),
+    ('orders', "nosql count of status in orders"),
+    ('reviews', "nosql list all reviews sorted by rating in reviews"),
+]
+
+
+def benchmark_chat(client, iterations, datasets):
+    messages = [message for dataset, message in CHAT_MESSAGES if dataset in datasets]
+    if not messages:
+        return None
+    results = {}
+    for execute in (False, True):
+        samples = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for message in messages:
+                elapsed, response, data = timed_request(lambda: client.post(
+                    '/api/chat', json={'message': message, 'execute': execute, 'page_size': 100}))
+                if response.status_code != 200:
+                    raise RuntimeError(f"Chat message {message!r} failed: {data[:500]!r}")
+                samples.append(elapsed)
+        total = time.perf_counter() - started
+        result = percentiles(samples)
+        result['messages_per_sec'] = round(len(samples) / total, 1) if total else 0.0
+        results['translate_and_execute' if execute else 'translate'] = result
+    return results
+
+
+def benchmark_concurrent_queries(client_factory, threads, iterations, datasets):
+    if 'students' not in datasets:
+        return None
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        client = client_factory()
+        local = []
+        for i in range(iterations):
+            query = f"SELECT * FROM students WHERE StudentID = {i + 1}"
+            local.append(timed_request(lambda: client.post(
+                '/api/execute_query', json={'db_type': 'mysql', 'query': query, 'cache': False}))[0])
+        with lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    total = time.perf_counter() - started
+    result = percentiles(samples)
+    result['threads'] = threads
+    result['queries_per_sec'] = round(len(samples) / total, 1) if total else 0.0
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(rows, datasets, iterations, chat_iterations, threads, seed):
+    workdir = tempfile.mkdtemp(prefix=f"chatdb-bench-{rows}-")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # Each size gets a fresh app module so pools and caches start empty
+    sys.modules.pop('app', None)
+    import app as app_module
+    install_stand_ins(app_module, workdir)
+    client = app_module.app.test_client()
+
+    print(f"[{rows} rows] generating {', '.join(datasets)}")
+    started = time.perf_counter()
+    files = {name: generate_dataset(name, rows, workdir, seed) for name in datasets}
+    generate_seconds = round(time.perf_counter() - started, 3)
+
+    print(f"[{rows} rows] uploading")
+    results = {'rows': rows, 'generate_seconds': generate_seconds}
+    results['upload'] = benchmark_uploads(client, files)
+    print(f"[{rows} rows] querying")
+    results['execute_query'] = benchmark_queries(client, iterations, datasets)
+    results['execute_query_concurrent'] = benchmark_concurrent_queries(
+        app_module.app.test_client, threads, iterations, datasets)
+    print(f"[{rows} rows] exploring")
+    results['explore'] = benchmark_explore(client, max(1, iterations // 10))
+    print(f"[{rows} rows] chatting")
+    results['chat'] = benchmark_chat(client, chat_iterations, datasets)
+    results['metrics'] = client.get('/api/stats').get_json()
+    return results
+
+
+# Numeric leaves of a results document, keyed by their dotted path
+def flatten_results(document, prefix=''):
+    if isinstance(document, dict):
+        for key, value in document.items():
+            yield from flatten_results(value, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(document, (int, float)) and not isinstance(document, bool):
+        yield prefix, document
+
+
+def compare_results(baseline, current):
+    before = dict(flatten_results(baseline.get('runs', {})))
+    after = dict(flatten_results(current.get('runs', {})))
+    lines = []
+    for key in sorted(before.keys() & after.keys()):
+        if not re.search(r'(_ms|_per_sec|seconds)$', key) or key.startswith('metrics') or '.metrics.' in key:
+            continue
+        old, new = before[key], after[key]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+        lines.append(f"{key:<70} {old:>14} {new:>14} {change:>9}")
+    if not lines:
+        return 'No metrics in common with the baseline (were the same --rows used?)'
+    return '\n'.join([f"{'metric':<70} {'baseline':>14} {'current':>14} {'change':>9}"] + lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ChatDB against SQLite and mongomock stand-ins.')
+    parser.add_argument('--rows', default='10000',
+                        help='Comma-separated dataset sizes, e.g. 10000,1000000,10000000 (default: 10000)')
+    parser.add_argument('--datasets', default=','.join(DATASETS),
+                        help=f"Comma-separated datasets to generate (default: {','.join(DATASETS)})")
+    parser.add_argument('--iterations', type=int, default=50, help='Requests per query for latency percentiles')
+    parser.add_argument('--chat-iterations', type=int, default=20, help='Passes over the chat message set')
+    parser.add_argument('--threads', type=int, default=4, help='Client threads for the concurrent query run')
+    parser.add_argument('--seed', type=int, default=551, help='Random seed for the synthetic data')
+    parser.add_argument('--output', help='Results file (default: benchmark-<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier results file to print the differences against')
+    args = parser.parse_args(argv)
+
+    datasets = [name.strip() for name in args.datasets.split(',') if name.strip()]
+    unknown = set(datasets) - set(DATASETS)
+    if unknown:
+        parser.error(f"Unknown datasets: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.rows.split(',')]
+
+    document = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat() + 'Z',
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'stand_ins': {'mysql': f"sqlite {sqlite3.sqlite_version}", 'mongodb': 'mongomock'},
+            'iterations': args.iterations,
+            'chat_iterations': args.chat_iterations,
+            'threads': args.threads,
+            'seed': args.seed
+        },
+        'runs': {}
+    }
+    for rows in sizes:
+        document['runs'][str(rows)] = run_benchmarks(rows, datasets, args.iterations, args.chat_iterations,
+                                                     args.threads, args.seed)
+
+    output = args.output or f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as file:
+        json.dump(document, file, indent=2, default=str)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            print(compare_results(json.load(file), document))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as chatdb
+
+
+# Chat against the built-in sample schema, so no database has to be reachable
+@pytest.fixture
+def static_catalog():
+    catalog = chatdb.Catalog()
+    for db_type in chatdb.CATALOG_BUILDERS:
+        catalog._publish(db_type, chatdb.static_catalog(db_type))
+    catalog.loaded_at = time.monotonic()
+    saved = chatdb.catalog
+    chatdb.catalog = catalog
+    chatdb.translation_cache.clear()
+    yield catalog
+    chatdb.catalog = saved
+    chatdb.translation_cache.clear()
@@ -0,0 +1,35 @@
+import app as chatdb
+
+
+def optimize(pipeline):
+    return chatdb.optimize_mongo_pipeline(pipeline)
+
+
+def test_match_moves_ahead_of_lookup_and_unwind():
+    lookup = {'$lookup': {'from': 'users', 'localField': 'userId', 'foreignField': 'userId', 'as': 'user'}}
+    pipeline, rewrites = optimize([lookup, {'$unwind': '$user'}, {'$match': {'status': 'shipped'}}])
+    assert pipeline == [{'$match': {'status': 'shipped'}}, lookup, {'$unwind': '$user'}]
+    assert rewrites == ['Moved $match on status ahead of $lookup, $unwind']
+
+
+def test_match_on_joined_field_stays_behind_the_lookup():
+    lookup = {'$lookup': {'from': 'users', 'localField': 'userId', 'foreignField': 'userId', 'as': 'user'}}
+    pipeline, _ = optimize([lookup, {'$match': {'status': 'shipped', 'user.city': 'Paris'}}])
+    assert pipeline == [{'$match': {'status': 'shipped'}}, lookup, {'$match': {'user.city': 'Paris'}}]
+
+
+def test_match_does_not_pass_a_group():
+    pipeline = [{'$group': {'_id': '$status', 'n': {'$sum': 1}}}, {'$match': {'n': {'$gt': 2}}}]
+    assert optimize(pipeline) == (pipeline, [])
+
+
+def test_sort_skip_limit_becomes_a_top_k_sort_ahead_of_lookup():
+    lookup = {'$lookup': {'from': 'users', 'localField': 'userId', 'foreignField': 'userId', 'as': 'user'}}
+    pipeline, rewrites = optimize([lookup, {'$sort': {'total': -1}}, {'$skip': 5}, {'$limit': 10}])
+    assert pipeline == [{'$sort': {'total': -1}}, {'$limit': 15}, {'$skip': 5}, lookup]
+    assert rewrites == ['Merged $sort and $limit into a top-15 sort', 'Moved the top-15 sort ahead of $lookup']
+
+
+def test_top_k_sort_stays_behind_a_projection_that_drops_its_key():
+    pipeline = [{'$project': {'name': 1}}, {'$sort': {'total': -1}}, {'$limit': 3}]
+    assert optimize(pipeline)[0] == pipeline
@@ -0,0 +1,30 @@
+import app as chatdb
+
+
+# A MongoDB-style result whose third document brings a new key
+def growing_result():
+    headers = ['_id', 'a']
+
+    def rows():
+        yield [0, 0]
+        yield [1, 1]
+        headers.append('late')
+        yield [2, 2, 20]
+        yield [3, 3, 30]
+
+    return chatdb.QueryResult('mongodb', headers, rows(), None)
+
+
+def test_page_pads_rows_read_before_a_new_key():
+    page = chatdb.page_query_result(growing_result(), 4, 10)
+    assert page['headers'] == ['_id', 'a', 'late']
+    assert page['result'] == [[0, 0, None], [1, 1, None], [2, 2, 20], [3, 3, 30]]
+
+
+def test_later_page_extends_the_headers():
+    result = growing_result()
+    first = chatdb.page_query_result(result, 1, 10)
+    assert first['headers'] == ['_id', 'a'] and first['result'] == [[0, 0]]
+    second = chatdb.page_query_result(result, 3, 10)
+    assert second['headers'] == ['_id', 'a', 'late']
+    assert second['result'] == [[1, 1, None], [2, 2, 20], [3, 3, 30]]
@@ -0,0 +1,65 @@
+import app as chatdb
+
+
+def translate(message, db_type='mysql'):
+    return chatdb.translate_chat_message(db_type, message)
+
+
+def test_canonicalize_replaces_literals_in_order():
+    canonical, literals = chatdb.canonicalize_message("Find Grade between 50 and 60.5 where Semester is 'Fall 2024'")
+    assert canonical == "find grade between ? and ?.? where semester is '?'"
+    assert literals == ['50', '60.5', 'Fall 2024']
+
+
+def test_fill_template_binds_literals_by_position():
+    template = chatdb.compile_query_template("x BETWEEN \x00number:50\x00 AND \x00number:60\x00", ['50', '60'])
+    assert chatdb.fill_query_template(template, ['60', '50']) == 'x BETWEEN 60 AND 50'
+    assert chatdb.bind_query_template(template, ['7', '8']) == ('x BETWEEN %s AND %s', [7, 8])
+
+
+def test_template_with_repeated_literal_is_not_compiled():
+    assert chatdb.compile_query_template("x BETWEEN \x00number:50\x00 AND \x00number:50\x00", ['50', '50']) is None
+    assert chatdb.compile_query_structure(chatdb.MessageLiteral('5', 'number'), ['5', '5']) is None
+
+
+def test_reordered_literals_hit_the_cache(static_catalog):
+    _, query, status = translate('find Grade between 50 and 60 in enrollments')
+    assert status == 'MISS' and query['params'] == [50, 60]
+    _, query, status = translate('find Grade between 70 and 55 in enrollments')
+    assert status == 'HIT' and query['params'] == [70, 55]
+
+
+def test_repeated_literals_are_not_cached(static_catalog):
+    _, query, status = translate('find Grade between 50 and 50 in enrollments')
+    assert status is None and query['params'] == [50, 50]
+    _, query, status = translate('find Grade between 50 and 60 in enrollments')
+    assert status == 'MISS' and query['params'] == [50, 60]
+    _, query, status = translate('find Grade between 60 and 60 in enrollments')
+    assert status == 'HIT' and query['params'] == [60, 60]
+
+
+def test_values_keep_their_case(static_catalog):
+    _, query, _ = translate('find enrollments where Semester is Fall')
+    assert query['params'] == ['Fall']
+    _, query, _ = translate("find enrollments where CourseID contains 'CS'")
+    assert query['params'] == ['%CS%']
+    _, query, status = translate("find enrollments where CourseID contains 'Ma'")
+    assert status == 'HIT' and query['params'] == ['%Ma%']
+
+
+def test_slots_come_from_the_message(static_catalog):
+    text, query, _ = translate('total CreditHours by InstructorName in courses')
+    assert text == ('SELECT InstructorName, SUM(CreditHours) AS total_CreditHours '
+                    'FROM courses GROUP BY InstructorName;')
+    _, query, _ = translate('top 3 enrollments by Grade')
+    assert query == {'sql': 'SELECT * FROM enrollments ORDER BY Grade DESC LIMIT %s;', 'params': [3]}
+
+
+def test_row_count_must_be_whole(static_catalog):
+    _, query, _ = translate('top 5.5 enrollments by Grade')
+    assert query is None
+
+
+def test_unknown_column_is_reported(static_catalog):
+    text, query, _ = translate('find Foo greater than 3 in enrollments')
+    assert query is None and text.startswith("Unknown column 'Foo' in enrollments.")
@@ -0,0 +1,110 @@
+import io
+
+import pandas as pd
+import pytest
+
+import app as chatdb
+
+
+def parse(text, read_size=4, max_document_size=1000):
+    return list(chatdb.iter_json_documents(io.StringIO(text), read_size, max_document_size))
+
+
+def test_parses_arrays_and_ndjson_across_reads():
+    assert parse('[1, {"a": [1, 2, {"b": "}"}]}, {"c": 2.5} ]') == [1, {'a': [1, 2, {'b': '}'}]}, {'c': 2.5}]
+    assert parse('{"a": 1}\n{"a": 2}\n\n{"a": 3}\n') == [{'a': 1}, {'a': 2}, {'a': 3}]
+
+
+def test_invalid_json_reports_its_offset():
+    with pytest.raises(ValueError, match='character 15'):
+        parse('{"a": 1}\n{"a": x}')
+
+
+def test_unterminated_document_stops_at_the_size_limit():
+    documents = chatdb.iter_json_documents(io.StringIO('{"a": 1}\n{"a": "' + 'y' * 100000), 16, 1000)
+    assert next(documents) == {'a': 1}
+    with pytest.raises(ValueError, match='character 9 is still incomplete after 1000 characters'):
+        next(documents)
+
+
+def column_stats(*values):
+    return chatdb.column_stats(pd.Series(values))
+
+
+def test_dates_with_time_zones_are_flagged():
+    assert column_stats('2023-01-15T10:30:00Z', '2023-01-16T08:00:00+05:00').time_zone
+    assert not column_stats('2023-01-15 10:30:00', '2023-01-16').time_zone
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+
+    def execute(self, statement, params=None):
+        self.connection.statements.append(statement)
+        self.rowcount = 2 if statement.startswith('LOAD DATA') else -1
+
+    def fetchone(self):
+        return self.connection.warning
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, warning=None):
+        self.warning = warning
+        self.statements = []
+        self.committed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+
+def test_load_data_warnings_are_not_committed(tmp_path):
+    path = tmp_path / 'dates.csv'
+    path.write_text('id,at\n1,2023-01-15\n2,not a date\n')
+    stats = chatdb.new_load_stats('load_data')
+    conn = FakeConnection(('Warning', 1265, "Data truncated for column 'at' at row 2"))
+    with pytest.raises(chatdb.LoadDataWarning, match="column 'at'"):
+        chatdb.load_csv_with_load_data(conn, str(path), 'dates', ['id', 'at'], stats)
+    assert not conn.committed and stats['rows_loaded'] == 0
+
+    conn = FakeConnection()
+    chatdb.load_csv_with_load_data(conn, str(path), 'dates', ['id', 'at'], stats)
+    assert conn.committed and stats['rows_loaded'] == 2
+
+
+def profile(*chunks):
+    stats = chatdb.ColumnStats()
+    for chunk in chunks:
+        stats.add(pd.Series(chunk))
+    return stats.sql_type()
+
+
+def test_integer_columns_get_the_smallest_type_that_fits():
+    assert profile([1, 2, 3]) == 'TINYINT'
+    assert profile([-128, 127]) == 'TINYINT'
+    assert profile([128]) == 'SMALLINT'
+    assert profile([-5, 70000]) == 'MEDIUMINT'
+    assert profile([2 ** 40]) == 'BIGINT'
+    assert profile([1e20, 2.0]) == 'DECIMAL(21, 0)'
+
+
+def test_whole_floats_and_nulls_stay_integers():
+    assert profile([1.0, 2.0, None]) == 'TINYINT'
+
+
+def test_decimal_columns_keep_every_digit():
+    assert profile([1.5, 2.25]) == 'DECIMAL(3, 2)'
+    assert profile([-123.4, 0.001]) == 'DECIMAL(6, 3)'
+    assert profile([1e-20, 2.5]) == 'DOUBLE'
+
+
+def test_integer_digits_survive_widening_to_decimal():
+    assert profile([12345, 7], [1.5]) == 'DECIMAL(6, 1)'
+    assert profile([1.5], [12345]) == 'DECIMAL(6, 1)'